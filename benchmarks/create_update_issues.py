@@ -0,0 +1,58 @@
+"""
+Benchmark `create_update_issues`: wall time and number of SQL statements for an initial sync, an unchanged re-sync
+and a re-sync where a share of the issues changed.
+
+Usage: python -m benchmarks.create_update_issues --issues 10000
+"""
+
+from __future__ import annotations
+import time
+
+import click
+from sqlalchemy import insert, select
+
+from benchmarks.utils import benchmark_database, change_issues, count_statements, synthetic_issues
+from qe_metrics.libs.database_mapping import ProductsEntity
+from qe_metrics.utils.issue_utils import create_update_issues
+
+
+@click.command()
+@click.option("--issues", default=10000, show_default=True, help="Number of synthetic Jira issues.")
+@click.option("--changed-ratio", default=0.1, show_default=True, help="Share of the issues changed before the re-sync.")
+@click.option(
+    "--config-file",
+    default=None,
+    help="qe-metrics config file of the database to benchmark against. Defaults to a temporary SQLite database.",
+    type=click.Path(exists=True),
+)
+def main(issues: int, changed_ratio: float, config_file: str | None) -> None:
+    jira_issues = synthetic_issues(count=issues)
+    with benchmark_database(config_file=config_file) as db, db.session() as db_session:
+        product_name = f"benchmark-product-{time.time_ns()}"
+        db_session.execute(statement=insert(ProductsEntity).values(name=product_name))
+        product = db_session.execute(select(ProductsEntity).where(ProductsEntity.name == product_name)).scalar_one()
+
+        for run_name, prepare in (
+            ("initial sync", None),
+            ("unchanged re-sync", None),
+            (f"re-sync, {changed_ratio:.0%} changed", lambda: change_issues(issues=jira_issues, ratio=changed_ratio)),
+        ):
+            if prepare:
+                prepare()
+
+            with count_statements(engine=db.engine) as statements:
+                start = time.perf_counter()
+                create_update_issues(
+                    issues=jira_issues,
+                    product=product,
+                    severity="blocker",
+                    jira_server="https://jira.example.com",
+                    db_session=db_session,
+                )
+                elapsed = time.perf_counter() - start
+
+            click.echo(f"{run_name:<30} {issues:>8} issues {statements.count:>6} statements {elapsed:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
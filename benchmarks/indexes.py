@@ -0,0 +1,152 @@
+"""
+Benchmark the hot lookup paths of the jiraissues table without and with its indexes, on a seeded table: the issue
+lookup of `create_update_issues`, `mark_obsolete_issues`, the retention DELETE of `delete_old_issues` and a Grafana-like
+aggregation. Writes are rolled back.
+
+Usage: python -m benchmarks.indexes --rows 1000000
+
+The jiraissues indexes are dropped before seeding; when `--config-file` is given, it must point to a scratch database.
+"""
+
+from __future__ import annotations
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, cast
+
+import click
+from sqlalchemy import Table, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from benchmarks.utils import ISSUE_TYPES, STATUSES, benchmark_database
+from qe_metrics.libs.database_mapping import Base, JiraIssuesEntity, ProductsEntity
+from qe_metrics.utils.general import chunked
+from qe_metrics.utils.issue_utils import CHUNK_SIZE, get_existing_issues, mark_obsolete_issues
+from qe_metrics.utils.migration_utils import create_missing_indexes
+
+SEVERITIES = ["blocker", "critical-blocker"]
+
+
+def seeded_rows(count: int, product_ids: List[int], seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Generate jiraissues rows spread over products and severities, updated during the last 95 days, so the retention
+    DELETE removes a few of them.
+
+    Args:
+        count (int): Number of rows
+        product_ids (List[int]): IDs of the products the rows belong to
+        seed (int): Seed of the random generator
+
+    Yields:
+        Dict[str, Any]: JiraIssuesEntity column values
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    for index in range(count):
+        last_updated = today - timedelta(days=rng.randint(0, 95))
+        yield {
+            "product_id": product_ids[index % len(product_ids)],
+            "issue_key": f"BENCH-{index}",
+            "title": f"Synthetic issue BENCH-{index}",
+            "url": f"https://jira.example.com/browse/BENCH-{index}",
+            "project": "BENCH",
+            "severity": SEVERITIES[(index // len(product_ids)) % len(SEVERITIES)],
+            "status": rng.choice(STATUSES),
+            "issue_type": rng.choice(ISSUE_TYPES).lower(),
+            "customer_escaped": rng.random() < 0.1,
+            "date_created": last_updated - timedelta(days=rng.randint(0, 30)),
+            "last_updated": last_updated,
+        }
+
+
+def timed(db_session: Session, operation: Callable[[], Any]) -> float:
+    """
+    Run a database operation and roll it back.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        operation (Callable[[], Any]): Operation to time
+
+    Returns:
+        float: Wall time of the operation, in seconds
+    """
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    db_session.rollback()
+    return elapsed
+
+
+@click.command()
+@click.option("--rows", default=1000000, show_default=True, help="Number of seeded jiraissues rows.")
+@click.option("--products", default=50, show_default=True, help="Number of products the rows are spread over.")
+@click.option(
+    "--config-file",
+    default=None,
+    help="qe-metrics config file of a scratch database to benchmark against. Defaults to a temporary SQLite database.",
+    type=click.Path(exists=True),
+)
+def main(rows: int, products: int, config_file: str | None) -> None:
+    with benchmark_database(config_file=config_file) as db, db.session() as db_session:
+        for index in Base.metadata.tables[JiraIssuesEntity.__tablename__].indexes:
+            index.drop(bind=db.engine, checkfirst=True)
+
+        run_id = time.time_ns()
+        product_ids = list(
+            db_session.scalars(
+                insert(ProductsEntity).returning(ProductsEntity.id),
+                [{"name": f"benchmark-product-{run_id}-{index}"} for index in range(products)],
+            )
+        )
+        start = time.perf_counter()
+        for rows_chunk in chunked(iterable=seeded_rows(count=rows, product_ids=product_ids), size=CHUNK_SIZE * 10):
+            db_session.execute(insert(JiraIssuesEntity), rows_chunk)
+        db_session.commit()
+        click.echo(f"Seeded {rows} rows in {time.perf_counter() - start:.1f}s")
+
+        product = db_session.get(ProductsEntity, product_ids[0])
+        assert product is not None
+        issue_keys = list(
+            db_session.scalars(
+                select(JiraIssuesEntity.issue_key)
+                .where(JiraIssuesEntity.product_id == product.id, JiraIssuesEntity.severity == SEVERITIES[0])
+                .limit(CHUNK_SIZE)
+            )
+        )
+        operations: Dict[str, Callable[[], Any]] = {
+            "issue lookup": lambda: get_existing_issues(
+                issue_keys=issue_keys, product_id=product.id, severity=SEVERITIES[0], db_session=db_session
+            ),
+            "mark obsolete": lambda: mark_obsolete_issues(
+                current_issue_keys=set(issue_keys), product=product, severity=SEVERITIES[0], db_session=db_session
+            ),
+            "retention delete": lambda: db_session.execute(
+                statement=delete(JiraIssuesEntity).where(
+                    JiraIssuesEntity.last_updated < date.today() - timedelta(days=90)
+                )
+            ),
+            "status breakdown": lambda: db_session.execute(
+                select(JiraIssuesEntity.status, func.count())
+                .where(JiraIssuesEntity.product_id == product.id, JiraIssuesEntity.severity == SEVERITIES[0])
+                .group_by(JiraIssuesEntity.status)
+            ).all(),
+        }
+
+        without_indexes = {
+            name: timed(db_session=db_session, operation=operation) for name, operation in operations.items()
+        }
+        start = time.perf_counter()
+        with db.engine.begin() as connection:
+            create_missing_indexes(connection=connection, indexes=list(cast(Table, JiraIssuesEntity.__table__).indexes))
+        click.echo(f"Created indexes in {time.perf_counter() - start:.1f}s")
+        with_indexes = {
+            name: timed(db_session=db_session, operation=operation) for name, operation in operations.items()
+        }
+
+        click.echo(f"{'operation':<20} {'no indexes':>12} {'indexes':>12}")
+        for name in operations:
+            click.echo(f"{name:<20} {without_indexes[name]:>11.4f}s {with_indexes[name]:>11.4f}s")
+
+
+if __name__ == "__main__":
+    main()
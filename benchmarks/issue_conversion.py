@@ -0,0 +1,94 @@
+"""
+Benchmark the conversion of the JSON returned by the Jira search endpoint to jiraissues rows: building `jira.Issue`
+resources and parsing their dates with `strptime`, as qe-metrics used to, compared with `issue_record_from_json`.
+
+Usage: python -m benchmarks.issue_conversion --issues 100000
+"""
+
+from __future__ import annotations
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import click
+from jira import Issue
+
+from benchmarks.utils import JIRA_DATE_FORMAT, synthetic_raw_issues
+from qe_metrics.libs.jira import JIRA_CUSTOM_FIELD_MAPPING, is_customer_escaped_value, issue_record_from_json
+from qe_metrics.utils.issue_utils import issue_content_hash, issue_to_row
+
+CUSTOMER_ESCAPED_FIELD = JIRA_CUSTOM_FIELD_MAPPING["customer_escaped"]
+JIRA_SERVER = "https://jira.example.com"
+
+
+def issue_resource_to_row(raw_issue: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw Jira issue to a jiraissues row through a `jira.Issue` resource.
+
+    Args:
+        raw_issue (Dict[str, Any]): Raw Jira issue
+
+    Returns:
+        Dict[str, Any]: JiraIssuesEntity column values
+    """
+    issue = Issue(options={}, session=None, raw=raw_issue)  # type: ignore[arg-type]
+    issue_row = {
+        "product_id": 1,
+        "issue_key": issue.key,
+        "title": issue.fields.summary.strip(),
+        "url": f"{JIRA_SERVER}/browse/{issue.key}",
+        "project": issue.fields.project.key,
+        "severity": "blocker",
+        "status": issue.fields.status.name,
+        "issue_type": issue.fields.issuetype.name.lower(),
+        "customer_escaped": is_customer_escaped_value(value=getattr(issue.fields, CUSTOMER_ESCAPED_FIELD, None)),
+        "date_created": datetime.strptime(issue.fields.created, JIRA_DATE_FORMAT).date(),
+        "last_updated": datetime.strptime(issue.fields.updated, JIRA_DATE_FORMAT).date(),
+    }
+    issue_row["content_hash"] = issue_content_hash(issue_row=issue_row)
+    return issue_row
+
+
+def issue_record_to_row(raw_issue: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw Jira issue to a jiraissues row the way `Jira.search` and `create_update_issues` do.
+
+    Args:
+        raw_issue (Dict[str, Any]): Raw Jira issue
+
+    Returns:
+        Dict[str, Any]: JiraIssuesEntity column values
+    """
+    return issue_to_row(
+        issue=issue_record_from_json(raw_issue=raw_issue, customer_escaped_field=CUSTOMER_ESCAPED_FIELD),
+        product_id=1,
+        severity="blocker",
+        jira_server=JIRA_SERVER,
+    )
+
+
+@click.command()
+@click.option("--issues", default=100000, show_default=True, help="Number of synthetic Jira issues.")
+@click.option("--repeat", default=3, show_default=True, help="Number of timed conversions, the best one is reported.")
+def main(issues: int, repeat: int) -> None:
+    raw_issues = synthetic_raw_issues(count=issues)
+    converters: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+        "jira.Issue + strptime": issue_resource_to_row,
+        "issue_record_from_json": issue_record_to_row,
+    }
+    rows: Dict[str, List[Dict[str, Any]]] = {}
+    for name, converter in converters.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows[name] = [converter(raw_issue) for raw_issue in raw_issues]
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        click.echo(f"{name:<25} {issues:>8} issues {best:>9.3f}s {best / issues * 1e6:>8.2f}us/issue")
+
+    if rows["jira.Issue + strptime"] != rows["issue_record_from_json"]:
+        raise click.ClickException("The conversions returned different rows")
+
+
+if __name__ == "__main__":
+    main()
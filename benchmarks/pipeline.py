@@ -0,0 +1,311 @@
+"""
+Benchmark the full `qe_metrics` pipeline against a synthetic Jira: wall time, SQL statements, peak memory and the
+duration of each stage, for an initial sync seeding the database, an unchanged re-sync and a re-sync where a share of
+the issues changed.
+
+Usage: python -m benchmarks.pipeline --issues 100000 --products 100 --output results.json
+       python -m benchmarks.pipeline --issues 100000 --products 100 --baseline results.json
+
+Results written with `--output` hold the benchmark parameters and the commit they were measured on. A run compared
+with `--baseline` fails when its wall time or statement count regressed by more than `--max-regression`, provided it
+used the same parameters. When `--config-file` is given, it must point to a scratch database.
+"""
+
+from __future__ import annotations
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import click
+import yaml
+from sqlalchemy import Engine
+
+from benchmarks.utils import benchmark_config_file, change_issues, count_statements, synthetic_issues
+from qe_metrics.libs.jira import JiraIssueRecord, SearchProbe
+from qe_metrics.utils.entrypoint import qe_metrics
+from qe_metrics.utils.general import ClosableIterator
+from qe_metrics.utils.metrics_utils import METRICS
+
+SEVERITIES = ["blocker", "critical-blocker"]
+
+
+class SyntheticSearch(ClosableIterator[JiraIssueRecord]):
+    """
+    Issues of a synthetic Jira search.
+    """
+
+    def __init__(self, issues: List[JiraIssueRecord]) -> None:
+        self._issues = iter(issues)
+
+    def __next__(self) -> JiraIssueRecord:
+        return next(self._issues)
+
+    def close(self) -> None:
+        self._issues = iter([])
+
+
+class SyntheticJira:
+    """
+    Stand-in for the `Jira` class, answering the queries of the synthetic products from memory.
+    """
+
+    # Issues returned by the queries, keyed by query, shared by the instances created by `qe_metrics`
+    issues_by_query: Dict[str, List[JiraIssueRecord]] = {}
+
+    def __init__(self, config_file: str, max_connections: int = 10, local_filter_fields: bool = False) -> None:
+        self.jira_config = {"server": "https://jira.example.com"}
+
+    def __enter__(self) -> "SyntheticJira":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def _issues(self, query: str) -> List[JiraIssueRecord]:
+        # The queries are extended with an "updated" condition by `qe_metrics`
+        return next(issues for base_query, issues in self.issues_by_query.items() if query.startswith(base_query))
+
+    def stream_search(self, query: str) -> SyntheticSearch:
+        return SyntheticSearch(issues=self._issues(query=query))
+
+    def probe_searches(self, queries: List[str]) -> List[Optional[SearchProbe]]:
+        probes: List[Optional[SearchProbe]] = []
+        for query in queries:
+            issues = self._issues(query=query)
+            probes.append(
+                SearchProbe(
+                    total=len(issues),
+                    max_updated=max((issue.last_updated.isoformat() for issue in issues), default=None),
+                )
+            )
+        return probes
+
+
+def synthetic_products(issues: int, products: int) -> Dict[str, Dict[str, str]]:
+    """
+    Generate the products and queries of the benchmark, and the issues returned by each query.
+
+    Args:
+        issues (int): Total number of issues, spread evenly over the queries.
+        products (int): Number of products, each with a query per severity of `SEVERITIES`.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Products and their queries, as read from a products file.
+    """
+    products_dict: Dict[str, Dict[str, str]] = {}
+    SyntheticJira.issues_by_query.clear()
+    queries_count = products * len(SEVERITIES)
+    for query_index in range(queries_count):
+        product_index, severity = divmod(query_index, len(SEVERITIES))
+        query = f"project = BENCH{product_index} AND priority = {SEVERITIES[severity]}"
+        products_dict.setdefault(f"benchmark-product-{product_index}", {})[SEVERITIES[severity]] = query
+        SyntheticJira.issues_by_query[query] = synthetic_issues(
+            count=issues // queries_count + (query_index < issues % queries_count),
+            project=f"BENCH{product_index}",
+            seed=query_index,
+        )
+    return products_dict
+
+
+def change_all_issues(ratio: float) -> None:
+    """
+    Change a share of the issues of every query, to simulate issues updated in Jira since the last sync.
+
+    Args:
+        ratio (float): Share of the issues to change, between 0 and 1
+    """
+    for seed, issues in enumerate(SyntheticJira.issues_by_query.values()):
+        change_issues(issues=issues, ratio=ratio, seed=seed)
+
+
+def stage_durations() -> Dict[str, float]:
+    """
+    Returns:
+        Dict[str, float]: Total duration of each stage recorded in the qe-metrics metrics, in seconds.
+    """
+    durations: Dict[str, float] = {}
+    snapshot = METRICS.snapshot()
+    for name in ("qe_metrics_stage_duration_seconds", "qe_metrics_query_duration_seconds"):
+        for labels, histogram in snapshot.get(name, []):
+            durations[labels["stage"]] = durations.get(labels["stage"], 0.0) + histogram[-2]
+    return durations
+
+
+def run_pipeline(config_file: str, products_file: str, trace_memory: bool) -> Dict[str, Any]:
+    """
+    Run `qe_metrics` once against the synthetic Jira.
+
+    Args:
+        config_file (str): qe-metrics config file of the database.
+        products_file (str): Products file of the synthetic products.
+        trace_memory (bool): Whether to measure the peak memory allocated by Python with tracemalloc, which slows
+            the run down.
+
+    Returns:
+        Dict[str, Any]: Measurements of the run.
+    """
+    METRICS.clear()
+    if trace_memory:
+        tracemalloc.start()
+
+    with count_statements(engine=Engine) as statements:
+        start = time.perf_counter()
+        qe_metrics(config_file=config_file, verbose_db=False, products_file=products_file)
+        wall_time = time.perf_counter() - start
+
+    measurements: Dict[str, Any] = {
+        "wall_time": round(wall_time, 4),
+        "statements": statements.count,
+        "stages": {stage: round(duration, 4) for stage, duration in sorted(stage_durations().items())},
+        # Peak resident memory of the process so far, in MiB (ru_maxrss is in KiB on Linux)
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if trace_memory:
+        measurements["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    return measurements
+
+
+def git_commit() -> str:
+    """
+    Returns:
+        str: Commit of the working tree, "unknown" outside of a git repository.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Compare the wall time and statement count of each run with the baseline.
+
+    Args:
+        results (Dict[str, Any]): Results of this benchmark.
+        baseline (Dict[str, Any]): Results of a previous benchmark, with the same parameters.
+        max_regression (float): Allowed relative increase of the wall time and statement count.
+
+    Returns:
+        List[str]: Descriptions of the regressions.
+    """
+    regressions: List[str] = []
+    baseline_runs = {run["name"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        if not (baseline_run := baseline_runs.get(run["name"])):
+            continue
+
+        for measurement in ("wall_time", "statements"):
+            current, previous = run[measurement], baseline_run[measurement]
+            change = (current - previous) / previous if previous else 0.0
+            click.echo(f"{run['name']:<30} {measurement:<12} {previous:>12} -> {current:<12} {change:>+8.1%}")
+            if change > max_regression:
+                regressions.append(f"{run['name']}: {measurement} {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+@click.command()
+@click.option("--issues", default=10000, show_default=True, help="Number of synthetic Jira issues.")
+@click.option("--products", default=10, show_default=True, help="Number of products the issues are spread over.")
+@click.option("--changed-ratio", default=0.1, show_default=True, help="Share of the issues changed before the re-sync.")
+@click.option(
+    "--config-file",
+    default=None,
+    help="qe-metrics config file of the database to benchmark against. Defaults to a temporary SQLite database.",
+    type=click.Path(exists=True),
+)
+@click.option("--trace-memory", is_flag=True, help="Measure the peak memory allocated by Python (slower).")
+@click.option("--output", default=None, help="Write the results to this JSON file.", type=click.Path())
+@click.option(
+    "--baseline", default=None, help="Compare with the results of this JSON file.", type=click.Path(exists=True)
+)
+@click.option(
+    "--max-regression", default=0.2, show_default=True, help="Allowed relative regression compared to the baseline."
+)
+def main(
+    issues: int,
+    products: int,
+    changed_ratio: float,
+    config_file: str | None,
+    trace_memory: bool,
+    output: str | None,
+    baseline: str | None,
+    max_regression: float,
+) -> None:
+    parameters = {
+        "issues": issues,
+        "products": products,
+        "changed_ratio": changed_ratio,
+        "database": "sqlite",
+        # Tracing the memory allocations slows the runs down, so wall times are only comparable with the same setting
+        "trace_memory": trace_memory,
+    }
+    start = time.perf_counter()
+    products_dict = synthetic_products(issues=issues, products=products)
+    click.echo(f"Generated {issues} issues of {products} products in {time.perf_counter() - start:.1f}s")
+
+    runs: List[Dict[str, Any]] = []
+    with (
+        tempfile.TemporaryDirectory(prefix="qe-metrics-benchmark-") as tmp_dir,
+        benchmark_config_file(config_file=config_file) as db_config_file,
+    ):
+        if config_file:
+            with open(config_file) as fd:
+                parameters["database"] = "local" if yaml.safe_load(fd)["database"].get("local") else "server"
+
+        products_file = os.path.join(tmp_dir, "products.yaml")
+        with open(products_file, "w") as fd:
+            yaml.dump(products_dict, fd)
+
+        prepare_runs: List[Tuple[str, Optional[Callable[[], None]]]] = [
+            ("initial sync", None),
+            ("unchanged re-sync", None),
+            (f"re-sync, {changed_ratio:.0%} changed", lambda: change_all_issues(ratio=changed_ratio)),
+        ]
+        with (
+            mock.patch.dict(os.environ, {"QE_METRICS_CACHE_DIR": tmp_dir}),
+            mock.patch("qe_metrics.utils.entrypoint.Jira", SyntheticJira),
+        ):
+            for run_name, prepare in prepare_runs:
+                if prepare:
+                    prepare()
+                run = {
+                    "name": run_name,
+                    **run_pipeline(config_file=db_config_file, products_file=products_file, trace_memory=trace_memory),
+                }
+                runs.append(run)
+                click.echo(
+                    f"{run_name:<30} {run['statements']:>8} statements {run['wall_time']:>9.3f}s "
+                    f"{run['max_rss_mb']:>8.1f} MiB max RSS"
+                )
+                for stage, duration in run["stages"].items():
+                    click.echo(f"    {stage:<26} {duration:>9.3f}s")
+
+    results = {"commit": git_commit(), "parameters": parameters, "runs": runs}
+    if output:
+        with open(output, "w") as fd:
+            json.dump(results, fd, indent=2)
+
+    if baseline:
+        with open(baseline) as fd:
+            baseline_results = json.load(fd)
+        if baseline_results["parameters"] != parameters:
+            raise click.UsageError(f"Baseline parameters {baseline_results['parameters']} differ from {parameters}")
+
+        click.echo(f"Comparing with commit {baseline_results['commit']}")
+        if regressions := compare_results(results=results, baseline=baseline_results, max_regression=max_regression):
+            click.echo("Regressions:\n" + "\n".join(regressions), err=True)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
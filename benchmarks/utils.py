@@ -0,0 +1,173 @@
+from __future__ import annotations
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Type
+
+import yaml
+from sqlalchemy import Engine, event
+
+from qe_metrics.libs.database import Database
+from qe_metrics.libs.jira import JIRA_CUSTOM_FIELD_MAPPING, JIRA_DATE_FORMAT, JiraIssueRecord, issue_record_from_json
+
+STATUSES = ["New", "To Do", "In Progress", "Code Review", "ON_QA", "Verified"]
+ISSUE_TYPES = ["Bug", "Story", "Task"]
+
+
+def synthetic_raw_issue(key: str, rng: random.Random) -> Dict[str, Any]:
+    """
+    Build the raw JSON of a Jira issue, as returned by the Jira search API, holding the fields qe-metrics persists.
+
+    Args:
+        key (str): Jira issue key, e.g. "PROJ-1"
+        rng (random.Random): Random generator used to pick field values
+
+    Returns:
+        Dict[str, Any]: Raw Jira issue
+    """
+    created = datetime.now(timezone.utc) - timedelta(days=rng.randint(1, 90))
+    updated = created + timedelta(hours=rng.randint(0, 24 * 30))
+    return {
+        "id": key.split("-")[1],
+        "key": key,
+        "self": f"https://jira.example.com/rest/api/2/issue/{key}",
+        "fields": {
+            "summary": f"Synthetic issue {key}",
+            "status": {"name": rng.choice(STATUSES)},
+            "issuetype": {"name": rng.choice(ISSUE_TYPES)},
+            "project": {"key": key.split("-")[0]},
+            "created": created.strftime(JIRA_DATE_FORMAT),
+            "updated": min(updated, datetime.now(timezone.utc)).strftime(JIRA_DATE_FORMAT),
+            JIRA_CUSTOM_FIELD_MAPPING["customer_escaped"]: rng.choice([None, "0.0", "1.0"]),
+        },
+    }
+
+
+def synthetic_raw_issues(count: int, project: str = "BENCH", seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Generate a reproducible list of raw Jira issues.
+
+    Args:
+        count (int): Number of issues to generate
+        project (str): Jira project key of the issues
+        seed (int): Seed of the random generator
+
+    Returns:
+        List[Dict[str, Any]]: Raw Jira issues
+    """
+    rng = random.Random(seed)
+    return [synthetic_raw_issue(key=f"{project}-{index}", rng=rng) for index in range(1, count + 1)]
+
+
+def synthetic_issues(count: int, project: str = "BENCH", seed: int = 0) -> List[JiraIssueRecord]:
+    """
+    Generate a reproducible list of Jira issues.
+
+    Args:
+        count (int): Number of issues to generate
+        project (str): Jira project key of the issues
+        seed (int): Seed of the random generator
+
+    Returns:
+        List[JiraIssueRecord]: Jira issues, converted like `Jira.search` does
+    """
+    return [
+        issue_record_from_json(
+            raw_issue=raw_issue, customer_escaped_field=JIRA_CUSTOM_FIELD_MAPPING["customer_escaped"]
+        )
+        for raw_issue in synthetic_raw_issues(count=count, project=project, seed=seed)
+    ]
+
+
+def change_issues(issues: List[JiraIssueRecord], ratio: float, seed: int = 0) -> None:
+    """
+    Change the status of a share of the issues in place, to simulate issues updated in Jira since the last sync.
+
+    Args:
+        issues (List[JiraIssueRecord]): Jira issues to change
+        ratio (float): Share of the issues to change, between 0 and 1
+        seed (int): Seed of the random generator
+    """
+    rng = random.Random(seed)
+    for index in rng.sample(range(len(issues)), k=int(len(issues) * ratio)):
+        new_status = rng.choice([status for status in STATUSES if status != issues[index].status])
+        issues[index] = issues[index]._replace(status=new_status)
+
+
+@contextmanager
+def benchmark_config_file(config_file: str | None = None) -> Iterator[str]:
+    """
+    Get the qe-metrics config file of the database to benchmark against.
+
+    Args:
+        config_file (str | None): qe-metrics config file of an existing database, e.g. a local PostgreSQL.
+            A config file of a temporary SQLite database is created if not set.
+
+    Yields:
+        str: Path of the config file
+    """
+    if config_file:
+        yield config_file
+        return
+
+    with tempfile.TemporaryDirectory(prefix="qe-metrics-benchmark-") as tmp_dir:
+        tmp_config_file = f"{tmp_dir}/config.yaml"
+        with open(tmp_config_file, "w") as tmp_config:
+            yaml.dump(
+                {
+                    "database": {"local": True, "local_filepath": f"{tmp_dir}/benchmark.sqlite"},
+                    "jira": {"server": "https://jira.example.com", "token": "benchmark"},
+                },
+                tmp_config,
+            )
+        yield tmp_config_file
+
+
+@contextmanager
+def benchmark_database(config_file: str | None = None) -> Iterator[Database]:
+    """
+    Create a qe-metrics Database for benchmarking.
+
+    Args:
+        config_file (str | None): qe-metrics config file of an existing database, e.g. a local PostgreSQL.
+            A temporary SQLite database is used if not set.
+
+    Yields:
+        Database: Database instance
+    """
+    with benchmark_config_file(config_file=config_file) as db_config_file:
+        db = Database(config_file=db_config_file, verbose=False)
+        yield db
+        db.engine.dispose()
+
+
+class StatementCounter:
+    """
+    Count the SQL statements sent to the database by an engine.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args: Any) -> None:
+        self.count += 1
+
+
+@contextmanager
+def count_statements(engine: Engine | Type[Engine]) -> Iterator[StatementCounter]:
+    """
+    Count the SQL statements executed on `engine` inside the context.
+
+    Args:
+        engine (Engine | Type[Engine]): SQLAlchemy engine, or the Engine class to count the statements of all engines
+
+    Yields:
+        StatementCounter: Counter holding the number of executed statements
+    """
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
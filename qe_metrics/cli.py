@@ -1,23 +1,39 @@
 import os
 import time
+from datetime import datetime
 from multiprocessing import Process
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import click
 
 from pyaml_env import parse_config
 from simple_logger.logger import get_logger
+from qe_metrics.libs.database import Database
+from qe_metrics.utils.api_utils import (
+    cached_json,
+    get_issue_count_trend,
+    get_issue_counts,
+    get_issues,
+    validate_page,
+)
 from qe_metrics.utils.entrypoint import qe_metrics
 from qe_metrics.utils.general import run_in_verbose
+from qe_metrics.utils.job_utils import SyncJobQueue
+from qe_metrics.utils.metrics_utils import collect_metrics
+from qe_metrics.utils.partition_utils import is_issues_table_partitioned, partition_issues_table
+from qe_metrics.utils.product_utils import Shard
 from pyhelper_utils.runners import function_runner_with_pdb
 from pyhelper_utils.general import tts
 from flask.logging import default_handler
-from flask import Flask
+from flask import Flask, Response, jsonify, request
+from sqlalchemy.orm import Session
+from werkzeug.wrappers import Response as WerkzeugResponse
 
 
 APP = Flask("qe_metrics")
 APP.logger.removeHandler(default_handler)
 APP.logger.addHandler(get_logger(APP.logger.name).handlers[0])
+SYNC_JOBS = SyncJobQueue(run=qe_metrics)
 
 
 def run_in_while(config_file: str, verbose_db: bool) -> None:
@@ -34,18 +50,46 @@ def run_in_while(config_file: str, verbose_db: bool) -> None:
         time.sleep(tts(ts=run_interval))
 
 
-@click.command()
+def parse_shard(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[Shard]:
+    if value is None:
+        return None
+
+    try:
+        return Shard.parse(value=value)
+    except ValueError as ex:
+        raise click.BadParameter(message=str(ex)) from None
+
+
+@click.group(invoke_without_command=True)
 @click.option(
     "--products-file",
     default=os.environ.get("QE_METRICS_PRODUCTS", "products.yaml"),
     help="Defines the path to the file holding a list of products and their Jira queries.",
-    type=click.Path(exists=True),
+    type=click.Path(),
 )
 @click.option(
     "--config-file",
     default=os.environ.get("QE_METRICS_CONFIG", "config.yaml"),
     help="Defines the path to the file holding database and Jira configuration.",
-    type=click.Path(exists=True),
+    type=click.Path(),
+)
+@click.option(
+    "--product",
+    "products",
+    multiple=True,
+    help="Only sync the products matching this shell-style pattern, e.g. 'openshift-*'. Can be repeated.",
+)
+@click.option(
+    "--severity",
+    "severities",
+    multiple=True,
+    help="Only sync the severities matching this shell-style pattern, e.g. 'blocker'. Can be repeated.",
+)
+@click.option(
+    "--shard",
+    default=None,
+    callback=parse_shard,
+    help="Only sync shard NUMBER/TOTAL of the products, e.g. '1/4', to split a sync over several hosts.",
 )
 @click.option(
     "--pdb",
@@ -58,23 +102,168 @@ def run_in_while(config_file: str, verbose_db: bool) -> None:
     help="Verbose output of database connection.",
     type=click.BOOL,
 )
-def cli_entrypoint(products_file: str, config_file: str, pdb: bool, verbose_db: bool) -> None:
+@click.pass_context
+def cli_entrypoint(
+    ctx: click.Context,
+    products_file: str,
+    config_file: str,
+    products: Tuple[str, ...],
+    severities: Tuple[str, ...],
+    shard: Optional[Shard],
+    pdb: bool,
+    verbose_db: bool,
+) -> None:
+    ctx.obj = {"config_file": config_file, "verbose_db": verbose_db}
+    if ctx.invoked_subcommand is not None:
+        return
+
+    # The files are only required to run qe-metrics, not by the subcommands
+    for option_name, path in (("--products-file", products_file), ("--config-file", config_file)):
+        if not os.path.exists(path):
+            raise click.BadParameter(message=f"Path '{path}' does not exist.", param_hint=f"'{option_name}'")
+
     function_runner_with_pdb(
         func=qe_metrics,
         products_file=products_file,
         config_file=config_file,
         verbose_db=verbose_db,
+        products=list(products),
+        severities=list(severities),
+        shard=shard,
     )
 
 
+@cli_entrypoint.group()
+def db() -> None:
+    """Manage the qe-metrics database."""
+
+
+@db.command()
+@click.option(
+    "--delete-duplicates",
+    is_flag=True,
+    help="Delete the duplicate rows preventing the creation of unique indexes, keeping the most recent one of each.",
+)
+@click.pass_context
+def upgrade(ctx: click.Context, delete_duplicates: bool) -> None:
+    """Apply the pending schema migrations to the database."""
+    if not os.path.exists(config_file := ctx.obj["config_file"]):
+        raise click.BadParameter(message=f"Path '{config_file}' does not exist.", param_hint="'--config-file'")
+
+    database = Database(config_file=config_file, verbose=ctx.obj["verbose_db"], verify_schema=False)
+    database.upgrade_schema(delete_duplicates=delete_duplicates)
+    database.engine.dispose()
+
+
+@db.command("partition-issues")
+@click.pass_context
+def partition_issues(ctx: click.Context) -> None:
+    """Convert the jiraissues table to monthly partitions (PostgreSQL only), so retention drops whole partitions."""
+    if not os.path.exists(config_file := ctx.obj["config_file"]):
+        raise click.BadParameter(message=f"Path '{config_file}' does not exist.", param_hint="'--config-file'")
+
+    database = Database(config_file=config_file, verbose=ctx.obj["verbose_db"])
+    if database.engine.dialect.name != "postgresql":
+        raise click.UsageError(message="Partitioning is only supported on PostgreSQL")
+
+    with database.session() as db_session:
+        if is_issues_table_partitioned(db_session=db_session):
+            click.echo("The jiraissues table is already partitioned")
+            return
+
+    with database.engine.begin() as connection:
+        partition_issues_table(connection=connection, today=datetime.now().date())
+    database.engine.dispose()
+
+
 @APP.route("/update", methods=["GET"])
-def update_qe_metrics() -> str:
-    qe_metrics(
+def update_qe_metrics() -> Tuple[Response, int]:
+    job = SYNC_JOBS.submit(
         products_file_url=True,
         config_file=os.environ.get("QE_METRICS_CONFIG", "config.yaml"),
         verbose_db=run_in_verbose(),
+        products=sorted(set(request.args.getlist("product"))),
+        severities=sorted(set(request.args.getlist("severity"))),
     )
-    return "OK"
+    return jsonify(job.to_dict()), 202
+
+
+@APP.route("/jobs/<job_id>", methods=["GET"])
+def qe_metrics_job(job_id: str) -> Tuple[Response, int]:
+    if job := SYNC_JOBS.get(job_id=job_id):
+        return jsonify(job.to_dict()), 200
+    return jsonify({"error": f"Unknown job {job_id}"}), 404
+
+
+def cached_json_response(endpoint: str, query: Callable[[Session], Any]) -> WerkzeugResponse:
+    """
+    Build a JSON response from the response cache, answering 304 Not Modified when the client ETag matches.
+    """
+    key = (endpoint, tuple(sorted(request.args.items(multi=True))))
+
+    def _query() -> Any:
+        database = Database(config_file=os.environ.get("QE_METRICS_CONFIG", "config.yaml"), verbose=run_in_verbose())
+        with database.session() as db_session:
+            return query(db_session)
+
+    body, etag = cached_json(key=key, query=_query)
+    response = Response(response=body, mimetype="application/json")
+    response.set_etag(etag=etag)
+    return response.make_conditional(request_or_environ=request)
+
+
+@APP.route("/api/v1/counts", methods=["GET"])
+def issue_counts() -> WerkzeugResponse:
+    return cached_json_response(
+        endpoint="counts",
+        query=lambda db_session: get_issue_counts(
+            db_session=db_session,
+            products=request.args.getlist("product"),
+            severities=request.args.getlist("severity"),
+        ),
+    )
+
+
+@APP.route("/api/v1/trends", methods=["GET"])
+def issue_count_trend() -> WerkzeugResponse:
+    return cached_json_response(
+        endpoint="trends",
+        query=lambda db_session: get_issue_count_trend(
+            db_session=db_session,
+            products=request.args.getlist("product"),
+            severities=request.args.getlist("severity"),
+            days=request.args.get("days", 30, type=int),
+        ),
+    )
+
+
+@APP.route("/api/v1/issues", methods=["GET"])
+def issues() -> WerkzeugResponse:
+    limit = request.args.get("limit", 100, type=int)
+    offset = request.args.get("offset", 0, type=int)
+    try:
+        validate_page(limit=limit, offset=offset)
+    except ValueError as ex:
+        response = jsonify({"error": str(ex)})
+        response.status_code = 400
+        return response
+
+    return cached_json_response(
+        endpoint="issues",
+        query=lambda db_session: get_issues(
+            db_session=db_session,
+            products=request.args.getlist("product"),
+            severities=request.args.getlist("severity"),
+            statuses=request.args.getlist("status"),
+            limit=limit,
+            offset=offset,
+        ),
+    )
+
+
+@APP.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    return Response(response=collect_metrics(), mimetype="text/plain; version=0.0.4")
 
 
 @APP.route("/healthcheck")
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+import concurrent.futures
+from concurrent.futures import Future
+from threading import Thread
+from typing import Any, Coroutine, Deque, Dict, List, Optional, TypeVar
+
+import aiohttp
+import click
+from pyaml_env import parse_config
+from simple_logger.logger import get_logger
+
+from qe_metrics.libs.jira import (
+    JIRA_CUSTOM_FIELD_MAPPING,
+    SEARCH_PAGE_SIZE,
+    JiraIssueRecord,
+    SearchProbe,
+    get_probe_query,
+    get_search_fields,
+    issue_record_from_json,
+)
+from qe_metrics.utils.general import ClosableIterator, verify_config
+from qe_metrics.utils.metrics_utils import record_jira_request
+from qe_metrics.utils.throttle_utils import (
+    RETRY_STATUSES,
+    THROTTLED,
+    JiraThrottle,
+    get_request_outcome,
+    get_retry_delay,
+)
+
+LOGGER = get_logger(name=__name__)
+
+T = TypeVar("T")
+# Number of fetched result pages buffered per search, ahead of the consumer
+MAX_BUFFERED_PAGES = 2
+# Seconds between two checks that a search is still running, while waiting for its next page
+PAGE_POLL_SECONDS = 1.0
+# Marks the end of the pages of a search
+_END_OF_PAGES = object()
+
+
+class AsyncSearchIterator(ClosableIterator[JiraIssueRecord]):
+    """
+    Iterate, from a regular thread, over the issues of a search running in the AsyncJira event loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, pages: asyncio.Queue[Any], task: asyncio.Task[None]) -> None:
+        """
+        Args:
+            loop (asyncio.AbstractEventLoop): Event loop running the search.
+            pages (asyncio.Queue[Any]): Queue the search puts its result pages into.
+            task (asyncio.Task[None]): Task running the search.
+        """
+        self._loop = loop
+        self._pages = pages
+        self._task = task
+        self._issues: Deque[JiraIssueRecord] = deque()
+        self._done = False
+        self._next_page: Optional[Future[Any]] = None
+
+    def __next__(self) -> JiraIssueRecord:
+        while not self._issues:
+            if self._done:
+                raise StopIteration
+
+            page = self._get_page()
+            if page is _END_OF_PAGES:
+                self._done = True
+            elif isinstance(page, Exception):
+                self.close()
+                raise page
+            else:
+                self._issues.extend(page)
+
+        return self._issues.popleft()
+
+    def close(self) -> None:
+        self._done = True
+        self._issues.clear()
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            if self._next_page:
+                self._next_page.cancel()
+
+    def _get_page(self) -> Any:
+        """
+        Wait for the next page of the search, while the search task and the event loop are running.
+
+        Returns:
+            Any: A list of Jira issue records, `_END_OF_PAGES` or the exception raised by the search.
+
+        Raises:
+            RuntimeError: If the search task or the event loop stopped without putting the end of the pages.
+        """
+        # The same read is waited for until it returns, so no page is lost when a wait times out
+        if self._next_page is None:
+            self._next_page = asyncio.run_coroutine_threadsafe(self._pages.get(), self._loop)
+        next_page = self._next_page
+
+        while True:
+            try:
+                page = next_page.result(timeout=PAGE_POLL_SECONDS)
+                self._next_page = None
+                return page
+            except concurrent.futures.TimeoutError:
+                if self._task.done() or not self._loop.is_running():
+                    self.close()
+                    raise RuntimeError("The Jira search stopped before returning all its issues")
+
+
+class AsyncJira:
+    """
+    Jira client fetching search results with asyncio, through the Jira REST search endpoint.
+
+    Requests share a pooled keep-alive HTTP session limited to `max_connections` connections per host, and go through a
+    `JiraThrottle`. Throttled and unavailable responses are retried with jittered exponential backoff, honouring their
+    Retry-After header. The event loop runs in a background thread, so searches are consumed like the ones of the Jira
+    class.
+    """
+
+    def __init__(self, config_file: str, max_connections: int = 10, local_filter_fields: bool = False) -> None:
+        """
+        Initialize the AsyncJira class
+
+        Args:
+            config_file (str): Path to the yaml file holding database and Jira configuration.
+            max_connections (int): Maximum number of concurrent searches and of connections to the Jira server.
+            local_filter_fields (bool): Whether to request the `LOCAL_FILTER_FIELDS` of the issues.
+        """
+        self.jira_config = parse_config(path=config_file)["jira"]
+        self.max_connections = max_connections
+        self.max_retries: int = self.jira_config.get("max_retries", 5)
+        self.throttle = JiraThrottle.from_config(jira_config=self.jira_config, max_concurrency=max_connections)
+        self.custom_fields: Dict[str, str] = {**JIRA_CUSTOM_FIELD_MAPPING, **self.jira_config.get("custom_fields", {})}
+        self.search_fields = get_search_fields(
+            custom_fields=self.custom_fields, local_filter_fields=local_filter_fields
+        )
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = Thread(target=self._loop.run_forever, name="async-jira", daemon=True)
+
+    def __enter__(self) -> "AsyncJira":
+        verify_config(config=self.jira_config, required_keys=["token", "server"])
+        self._loop_thread.start()
+        try:
+            self._run(coroutine=self.connect())
+        except BaseException:
+            self._stop_loop()
+            raise
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Any,
+        exc_value: Any,
+        traceback: Any,
+    ) -> None:
+        self._run(coroutine=self.session.close())
+        self._stop_loop()
+        LOGGER.success("Disconnected from Jira")
+
+    async def connect(self) -> None:
+        """
+        Open the HTTP session and verify the Jira credentials.
+        """
+        self.session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {self.jira_config['token']}", "Accept": "application/json"},
+            connector=aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections),
+            raise_for_status=False,
+        )
+        self.searches = asyncio.Semaphore(self.max_connections)
+        try:
+            await self.get_json(path="myself")
+            LOGGER.success(f"Successfully authenticated to Jira server {self.jira_config['server']}")
+        except Exception as error:
+            await self.session.close()
+            LOGGER.error(f"Failed to connect to Jira server {self.jira_config['server']}: {error}")
+            raise click.Abort()
+
+    async def get_json(
+        self, path: str, params: Dict[str, Any] | None = None, operation: str | None = None
+    ) -> Dict[str, Any]:
+        """
+        Send a GET request to the Jira REST API, retrying throttled, unavailable and failed connections.
+
+        Args:
+            path (str): Path of the endpoint, relative to /rest/api/2/.
+            params (Dict[str, Any] | None): Query parameters.
+            operation (str | None): Kind of request recorded in the Jira request metrics, `path` by default.
+
+        Returns:
+            Dict[str, Any]: JSON response.
+        """
+        url = f"{self.jira_config['server'].rstrip('/')}/rest/api/2/{path}"
+        for attempt in range(self.max_retries + 1):
+            slot = await self.throttle.acquire_async()
+            started = time.monotonic()
+            status: Optional[int] = None
+            delay: Optional[float] = None
+            outcome = "error"
+            try:
+                async with self.session.get(url, params=params) as response:
+                    status = response.status
+                    if status not in RETRY_STATUSES or attempt == self.max_retries:
+                        response.raise_for_status()
+                        json_response = await response.json()
+                        outcome = "success"
+                        return json_response
+
+                    delay = get_retry_delay(retry_after=response.headers.get("Retry-After"), attempt=attempt)
+                    reason = f"HTTP {status}"
+                    outcome = "retry"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = get_retry_delay(retry_after=None, attempt=attempt)
+                reason = str(error) or error.__class__.__name__
+                outcome = "retry"
+            finally:
+                duration = time.monotonic() - started
+                request_outcome = get_request_outcome(status=status)
+                self.throttle.release(
+                    slot=slot,
+                    outcome=request_outcome,
+                    duration=duration,
+                    retry_after=delay if request_outcome == THROTTLED else None,
+                )
+                record_jira_request(operation=operation or path, outcome=outcome, duration=duration)
+
+            LOGGER.warning(f"Jira request {url} failed ({reason}), retrying in {delay:.1f} seconds")
+            # Throttled requests pause all the requests of the throttle instead
+            if status != 429:
+                await asyncio.sleep(delay)
+
+        raise RuntimeError(f"Jira request {url} was not sent")
+
+    async def search_pages(self, query: str, pages: asyncio.Queue[Any]) -> None:
+        """
+        Fetch the result pages of a Jira JQL query into `pages`, followed by `_END_OF_PAGES` or the raised exception.
+
+        Args:
+            query (str): JQL query to execute.
+            pages (asyncio.Queue[Any]): Queue receiving lists of Jira issue records.
+        """
+        customer_escaped_field = self.custom_fields["customer_escaped"]
+        try:
+            async with self.searches:
+                start_at = 0
+                while True:
+                    result = await self.get_json(
+                        path="search",
+                        operation="search",
+                        params={
+                            "jql": query,
+                            "startAt": start_at,
+                            "maxResults": SEARCH_PAGE_SIZE,
+                            "fields": ",".join(self.search_fields),
+                        },
+                    )
+                    issues = [
+                        issue_record_from_json(raw_issue=raw_issue, customer_escaped_field=customer_escaped_field)
+                        for raw_issue in result.get("issues", [])
+                    ]
+                    await pages.put(issues)
+
+                    start_at += len(issues)
+                    if not issues or start_at >= result.get("total", 0):
+                        break
+        except Exception as error:
+            LOGGER.error(f'Failed to execute Jira query "{query}": {error}')
+            await pages.put(error)
+            return
+
+        await pages.put(_END_OF_PAGES)
+
+    def stream_search(self, query: str) -> AsyncSearchIterator:
+        """
+        Start a Jira JQL query in the event loop, at most `max_connections` searches at a time.
+
+        Args:
+            query (str): JQL query to execute.
+
+        Returns:
+            AsyncSearchIterator: Jira issues returned from the query.
+        """
+
+        async def _start_search() -> AsyncSearchIterator:
+            pages: asyncio.Queue[Any] = asyncio.Queue(maxsize=MAX_BUFFERED_PAGES)
+            task = asyncio.ensure_future(self.search_pages(query=query, pages=pages))
+            return AsyncSearchIterator(loop=self._loop, pages=pages, task=task)
+
+        return self._run(coroutine=_start_search())
+
+    async def probe_search(self, query: str) -> SearchProbe:
+        """
+        Count the issues matching a Jira JQL query and get the update time of the most recently updated one, with a
+        single request of one issue.
+
+        Args:
+            query (str): JQL query to probe.
+
+        Returns:
+            SearchProbe: The query probe.
+        """
+        result = await self.get_json(
+            path="search",
+            operation="probe",
+            params={"jql": get_probe_query(query=query), "maxResults": 1, "fields": "updated"},
+        )
+        issues = result.get("issues", [])
+        return SearchProbe(total=result.get("total", 0), max_updated=issues[0]["fields"]["updated"] if issues else None)
+
+    def probe_searches(self, queries: List[str]) -> List[Optional[SearchProbe]]:
+        """
+        Probe Jira JQL queries concurrently, at most `max_connections` at a time.
+
+        Args:
+            queries (List[str]): JQL queries to probe.
+
+        Returns:
+            List[Optional[SearchProbe]]: The probe of each query, None for the queries that failed.
+        """
+
+        async def _probe(query: str) -> Optional[SearchProbe]:
+            async with self.searches:
+                try:
+                    return await self.probe_search(query=query)
+                except Exception as error:
+                    LOGGER.error(f'Failed to probe Jira query "{query}": {error}')
+                    return None
+
+        async def _probe_all() -> List[Optional[SearchProbe]]:
+            return list(await asyncio.gather(*[_probe(query=query) for query in queries]))
+
+        return self._run(coroutine=_probe_all())
+
+    def _run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        future: Future[T] = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        return future.result()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
@@ -1,26 +1,142 @@
-from typing import Any, Dict
+import atexit
+import os
+from threading import Lock
+from typing import Any, Dict, Set
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import Session
 from pyaml_env import parse_config
 from simple_logger.logger import get_logger
 from urllib.parse import quote_plus
 
 from qe_metrics.utils.general import verify_config
-from qe_metrics.libs.database_mapping import Base
+from qe_metrics.migrations import LATEST_SCHEMA_VERSION
+from qe_metrics.utils.migration_utils import SchemaVersionError, get_schema_version, upgrade_schema
+
+# Pool settings read from the database config, and their defaults
+POOL_CONFIG_DEFAULTS: Dict[str, Any] = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+# Pool settings not supported by the pools SQLAlchemy uses for SQLite
+QUEUE_POOL_SETTINGS = ("pool_size", "max_overflow")
+# Engines shared by the Database instances of this process, keyed by connection string
+_ENGINES: Dict[str, Engine] = {}
+_ENGINES_PID = os.getpid()
+_ENGINES_LOCK = Lock()
+# Engines whose schema version was verified, so the next Database instances of the process skip the check
+_VERIFIED_ENGINES: Set[Engine] = set()
+_SCHEMA_LOCK = Lock()
+
+
+def get_engine(connection_string: str, verbose: bool, db_config: Dict[Any, Any]) -> Engine:
+    """
+    Get the engine of a connection string, creating it on first use, so the connection pool is reused by the next
+    Database instances of the process.
+
+    In-memory SQLite databases are private to their engine, so each call returns a new engine for them. Engines
+    inherited from a parent process are not reused, since their connections are shared with the parent.
+
+    Args:
+        connection_string (str): A sqlalchemy connection string.
+        verbose (bool): Whether a new engine logs its statements.
+        db_config (Dict[Any, Any]): A dictionary containing the pool settings of `POOL_CONFIG_DEFAULTS`.
+
+    Returns:
+        Engine: SQLAlchemy engine.
+    """
+    global _ENGINES_PID
+
+    pool_config = {key: db_config.get(key, default) for key, default in POOL_CONFIG_DEFAULTS.items()}
+    if connection_string.startswith("sqlite"):
+        pool_config = {key: value for key, value in pool_config.items() if key not in QUEUE_POOL_SETTINGS}
+
+    if connection_string.endswith(":memory:"):
+        return create_engine(url=connection_string, echo=verbose, **pool_config)
+
+    with _ENGINES_LOCK:
+        if _ENGINES_PID != os.getpid():
+            _ENGINES.clear()
+            _VERIFIED_ENGINES.clear()
+            _ENGINES_PID = os.getpid()
+
+        if (engine := _ENGINES.get(connection_string)) is None:
+            engine = _ENGINES[connection_string] = create_engine(url=connection_string, echo=verbose, **pool_config)
+        return engine
+
+
+@atexit.register
+def dispose_engines() -> None:
+    """
+    Close the pooled connections of the shared engines and forget them.
+    """
+    with _ENGINES_LOCK:
+        if _ENGINES_PID == os.getpid():
+            for engine in _ENGINES.values():
+                engine.dispose()
+        _ENGINES.clear()
+        _VERIFIED_ENGINES.clear()
 
 
 class Database:
-    def __init__(self, config_file: str, verbose: bool) -> None:
+    def __init__(self, config_file: str, verbose: bool, verify_schema: bool = True) -> None:
         self.logger = get_logger(name=__name__)
-        self.connection_string = self.connection_string_builder(db_config=parse_config(path=config_file)["database"])
+        db_config = parse_config(path=config_file)["database"]
+        self.connection_string = self.connection_string_builder(db_config=db_config)
         self.verbose = verbose
-        self.engine = create_engine(url=self.connection_string, echo=self.verbose)
-        Base.metadata.create_all(bind=self.engine)
+        self.engine = get_engine(connection_string=self.connection_string, verbose=self.verbose, db_config=db_config)
+        if verify_schema:
+            self.verify_schema(auto_upgrade=db_config.get("auto_upgrade", True))
 
     def session(self) -> Session:
         return Session(bind=self.engine)
 
+    def verify_schema(self, auto_upgrade: bool) -> None:
+        """
+        Check the schema version of the database, upgrading the schema if it is outdated and `auto_upgrade` is set.
+        The check runs once per engine, the next calls return immediately once it passed.
+
+        Args:
+            auto_upgrade (bool): Whether to apply the pending schema migrations.
+
+        Raises:
+            SchemaVersionError: If the schema version does not match the latest migration and cannot be upgraded.
+        """
+        with _SCHEMA_LOCK:
+            if self.engine in _VERIFIED_ENGINES:
+                return
+
+            with self.engine.connect() as connection:
+                schema_version = get_schema_version(connection=connection)
+
+            if schema_version > LATEST_SCHEMA_VERSION:
+                raise SchemaVersionError(
+                    f"Database schema version {schema_version} is newer than the latest known version "
+                    f"{LATEST_SCHEMA_VERSION}, upgrade qe-metrics"
+                )
+
+            if schema_version < LATEST_SCHEMA_VERSION:
+                if not auto_upgrade:
+                    raise SchemaVersionError(
+                        f"Database schema version {schema_version} is older than {LATEST_SCHEMA_VERSION}, "
+                        "run `qe-metrics db upgrade`"
+                    )
+                self.upgrade_schema()
+
+            _VERIFIED_ENGINES.add(self.engine)
+
+    def upgrade_schema(self, delete_duplicates: bool = False) -> None:
+        """
+        Apply the pending schema migrations.
+
+        Args:
+            delete_duplicates (bool): Whether to delete the duplicate rows preventing the creation of unique indexes.
+        """
+        schema_version = upgrade_schema(engine=self.engine, delete_duplicates=delete_duplicates)
+        self.logger.info(f"Database schema is at version {schema_version}")
+
     @staticmethod
     def connection_string_builder(db_config: Dict[Any, Any]) -> str:
         """
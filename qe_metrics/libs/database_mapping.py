@@ -1,4 +1,7 @@
-from sqlalchemy import Integer, String, Boolean, Date, ForeignKey
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Integer, String, Boolean, Date, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
@@ -24,20 +27,118 @@ class ProductsEntity(Base):
 class JiraIssuesEntity(Base):
     """
     A class to represent the JiraIssues table in the database.
+
+    The "jira_field" info of a column names the Jira issue field it is populated from; only these fields are requested
+    from Jira. Names of custom fields (e.g. "customer_escaped") are resolved to their Jira ID by the Jira class.
+
+    An issue is stored once per product and severity; the unique index on these columns is the conflict target of the
+    issue upserts. The other indexes serve the issue key lookups and the retention cleanup.
+
+    "content_hash" is a hash of the fields refreshed from Jira, so unchanged issues are skipped without comparing their
+    fields. It is NULL for rows written before it existed and for obsolete issues.
     """
 
     __tablename__ = "jiraissues"
+    __table_args__ = (
+        Index("uq_jiraissues_product_severity_issue_key", "product_id", "severity", "issue_key", unique=True),
+        Index("ix_jiraissues_issue_key", "issue_key"),
+        Index("ix_jiraissues_last_updated", "last_updated"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, nullable=False)
     product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"))
     product: Mapped["ProductsEntity"] = relationship(back_populates="jira_issues")
     issue_key: Mapped[str] = mapped_column(String, nullable=False)
-    title: Mapped[str] = mapped_column(String, nullable=False)
+    title: Mapped[str] = mapped_column(String, nullable=False, info={"jira_field": "summary"})
     url: Mapped[str] = mapped_column(String, nullable=False)
-    project: Mapped[str] = mapped_column(String, nullable=False)
+    project: Mapped[str] = mapped_column(String, nullable=False, info={"jira_field": "project"})
+    severity: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False, info={"jira_field": "status"})
+    issue_type: Mapped[str] = mapped_column(String, nullable=False, info={"jira_field": "issuetype"})
+    customer_escaped: Mapped[bool] = mapped_column(Boolean, nullable=False, info={"jira_field": "customer_escaped"})
+    date_created: Mapped[Date] = mapped_column(Date, nullable=False, info={"jira_field": "created"})
+    last_updated: Mapped[Date] = mapped_column(Date, nullable=False, info={"jira_field": "updated"})
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+
+class SyncStateEntity(Base):
+    """
+    A class to represent the SyncState table in the database, holding the last successful sync of each product query.
+
+    "issue_count" and "max_updated" hold the number of issues matching the query and the "updated" value of the most
+    recently updated one, as probed from Jira at the last sync.
+    """
+
+    __tablename__ = "syncstate"
+    __table_args__ = (UniqueConstraint("product_id", "severity", "query_hash"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False)
+    severity: Mapped[str] = mapped_column(String, nullable=False)
+    query_hash: Mapped[str] = mapped_column(String, nullable=False)
+    last_synced: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_full_sync: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    issue_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    max_updated: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+
+class IssueCountSnapshotsEntity(Base):
+    """
+    A class to represent the IssueCountSnapshots table in the database, holding the daily number of issues of each
+    product, severity, status, issue type and customer escaped flag, so dashboards can show trends without scanning
+    the jiraissues table.
+    """
+
+    __tablename__ = "issuecountsnapshots"
+    __table_args__ = (
+        Index(
+            "uq_issuecountsnapshots_date_product_group",
+            "snapshot_date",
+            "product_id",
+            "severity",
+            "status",
+            "issue_type",
+            "customer_escaped",
+            unique=True,
+        ),
+        Index("ix_issuecountsnapshots_product_date", "product_id", "snapshot_date"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    snapshot_date: Mapped[date] = mapped_column(Date, nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False)
+    severity: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    issue_type: Mapped[str] = mapped_column(String, nullable=False)
+    customer_escaped: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    issue_count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class IssueCountRollupsEntity(Base):
+    """
+    A class to represent the IssueCountRollups table in the database, holding the current number of issues of each
+    product, severity, status, issue type and customer escaped flag.
+
+    The counts are updated from the changes written by each sync instead of being recomputed from the jiraissues table.
+    """
+
+    __tablename__ = "issuecountrollups"
+    __table_args__ = (
+        Index(
+            "uq_issuecountrollups_product_group",
+            "product_id",
+            "severity",
+            "status",
+            "issue_type",
+            "customer_escaped",
+            unique=True,
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False)
     severity: Mapped[str] = mapped_column(String, nullable=False)
     status: Mapped[str] = mapped_column(String, nullable=False)
     issue_type: Mapped[str] = mapped_column(String, nullable=False)
     customer_escaped: Mapped[bool] = mapped_column(Boolean, nullable=False)
-    date_created: Mapped[Date] = mapped_column(Date, nullable=False)
-    last_updated: Mapped[Date] = mapped_column(Date, nullable=False)
+    issue_count: Mapped[int] = mapped_column(Integer, nullable=False)
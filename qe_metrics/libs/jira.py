@@ -1,30 +1,147 @@
-from typing import Any, List
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
 
 import click
-from jira import JIRA, Issue
+import requests
+from jira import JIRA, JIRAError
 from pyaml_env import parse_config
-from pyhelper_utils.general import ignore_exceptions
+from requests.adapters import HTTPAdapter
 from simple_logger.logger import get_logger
-from qe_metrics.utils.general import verify_config
+from qe_metrics.libs.database_mapping import JiraIssuesEntity
+from qe_metrics.utils.general import ExecutorIterator, verify_config
+from qe_metrics.utils.metrics_utils import record_jira_request
+from qe_metrics.utils.throttle_utils import (
+    RETRY_STATUSES,
+    THROTTLED,
+    JiraThrottle,
+    get_request_outcome,
+    get_retry_delay,
+)
 
 JIRA_CUSTOM_FIELD_MAPPING = {
     "customer_escaped": "customfield_12313440",
 }
+# Jira fields not stored in the database, requested to evaluate label and priority clauses of queries locally
+LOCAL_FILTER_FIELDS = ["labels", "priority"]
+# Number of issues fetched per Jira search request
+SEARCH_PAGE_SIZE = 500
+JIRA_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+# Quoted strings, and the "ORDER BY" keywords of a JQL query
+JQL_ORDER_BY_REGEX = re.compile(r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|\border\s+by\b""", re.IGNORECASE)
 LOGGER = get_logger(name=__name__)
 
+T = TypeVar("T")
+
+
+class SearchProbe(NamedTuple):
+    """
+    Number of issues matching a Jira query and "updated" field of the most recently updated one.
+    """
+
+    total: int
+    max_updated: Optional[str]
+
+
+class JiraIssueRecord(NamedTuple):
+    """
+    Values of a Jira issue stored in the database, converted from the JSON returned by the Jira search endpoint.
+
+    "labels" and "priority" are only set when the `LOCAL_FILTER_FIELDS` are requested.
+    """
+
+    key: str
+    title: str
+    project: str
+    status: str
+    issue_type: str
+    customer_escaped: bool
+    date_created: date
+    last_updated: date
+    labels: Tuple[str, ...] = ()
+    priority: Optional[str] = None
+
+
+def parse_jira_date(date_str: str) -> date:
+    """
+    Get the date of a Jira timestamp, e.g. "2024-01-31T23:59:59.999+0000", in the timezone of the timestamp.
+
+    Args:
+        date_str (str): Jira timestamp.
+
+    Returns:
+        date: Date of the timestamp.
+    """
+    # Jira timestamps start with a fixed-width ISO date, parsed in C without matching the whole format
+    if date_str[10:11] == "T":
+        return date.fromisoformat(date_str[:10])
+    return datetime.strptime(date_str, JIRA_DATE_FORMAT).date()
+
+
+def is_customer_escaped_value(value: Any) -> bool:
+    """
+    Args:
+        value (Any): Value of the Jira custom field holding the customer escaped value.
+
+    Returns:
+        bool: True if the value marks the issue as customer escaped, False otherwise.
+    """
+    try:
+        return float(value) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def issue_record_from_json(raw_issue: Dict[str, Any], customer_escaped_field: str) -> JiraIssueRecord:
+    """
+    Convert the JSON of an issue returned by the Jira search endpoint, without building a `jira.Issue` resource.
+
+    Args:
+        raw_issue (Dict[str, Any]): Jira issue JSON.
+        customer_escaped_field (str): ID of the Jira custom field holding the customer escaped value.
+
+    Returns:
+        JiraIssueRecord: The issue values.
+    """
+    fields = raw_issue["fields"]
+    return JiraIssueRecord(
+        key=raw_issue["key"],
+        title=fields["summary"].strip(),
+        project=fields["project"]["key"],
+        status=fields["status"]["name"],
+        issue_type=fields["issuetype"]["name"].lower(),
+        customer_escaped=is_customer_escaped_value(value=fields.get(customer_escaped_field)),
+        date_created=parse_jira_date(date_str=fields["created"]),
+        last_updated=parse_jira_date(date_str=fields["updated"]),
+        labels=tuple(fields.get("labels") or ()),
+        priority=(fields.get("priority") or {}).get("name"),
+    )
+
 
 class Jira:
-    def __init__(self, config_file: str) -> None:
+    def __init__(self, config_file: str, max_connections: int = 10, local_filter_fields: bool = False) -> None:
         """
         Initialize the Jira class
 
         Args:
             config_file (str): Path to the yaml file holding database and Jira configuration.
+            max_connections (int): Maximum number of pooled connections to the Jira server, for concurrent searches.
+            local_filter_fields (bool): Whether to request the `LOCAL_FILTER_FIELDS` of the issues.
         """
         self.jira_config = parse_config(path=config_file)["jira"]
+        self.max_connections = max_connections
+        self.max_retries: int = self.jira_config.get("max_retries", 5)
+        self.throttle = JiraThrottle.from_config(jira_config=self.jira_config, max_concurrency=max_connections)
+        self.custom_fields: Dict[str, str] = {**JIRA_CUSTOM_FIELD_MAPPING, **self.jira_config.get("custom_fields", {})}
+        self.search_fields = get_search_fields(
+            custom_fields=self.custom_fields, local_filter_fields=local_filter_fields
+        )
 
     def __enter__(self) -> "Jira":
         self.connection = self.connect()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_connections)
         return self
 
     def __exit__(
@@ -33,11 +150,11 @@ class Jira:
         exc_value: Any,
         traceback: Any,
     ) -> None:
+        self.executor.shutdown(cancel_futures=True)
         if self.connection:
             self.connection.close()
             LOGGER.success("Disconnected from Jira")
 
-    @ignore_exceptions(retry=3, retry_interval=1, raise_final_exception=True, logger=LOGGER)
     def connect(self) -> JIRA:
         """
         Connect to Jira
@@ -47,44 +164,212 @@ class Jira:
         """
         verify_config(config=self.jira_config, required_keys=["token", "server"])
         try:
-            connection = JIRA(server=self.jira_config["server"], token_auth=self.jira_config["token"])
-            connection.my_permissions()
+            # Requests are retried by `request`, through the throttle, instead of the session of the jira library
+            connection = self.request(
+                operation="connect",
+                func=lambda: JIRA(
+                    server=self.jira_config["server"], token_auth=self.jira_config["token"], max_retries=0
+                ),
+            )
+            for prefix in ("https://", "http://"):
+                connection._session.mount(prefix=prefix, adapter=HTTPAdapter(pool_maxsize=self.max_connections))
+            self.request(operation="connect", func=connection.my_permissions)
             LOGGER.success(f"Successfully authenticated to Jira server {self.jira_config['server']}")
             return connection
         except Exception as error:
             LOGGER.error(f"Failed to connect to Jira server {self.jira_config['server']}: {error}")
             raise click.Abort()
 
-    @ignore_exceptions(retry=3, retry_interval=1, raise_final_exception=True, logger=LOGGER)
-    def search(self, query: str) -> List[Any]:
+    def stream_search(self, query: str) -> ExecutorIterator[JiraIssueRecord]:
+        """
+        Run `search` in a worker thread, at most `max_connections` searches at a time.
+
+        Args:
+            query (str): JQL query to execute.
+
+        Returns:
+            ExecutorIterator[JiraIssueRecord]: Jira issues returned from the query, buffered up to two pages ahead of
+                the consumer.
+        """
+        return ExecutorIterator(
+            executor=self.executor, func=self.search, max_buffered=SEARCH_PAGE_SIZE * 2, query=query
+        )
+
+    def search(self, query: str) -> Iterator[JiraIssueRecord]:
+        """
+        Performs a Jira JQL query using the Jira connection and yields the issues page by page, as they are fetched.
+
+        Only the fields stored in the database are requested, and the JSON of the issues is converted to records
+        directly.
+
+        Args:
+            query (str): JQL query to execute.
+
+        Yields:
+            JiraIssueRecord: Jira issues returned from the query.
+        """
+        customer_escaped_field = self.custom_fields["customer_escaped"]
+        start_at = 0
+        while True:
+            page = self.search_page(query=query, start_at=start_at)
+            raw_issues = page.get("issues", [])
+            for raw_issue in raw_issues:
+                yield issue_record_from_json(raw_issue=raw_issue, customer_escaped_field=customer_escaped_field)
+
+            start_at += len(raw_issues)
+            if not raw_issues or start_at >= page.get("total", 0):
+                return
+
+    def request(self, operation: str, func: Callable[[], T]) -> T:
+        """
+        Send a request to Jira through the throttle, retrying throttled, unavailable and failed connections.
+
+        Args:
+            operation (str): Kind of request recorded in the Jira request metrics.
+            func (Callable[[], T]): Function sending the request.
+
+        Returns:
+            T: The result of `func`.
+        """
+        for attempt in range(self.max_retries + 1):
+            slot = self.throttle.acquire()
+            started = time.monotonic()
+            status: Optional[int] = None
+            delay: Optional[float] = None
+            outcome = "error"
+            try:
+                result = func()
+                status, outcome = 200, "success"
+                return result
+            except JIRAError as error:
+                status = error.status_code
+                if status not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise
+                headers = error.response.headers if error.response is not None else {}
+                delay = get_retry_delay(retry_after=headers.get("Retry-After"), attempt=attempt)
+                reason = f"HTTP {status}"
+                outcome = "retry"
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = get_retry_delay(retry_after=None, attempt=attempt)
+                reason = str(error) or error.__class__.__name__
+                outcome = "retry"
+            finally:
+                duration = time.monotonic() - started
+                request_outcome = get_request_outcome(status=status)
+                self.throttle.release(
+                    slot=slot,
+                    outcome=request_outcome,
+                    duration=duration,
+                    retry_after=delay if request_outcome == THROTTLED else None,
+                )
+                record_jira_request(operation=operation, outcome=outcome, duration=duration)
+
+            LOGGER.warning(f"Jira {operation} request failed ({reason}), retrying in {delay:.1f} seconds")
+            # Throttled requests pause all the requests of the throttle instead
+            if status != 429:
+                time.sleep(delay)
+
+        raise RuntimeError(f"Jira {operation} request was not sent")
+
+    def search_page(self, query: str, start_at: int) -> Dict[str, Any]:
         """
-        Performs a Jira JQL query using the Jira connection and returns a list of issues, including all fields.
+        Fetch a single page of the results of a Jira JQL query.
 
         Args:
             query (str): JQL query to execute.
+            start_at (int): Index of the first issue of the page.
 
         Returns:
-            list[Any]: List of Jira issues returned from the query.
+            Dict[str, Any]: JSON of the page, holding the "issues" of the page and the "total" number of issues
+                matching the query.
         """
         try:
-            issues = self.connection.search_issues(jql_str=query, maxResults=False)
-            for issue in issues:
-                issue.is_customer_escaped = self.is_customer_escaped(issue=issue)
-            return issues
+            return self.request(
+                operation="search",
+                func=lambda: self.connection.search_issues(
+                    jql_str=query,
+                    startAt=start_at,
+                    maxResults=SEARCH_PAGE_SIZE,
+                    fields=self.search_fields,
+                    json_result=True,
+                ),
+            )
         except Exception as error:
-            LOGGER.error(f'Failed to execute Jira query "{query}": {error}')
-            raise click.Abort()
+            LOGGER.error(f'Failed to execute Jira query "{query}" starting at {start_at}: {error}')
+            raise
 
-    @staticmethod
-    def is_customer_escaped(issue: Issue) -> bool:
+    def probe_search(self, query: str) -> Optional[SearchProbe]:
         """
+        Count the issues matching a Jira JQL query and get the update time of the most recently updated one, with a
+        single request of one issue.
+
         Args:
-            issue (Issue): Jira Issue
+            query (str): JQL query to probe.
 
         Returns:
-            bool: True if the issue is customer escaped, False otherwise.
+            Optional[SearchProbe]: The query probe, None if the query failed.
         """
         try:
-            return float(getattr(issue.fields, JIRA_CUSTOM_FIELD_MAPPING["customer_escaped"])) > 0
-        except (TypeError, AttributeError):
-            return False
+            page = self.request(
+                operation="probe",
+                func=lambda: self.connection.search_issues(
+                    jql_str=get_probe_query(query=query), maxResults=1, fields=["updated"], json_result=True
+                ),
+            )
+        except Exception as error:
+            LOGGER.error(f'Failed to probe Jira query "{query}": {error}')
+            return None
+        raw_issues = page.get("issues", [])
+        return SearchProbe(
+            total=page.get("total", 0), max_updated=raw_issues[0]["fields"]["updated"] if raw_issues else None
+        )
+
+    def probe_searches(self, queries: List[str]) -> List[Optional[SearchProbe]]:
+        """
+        Probe Jira JQL queries concurrently, at most `max_connections` at a time.
+
+        Args:
+            queries (List[str]): JQL queries to probe.
+
+        Returns:
+            List[Optional[SearchProbe]]: The probe of each query, None for the queries that failed.
+        """
+        return list(self.executor.map(self.probe_search, queries))
+
+
+def get_probe_query(query: str) -> str:
+    """
+    Args:
+        query (str): JQL query.
+
+    Returns:
+        str: The query sorted by descending update time, replacing its own "ORDER BY" clause if any.
+    """
+    for match in JQL_ORDER_BY_REGEX.finditer(query):
+        if match.group().lower().startswith("order"):
+            query = query[: match.start()].rstrip()
+            break
+    return f"{query} ORDER BY updated DESC"
+
+
+def get_search_fields(custom_fields: Dict[str, str], local_filter_fields: bool = False) -> List[str]:
+    """
+    Build the list of Jira fields to request from the "jira_field" info of the JiraIssuesEntity columns.
+
+    Args:
+        custom_fields (Dict[str, str]): Mapping of custom field names to Jira custom field IDs. All the custom fields
+            are requested, including the ones not stored in the database.
+        local_filter_fields (bool): Whether to request the `LOCAL_FILTER_FIELDS` as well.
+
+    Returns:
+        List[str]: Jira fields to request.
+    """
+    search_fields = [
+        custom_fields.get(column.info["jira_field"], column.info["jira_field"])
+        for column in JiraIssuesEntity.__table__.columns
+        if "jira_field" in column.info
+    ]
+    search_fields += [field for field in custom_fields.values() if field not in search_fields]
+    return search_fields + LOCAL_FILTER_FIELDS if local_filter_fields else search_fields
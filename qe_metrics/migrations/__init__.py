@@ -0,0 +1,35 @@
+"""
+Schema migrations of the qe-metrics database, applied in order by `qe_metrics.utils.migration_utils.upgrade_schema`.
+
+A migration is a module named `v<version>_<name>.py` defining a `DESCRIPTION` string and an `upgrade(connection)`
+function. Migrations only use their own table definitions, never the ones of `database_mapping`, and must be idempotent:
+databases created before schema migrations existed already hold some of the changes.
+"""
+
+from types import ModuleType
+from typing import List, NamedTuple
+
+from qe_metrics.migrations import (
+    v0001_initial_schema,
+    v0002_sync_state,
+    v0003_jiraissues_indexes,
+    v0004_issue_count_snapshots,
+    v0005_issue_count_rollups,
+    v0006_jiraissues_content_hash,
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    module: ModuleType
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(version=1, module=v0001_initial_schema),
+    Migration(version=2, module=v0002_sync_state),
+    Migration(version=3, module=v0003_jiraissues_indexes),
+    Migration(version=4, module=v0004_issue_count_snapshots),
+    Migration(version=5, module=v0005_issue_count_rollups),
+    Migration(version=6, module=v0006_jiraissues_content_hash),
+]
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1].version
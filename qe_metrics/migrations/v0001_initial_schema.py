@@ -0,0 +1,35 @@
+"""
+Create the products and jiraissues tables, as created by `Base.metadata.create_all` before schema migrations existed.
+"""
+
+from sqlalchemy import Boolean, Column, Connection, Date, ForeignKey, Integer, MetaData, String, Table
+
+DESCRIPTION = "Create the products and jiraissues tables"
+
+metadata = MetaData()
+Table(
+    "products",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True, nullable=False),
+    Column("name", String, unique=True),
+)
+Table(
+    "jiraissues",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id")),
+    Column("issue_key", String, nullable=False),
+    Column("title", String, nullable=False),
+    Column("url", String, nullable=False),
+    Column("project", String, nullable=False),
+    Column("severity", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("issue_type", String, nullable=False),
+    Column("customer_escaped", Boolean, nullable=False),
+    Column("date_created", Date, nullable=False),
+    Column("last_updated", Date, nullable=False),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(bind=connection, checkfirst=True)
@@ -0,0 +1,31 @@
+"""
+Create the syncstate table holding the last sync of each product query, used by incremental syncs and change detection.
+"""
+
+from sqlalchemy import Column, Connection, DateTime, ForeignKey, Integer, MetaData, String, Table, UniqueConstraint
+
+from qe_metrics.utils.migration_utils import add_missing_columns
+
+DESCRIPTION = "Create the syncstate table"
+
+metadata = MetaData()
+Table("products", metadata, Column("id", Integer, primary_key=True))
+sync_state_table = Table(
+    "syncstate",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("severity", String, nullable=False),
+    Column("query_hash", String, nullable=False),
+    Column("last_synced", DateTime, nullable=False),
+    Column("last_full_sync", DateTime, nullable=False),
+    Column("issue_count", Integer, nullable=True),
+    Column("max_updated", String, nullable=True),
+    UniqueConstraint("product_id", "severity", "query_hash"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    sync_state_table.create(bind=connection, checkfirst=True)
+    # Tables created before change detection lack its columns
+    add_missing_columns(connection=connection, table=sync_state_table)
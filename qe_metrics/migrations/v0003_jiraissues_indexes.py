@@ -0,0 +1,27 @@
+"""
+Index the jiraissues lookups and make (product_id, severity, issue_key) unique, the conflict target of issue upserts.
+"""
+
+from sqlalchemy import Connection, Index, MetaData, Table
+
+from qe_metrics.utils.migration_utils import create_missing_indexes
+
+DESCRIPTION = "Index the jiraissues table"
+
+
+def upgrade(connection: Connection) -> None:
+    table = Table("jiraissues", MetaData(), autoload_with=connection)
+    create_missing_indexes(
+        connection=connection,
+        indexes=[
+            Index(
+                "uq_jiraissues_product_severity_issue_key",
+                table.c.product_id,
+                table.c.severity,
+                table.c.issue_key,
+                unique=True,
+            ),
+            Index("ix_jiraissues_issue_key", table.c.issue_key),
+            Index("ix_jiraissues_last_updated", table.c.last_updated),
+        ],
+    )
@@ -0,0 +1,37 @@
+"""
+Create the issuecountsnapshots table holding the daily issue counts written by `take_issue_count_snapshot`.
+"""
+
+from sqlalchemy import Boolean, Column, Connection, Date, ForeignKey, Index, Integer, MetaData, String, Table
+
+DESCRIPTION = "Create the issuecountsnapshots table"
+
+metadata = MetaData()
+Table("products", metadata, Column("id", Integer, primary_key=True))
+Table(
+    "issuecountsnapshots",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True, nullable=False),
+    Column("snapshot_date", Date, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("severity", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("issue_type", String, nullable=False),
+    Column("customer_escaped", Boolean, nullable=False),
+    Column("issue_count", Integer, nullable=False),
+    Index(
+        "uq_issuecountsnapshots_date_product_group",
+        "snapshot_date",
+        "product_id",
+        "severity",
+        "status",
+        "issue_type",
+        "customer_escaped",
+        unique=True,
+    ),
+    Index("ix_issuecountsnapshots_product_date", "product_id", "snapshot_date"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.tables["issuecountsnapshots"].create(bind=connection, checkfirst=True)
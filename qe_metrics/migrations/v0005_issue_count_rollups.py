@@ -0,0 +1,52 @@
+"""
+Create the issuecountrollups table holding the current issue counts, and fill it from the jiraissues table.
+"""
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Connection,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+)
+
+DESCRIPTION = "Create the issuecountrollups table"
+
+GROUP_COLUMNS = ("product_id", "severity", "status", "issue_type", "customer_escaped")
+
+metadata = MetaData()
+Table("products", metadata, Column("id", Integer, primary_key=True))
+rollups_table = Table(
+    "issuecountrollups",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("severity", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("issue_type", String, nullable=False),
+    Column("customer_escaped", Boolean, nullable=False),
+    Column("issue_count", Integer, nullable=False),
+    Index("uq_issuecountrollups_product_group", *GROUP_COLUMNS, unique=True),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    if inspect(subject=connection).has_table(table_name=rollups_table.name):
+        return
+
+    rollups_table.create(bind=connection)
+    issues_table = Table("jiraissues", MetaData(), autoload_with=connection)
+    group_columns = [issues_table.c[column] for column in GROUP_COLUMNS]
+    connection.execute(
+        insert(rollups_table).from_select(
+            [*GROUP_COLUMNS, "issue_count"], select(*group_columns, func.count()).group_by(*group_columns)
+        )
+    )
@@ -0,0 +1,16 @@
+"""
+Add the content_hash column to the jiraissues table. The next sync of their query only writes the hash of unchanged
+existing rows.
+"""
+
+from sqlalchemy import Column, Connection, MetaData, String, Table
+
+from qe_metrics.utils.migration_utils import add_missing_columns
+
+DESCRIPTION = "Add the jiraissues content_hash column"
+
+issues_table = Table("jiraissues", MetaData(), Column("content_hash", String, nullable=True))
+
+
+def upgrade(connection: Connection) -> None:
+    add_missing_columns(connection=connection, table=issues_table)
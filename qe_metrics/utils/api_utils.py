@@ -0,0 +1,217 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from simple_logger.logger import get_logger
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from qe_metrics.libs.database_mapping import (
+    IssueCountRollupsEntity,
+    IssueCountSnapshotsEntity,
+    JiraIssuesEntity,
+    ProductsEntity,
+)
+from qe_metrics.utils.general import TTLCache, get_cache_dir
+
+LOGGER = get_logger(name=__name__)
+
+# Maximum number of issues returned by a single issues request
+MAX_ISSUES_LIMIT = 1000
+# File touched at the end of every sync, invalidating the cached responses of all the processes of the host
+SYNC_MARKER_FILE = "last-sync"
+# Cached JSON bodies and their ETag, keyed by endpoint and query arguments
+RESPONSE_CACHE: TTLCache[Tuple[str, str]] = TTLCache(
+    max_entries=int(os.environ.get("QE_METRICS_API_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("QE_METRICS_API_CACHE_TTL", 300)),
+)
+_cached_sync_generation = 0
+
+
+def mark_sync_finished() -> None:
+    """
+    Record the end of a sync, so the cached API responses are dropped on their next lookup.
+    """
+    with open(os.path.join(get_cache_dir(), SYNC_MARKER_FILE), "w") as fd:
+        fd.write(date.today().isoformat())
+
+
+def get_sync_generation() -> int:
+    """
+    Returns:
+        int: Modification time of the sync marker file in nanoseconds, 0 if no sync finished yet.
+    """
+    try:
+        return os.stat(os.path.join(get_cache_dir(), SYNC_MARKER_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def cached_json(key: Tuple[Any, ...], query: Callable[[], Any]) -> Tuple[str, str]:
+    """
+    Get the JSON body of an API response and its ETag, running `query` only when the body is not cached.
+
+    The cache is cleared when a sync finished since the bodies were cached.
+
+    Args:
+        key (Tuple[Any, ...]): Endpoint and query arguments identifying the response.
+        query (Callable[[], Any]): Returns the JSON-serializable response data.
+
+    Returns:
+        Tuple[str, str]: The JSON body and its ETag.
+    """
+    global _cached_sync_generation
+
+    if (sync_generation := get_sync_generation()) != _cached_sync_generation:
+        RESPONSE_CACHE.clear()
+        _cached_sync_generation = sync_generation
+
+    if (cached := RESPONSE_CACHE.get(key=key)) is not None:
+        return cached
+
+    body = json.dumps(query(), sort_keys=True, default=str)
+    response = (body, hashlib.sha256(body.encode("utf-8")).hexdigest())
+    RESPONSE_CACHE.set(key=key, value=response)
+    return response
+
+
+def _filter_products(statement: Select[Any], entity: Any, products: List[str], severities: List[str]) -> Select[Any]:
+    statement = statement.join(ProductsEntity, ProductsEntity.id == entity.product_id)
+    if products:
+        statement = statement.where(ProductsEntity.name.in_(products))
+    if severities:
+        statement = statement.where(entity.severity.in_(severities))
+    return statement
+
+
+def get_issue_counts(db_session: Session, products: List[str], severities: List[str]) -> List[Dict[str, Any]]:
+    """
+    Get the current number of issues of each product, severity, status, issue type and customer escaped flag.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        products (List[str]): Names of the products to return, all products if empty.
+        severities (List[str]): Severities to return, all severities if empty.
+
+    Returns:
+        List[Dict[str, Any]]: The issue counts, read from the issue count rollup.
+    """
+    statement = _filter_products(
+        statement=select(
+            ProductsEntity.name.label("product"),
+            IssueCountRollupsEntity.severity,
+            IssueCountRollupsEntity.status,
+            IssueCountRollupsEntity.issue_type,
+            IssueCountRollupsEntity.customer_escaped,
+            IssueCountRollupsEntity.issue_count,
+        ),
+        entity=IssueCountRollupsEntity,
+        products=products,
+        severities=severities,
+    ).order_by(ProductsEntity.name, IssueCountRollupsEntity.severity, IssueCountRollupsEntity.status)
+    return [dict(row._mapping) for row in db_session.execute(statement)]
+
+
+def get_issue_count_trend(
+    db_session: Session, products: List[str], severities: List[str], days: int
+) -> List[Dict[str, Any]]:
+    """
+    Get the daily number of issues of each product, severity and status over the last `days` days.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        products (List[str]): Names of the products to return, all products if empty.
+        severities (List[str]): Severities to return, all severities if empty.
+        days (int): Number of days to return.
+
+    Returns:
+        List[Dict[str, Any]]: The issue counts, read from the issue count snapshots.
+    """
+    statement = (
+        _filter_products(
+            statement=select(
+                IssueCountSnapshotsEntity.snapshot_date,
+                ProductsEntity.name.label("product"),
+                IssueCountSnapshotsEntity.severity,
+                IssueCountSnapshotsEntity.status,
+                func.sum(IssueCountSnapshotsEntity.issue_count).label("issue_count"),
+            ),
+            entity=IssueCountSnapshotsEntity,
+            products=products,
+            severities=severities,
+        )
+        .where(IssueCountSnapshotsEntity.snapshot_date > date.today() - timedelta(days=days))
+        .group_by(
+            IssueCountSnapshotsEntity.snapshot_date,
+            ProductsEntity.name,
+            IssueCountSnapshotsEntity.severity,
+            IssueCountSnapshotsEntity.status,
+        )
+        .order_by(IssueCountSnapshotsEntity.snapshot_date, ProductsEntity.name, IssueCountSnapshotsEntity.severity)
+    )
+    return [dict(row._mapping) for row in db_session.execute(statement)]
+
+
+def validate_page(limit: int, offset: int) -> None:
+    """
+    Args:
+        limit (int): Maximum number of items to return.
+        offset (int): Number of items to skip.
+
+    Raises:
+        ValueError: If `limit` is negative or greater than `MAX_ISSUES_LIMIT`, or `offset` is negative.
+    """
+    if not 0 <= limit <= MAX_ISSUES_LIMIT:
+        raise ValueError(f"limit must be between 0 and {MAX_ISSUES_LIMIT}, got {limit}")
+    if offset < 0:
+        raise ValueError(f"offset must not be negative, got {offset}")
+
+
+def get_issues(
+    db_session: Session, products: List[str], severities: List[str], statuses: List[str], limit: int, offset: int
+) -> List[Dict[str, Any]]:
+    """
+    Get the stored issues, most recently updated first.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        products (List[str]): Names of the products to return, all products if empty.
+        severities (List[str]): Severities to return, all severities if empty.
+        statuses (List[str]): Statuses to return, all statuses if empty.
+        limit (int): Maximum number of issues to return, at most `MAX_ISSUES_LIMIT`.
+        offset (int): Number of issues to skip.
+
+    Returns:
+        List[Dict[str, Any]]: The issues.
+
+    Raises:
+        ValueError: If `limit` or `offset` is out of range, see `validate_page`.
+    """
+    validate_page(limit=limit, offset=offset)
+    statement = _filter_products(
+        statement=select(
+            ProductsEntity.name.label("product"),
+            JiraIssuesEntity.issue_key,
+            JiraIssuesEntity.title,
+            JiraIssuesEntity.url,
+            JiraIssuesEntity.project,
+            JiraIssuesEntity.severity,
+            JiraIssuesEntity.status,
+            JiraIssuesEntity.issue_type,
+            JiraIssuesEntity.customer_escaped,
+            JiraIssuesEntity.date_created,
+            JiraIssuesEntity.last_updated,
+        ),
+        entity=JiraIssuesEntity,
+        products=products,
+        severities=severities,
+    )
+    if statuses:
+        statement = statement.where(JiraIssuesEntity.status.in_(statuses))
+    statement = (
+        statement.order_by(JiraIssuesEntity.last_updated.desc(), JiraIssuesEntity.id).limit(limit).offset(offset)
+    )
+    return [dict(row._mapping) for row in db_session.execute(statement)]
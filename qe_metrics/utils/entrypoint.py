@@ -1,71 +1,431 @@
 from __future__ import annotations
-from typing import Dict, List
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
 
 
 from pyaml_env import parse_config
 from simple_logger.logger import get_logger
 from qe_metrics.libs.database import Database
-from qe_metrics.libs.jira import Jira
+from qe_metrics.libs.database_mapping import ProductsEntity, SyncStateEntity
+from qe_metrics.libs.async_jira import AsyncJira
+from qe_metrics.libs.jira import Jira, JiraIssueRecord, SearchProbe
+from qe_metrics.utils.api_utils import mark_sync_finished
+from qe_metrics.utils.general import ClosableIterator, file_lock, get_cache_dir
 from qe_metrics.utils.issue_utils import create_update_issues, delete_old_issues
-from qe_metrics.utils.product_utils import append_last_updated_arg, process_products, get_products_dict
+from qe_metrics.utils.metrics_utils import METRICS, save_metrics
+from qe_metrics.utils.search_utils import probe_searches, stream_searches
+from qe_metrics.utils.snapshot_utils import take_issue_count_snapshot
+from qe_metrics.utils.product_utils import Shard, append_last_updated_arg, process_products, get_products_dict
+from qe_metrics.utils.sync_utils import (
+    build_sync_query,
+    get_sync_state,
+    is_query_unchanged,
+    save_sync_state,
+    utc_now,
+)
+from pyhelper_utils.general import tts
 from pyhelper_utils.notifications import send_slack_message
 
 
 LOGGER = get_logger(name="main-qe-metrics")
+# Held by the running sync, so syncs started by the scheduler, the /update endpoint and the CLI never overlap
+SYNC_LOCK_FILE = "sync.lock"
+
+
+class SyncResult(NamedTuple):
+    """
+    Errors and statistics of the sync of the queries of some products.
+    """
+
+    errors: List[str]
+    queries: int = 0
+    skipped_queries: int = 0
+    inserted: int = 0
+    updated: int = 0
+    obsoleted: int = 0
+
+    def merge(self, other: "SyncResult") -> "SyncResult":
+        return SyncResult(
+            self.errors + other.errors, *(count + other_count for count, other_count in zip(self[1:], other[1:]))
+        )
+
+    def summary(self) -> str:
+        return (
+            f"{self.queries} queries synced, {self.skipped_queries} skipped; {self.inserted} new, "
+            f"{self.updated} updated, {self.obsoleted} obsolete issues"
+        )
 
 
 def qe_metrics(
-    config_file: str, verbose_db: bool, products_file: str | None = None, products_file_url: bool = False
-) -> None:
-    """Gather QE Metrics"""
-    errors_for_slack: List[str] = []
+    config_file: str,
+    verbose_db: bool,
+    products_file: str | None = None,
+    products_file_url: bool = False,
+    progress: Callable[[int, int], None] | None = None,
+    products: List[str] | None = None,
+    severities: List[str] | None = None,
+    shard: Shard | None = None,
+    started: Callable[[], None] | None = None,
+) -> List[str]:
+    """
+    Gather QE Metrics, waiting for the sync running in another thread or process of the host to finish first.
+
+    `started` is called once the sync lock is taken, the other arguments are the ones of `sync_qe_metrics`.
+
+    Returns:
+        List[str]: The errors of the products and stages that failed, empty if the sync succeeded.
+    """
+    with file_lock(path=os.path.join(get_cache_dir(), SYNC_LOCK_FILE)):
+        if started:
+            started()
+        outcome = "failure"
+        try:
+            with METRICS.timer("qe_metrics_stage_duration_seconds", stage="sync"):
+                errors = sync_qe_metrics(
+                    config_file=config_file,
+                    verbose_db=verbose_db,
+                    products_file=products_file,
+                    products_file_url=products_file_url,
+                    progress=progress,
+                    products=products,
+                    severities=severities,
+                    shard=shard,
+                )
+            outcome = "partial_failure" if errors else "success"
+            if not errors:
+                METRICS.set("qe_metrics_last_success_timestamp_seconds", time.time())
+            return errors
+        finally:
+            METRICS.inc("qe_metrics_runs_total", outcome=outcome)
+            save_metrics()
+
+
+def sync_qe_metrics(
+    config_file: str,
+    verbose_db: bool,
+    products_file: str | None = None,
+    products_file_url: bool = False,
+    progress: Callable[[int, int], None] | None = None,
+    products: List[str] | None = None,
+    severities: List[str] | None = None,
+    shard: Shard | None = None,
+) -> List[str]:
+    """
+    Gather QE Metrics.
+
+    When products or severities are filtered, only the matching queries are synced and the retention policy is not
+    enforced, so the other products are left untouched.
+
+    The products are synced by `sync.processes` worker processes, each syncing a shard of the products. When `shard`
+    is set, only the products of that shard are synced, and the retention policy and issue count snapshot are left to
+    the first shard.
+
+    Args:
+        config_file (str): Path of the configuration file.
+        verbose_db (bool): Verbose output of the database connection.
+        products_file (str | None): Path of the products file.
+        products_file_url (bool): Whether to fetch the products from the products repository.
+        progress (Callable[[int, int], None] | None): Called with the number of completed and total Jira queries, or
+            of completed and total shards when the products are synced by several processes.
+        products (List[str] | None): Shell-style patterns of the products to sync, all if empty.
+        severities (List[str] | None): Shell-style patterns of the severities to sync, all if empty.
+        shard (Shard | None): Shard of the products to sync, all if None.
+
+    Returns:
+        List[str]: The errors of the products and stages that failed, empty if the sync succeeded.
+    """
     config = parse_config(path=config_file)
     data_retention_days: int = config["database"].get("data_retention_days", 90)
+    snapshot_retention_days: int = config["database"].get("snapshot_retention_days", 730)
     slack_config: Dict[str, str] = config.get("slack", {})
     slack_webhook_url: str = slack_config.get("webhook_url", "")
     slack_webhook_error_url: str = slack_config.get("webhook_error_url", "")
+    processes: int = config.get("sync", {}).get("processes", 1)
+    partial_sync = bool(products or severities)
+    # Verifies the schema before the worker processes connect to the database
     db = Database(config_file=config_file, verbose=verbose_db)
-    _products_dict = get_products_dict(products_file=products_file, products_file_url=products_file_url)
+    with METRICS.timer("qe_metrics_stage_duration_seconds", stage="fetch_products"):
+        _products_dict = get_products_dict(products_file=products_file, products_file_url=products_file_url)
+
+    synced_at = utc_now()
+    sync_kwargs: Dict[str, Any] = {
+        "config_file": config_file,
+        "verbose_db": verbose_db,
+        "products_dict": _products_dict,
+        "synced_at": synced_at,
+        "products": products,
+        "severities": severities,
+    }
+    if shard is None and processes > 1:
+        result = sync_shards(processes=processes, progress=progress, **sync_kwargs)
+    else:
+        result = sync_products(shard=shard, progress=progress, **sync_kwargs)
+
+    if result is None:
+        if partial_sync or shard:
+            error = f"No products found matching products {products}, severities {severities} and shard {shard}"
+        else:
+            error = "No products found in config file"
+        LOGGER.error(error)
+        return [error]
+
+    errors_for_slack = result.errors
+    with db.session() as db_session:
+        if partial_sync:
+            LOGGER.info("Skipping the deletion of old issues, only some products or severities were synced")
+        elif shard and shard.number != 1:
+            LOGGER.info(f"Skipping the deletion of old issues, left to shard 1/{shard.total}")
+        else:
+            with METRICS.timer("qe_metrics_stage_duration_seconds", stage="delete_old_issues"):
+                if not delete_old_issues(days_old=data_retention_days, db_session=db_session):
+                    errors_for_slack.append("Failed to delete old issues")
+
+        if shard and shard.number != 1:
+            LOGGER.info(f"Skipping the issue count snapshot, left to shard 1/{shard.total}")
+        else:
+            with METRICS.timer("qe_metrics_stage_duration_seconds", stage="issue_count_snapshot"):
+                if not take_issue_count_snapshot(
+                    snapshot_date=synced_at.date(), retention_days=snapshot_retention_days, db_session=db_session
+                ):
+                    errors_for_slack.append("Failed to store the issue count snapshot")
+
+    mark_sync_finished()
+    LOGGER.info(f"qe-metrics sync{f' of shard {shard}' if shard else ''} finished: {result.summary()}")
+
+    shard_prefix = f"Shard {shard}: " if shard else ""
+    if errors_for_slack and slack_webhook_error_url:
+        send_slack_message(
+            webhook_url=slack_webhook_error_url,
+            message=shard_prefix + "\n".join(errors_for_slack),
+            raise_on_error=False,
+            logger=LOGGER,
+        )
+    elif slack_webhook_url:
+        send_slack_message(
+            webhook_url=slack_webhook_url,
+            message=f"{shard_prefix}Successfully executeed qe-metrics: {result.summary()}",
+            raise_on_error=False,
+            logger=LOGGER,
+        )
+
+    return errors_for_slack
+
+
+def sync_shards(
+    processes: int, progress: Callable[[int, int], None] | None = None, **sync_kwargs: Any
+) -> SyncResult | None:
+    """
+    Sync the products split into `processes` shards, each synced by a worker process with its own Jira session and
+    database connections. The metrics of the workers are added to the metrics of this process.
+
+    Args:
+        processes (int): Number of shards and worker processes.
+        progress (Callable[[int, int], None] | None): Called with the number of completed and total shards.
+        **sync_kwargs (Any): Keyword arguments of `sync_products`, besides the shard and progress.
+
+    Returns:
+        SyncResult | None: The merged results of the shards, None if no shard had products to sync.
+    """
+    result: SyncResult | None = None
+    # Worker processes are spawned rather than forked, since the sync may run in a thread of the web server
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures: Dict[Future[Tuple[SyncResult | None, Dict[str, Any]]], Shard] = {}
+        for number in range(1, processes + 1):
+            shard = Shard(number=number, total=processes)
+            futures[executor.submit(sync_shard, shard=shard, **sync_kwargs)] = shard
+        if progress:
+            progress(0, processes)
+        for completed_shards, future in enumerate(as_completed(futures), start=1):
+            try:
+                shard_result, metrics_snapshot = future.result()
+                METRICS.merge(snapshot=metrics_snapshot)
+            except Exception as ex:
+                err_msg = f"Failed to sync the products of shard {futures[future]}: {ex}"
+                LOGGER.error(err_msg)
+                shard_result = SyncResult(errors=[err_msg])
 
-    with db.session() as db_session, Jira(config_file=config_file) as jira:
-        _proccess_products = process_products(products_dict=_products_dict, db_session=db_session)
+            if shard_result is not None:
+                result = shard_result if result is None else result.merge(other=shard_result)
+            if progress:
+                progress(completed_shards, processes)
+    return result
+
+
+def sync_shard(**sync_kwargs: Any) -> Tuple[SyncResult | None, Dict[str, List[Tuple[Dict[str, str], Any]]]]:
+    """
+    Sync the products of a shard in a worker process.
+
+    Args:
+        **sync_kwargs (Any): Keyword arguments of `sync_products`.
+
+    Returns:
+        Tuple[SyncResult | None, Dict[str, List[Tuple[Dict[str, str], Any]]]]: The result of `sync_products` and a
+            snapshot of the metrics of the worker process.
+    """
+    METRICS.clear()
+    return sync_products(**sync_kwargs), METRICS.snapshot()
+
+
+def sync_products(
+    config_file: str,
+    verbose_db: bool,
+    products_dict: Dict[str, Dict[str, str]],
+    synced_at: datetime,
+    progress: Callable[[int, int], None] | None = None,
+    products: List[str] | None = None,
+    severities: List[str] | None = None,
+    shard: Shard | None = None,
+) -> SyncResult | None:
+    """
+    Sync the issues of the queries of the products.
+
+    Args:
+        config_file (str): Path of the configuration file.
+        verbose_db (bool): Verbose output of the database connection.
+        products_dict (Dict[str, Dict[str, str]]): Products and their queries.
+        synced_at (datetime): Start time of the sync, stored as the last sync of the queries.
+        progress (Callable[[int, int], None] | None): Called with the number of completed and total Jira queries.
+        products (List[str] | None): Shell-style patterns of the products to sync, all if empty.
+        severities (List[str] | None): Shell-style patterns of the severities to sync, all if empty.
+        shard (Shard | None): Shard of the products to sync, all if None.
+
+    Returns:
+        SyncResult | None: Errors and statistics of the sync, None if no product matched.
+    """
+    errors: List[str] = []
+    stats: Dict[str, int] = {"queries": 0, "skipped_queries": 0, "inserted": 0, "updated": 0, "obsoleted": 0}
+    config = parse_config(path=config_file)
+    data_retention_days: int = config["database"].get("data_retention_days", 90)
+    max_workers: int = config.get("max_workers", 5)
+    sync_config: Dict[str, Any] = config.get("sync", {})
+    incremental_sync: bool = sync_config.get("incremental", False)
+    skip_unchanged: bool = sync_config.get("skip_unchanged", False)
+    local_subset_queries: bool = sync_config.get("local_subset_queries", False)
+    track_sync_state = incremental_sync or skip_unchanged
+    full_sync_interval = timedelta(seconds=tts(ts=sync_config.get("full_sync_interval", "168h")))
+    db = Database(config_file=config_file, verbose=verbose_db)
+
+    jira_class = AsyncJira if config["jira"].get("backend") == "async" else Jira
+    with (
+        db.session() as db_session,
+        jira_class(
+            config_file=config_file, max_connections=max_workers, local_filter_fields=local_subset_queries
+        ) as jira,
+    ):
+        _proccess_products = process_products(
+            products_dict=products_dict,
+            db_session=db_session,
+            products_filter=products,
+            severities_filter=severities,
+            shard=shard,
+        )
 
         if not _proccess_products:
-            LOGGER.error("No products found in config file")
-            return
+            return None
 
+        sync_jobs: List[Tuple[ProductsEntity, str, str, str, SyncStateEntity | None]] = []
         for product_dict in _proccess_products:
             product, queries = product_dict.values()
             for severity, query in queries.items():
-                LOGGER.info(f'Executing Jira query for "{product.name}" with severity "{severity}"')
+                if not (full_query := append_last_updated_arg(query=query, look_back_days=data_retention_days)):
+                    continue
+
+                sync_state = (
+                    get_sync_state(product=product, severity=severity, query=query, db_session=db_session)
+                    if track_sync_state
+                    else None
+                )
+                sync_jobs.append((product, severity, query, full_query, sync_state))
+
+        probes: List[SearchProbe | None] = [None] * len(sync_jobs)
+        if skip_unchanged:
+            with METRICS.timer("qe_metrics_stage_duration_seconds", stage="probe_searches"):
+                probes = probe_searches(jira=jira, queries=[full_query for *_, full_query, _ in sync_jobs])
+
+        planned_searches: List[Tuple[ProductsEntity, str, str, str, bool, SearchProbe | None]] = []
+        for (product, severity, query, full_query, sync_state), probe in zip(sync_jobs, probes):
+            if sync_state and is_query_unchanged(
+                sync_state=sync_state, probe=probe, full_sync_interval=full_sync_interval, now=synced_at
+            ):
+                LOGGER.info(f'Skipping Jira query for "{product.name}" with severity "{severity}", no issue changed')
+                sync_state.last_synced = synced_at
+                stats["skipped_queries"] += 1
+                continue
+
+            full_sync = True
+            if incremental_sync:
+                full_query, full_sync = build_sync_query(
+                    query=full_query, sync_state=sync_state, full_sync_interval=full_sync_interval, now=synced_at
+                )
+            LOGGER.info(
+                f'Executing {"full" if full_sync else "incremental"} Jira query for "{product.name}" with severity "{severity}"'
+            )
+            planned_searches.append((product, severity, query, full_query, full_sync, probe))
+        db_session.commit()
+
+        # Jira searches run concurrently, at most `max_workers` at a time, and stream their issues to this thread,
+        # which writes them to the database one query at a time
+        searches: List[Tuple[ProductsEntity, str, str, bool, SearchProbe | None, ClosableIterator[JiraIssueRecord]]] = [
+            (product, severity, query, full_sync, probe, issues)
+            for (product, severity, query, _, full_sync, probe), issues in zip(
+                planned_searches,
+                stream_searches(
+                    jira=jira,
+                    queries=[(query, full_query) for _, _, query, full_query, *_ in planned_searches],
+                    local_subsets=local_subset_queries,
+                ),
+            )
+        ]
+
+        try:
+            for completed_searches, (product, severity, query, full_sync, probe, issues) in enumerate(searches):
+                if progress:
+                    progress(completed_searches, len(searches))
                 try:
-                    if query := append_last_updated_arg(query=query, look_back_days=data_retention_days):
-                        create_update_issues(
-                            issues=jira.search(query=query),
-                            product=product,
+                    with issues:
+                        if track_sync_state:
+                            save_sync_state(
+                                product=product,
+                                severity=severity,
+                                query=query,
+                                synced_at=synced_at,
+                                full_sync=full_sync,
+                                db_session=db_session,
+                                probe=probe,
+                            )
+                        # Includes the time spent waiting for the issues streamed from Jira
+                        with METRICS.timer(
+                            "qe_metrics_query_duration_seconds",
+                            stage="create_update_issues",
+                            product=product.name,
                             severity=severity,
-                            jira_server=jira.jira_config["server"],
-                            db_session=db_session,
-                        )
+                        ):
+                            change_set = create_update_issues(
+                                issues=issues,
+                                product=product,
+                                severity=severity,
+                                jira_server=jira.jira_config["server"],
+                                db_session=db_session,
+                                mark_obsolete=full_sync,
+                            )
+                    stats["queries"] += 1
+                    stats["inserted"] += len(change_set.inserted)
+                    stats["updated"] += len(change_set.updated)
+                    stats["obsoleted"] += len(change_set.obsoleted)
                 except Exception as ex:
+                    db_session.rollback()
                     err_msg = f'Failed to update issues for "{product.name}" with severity "{severity}": {ex}'
                     LOGGER.error(err_msg)
-                    errors_for_slack.append(err_msg)
-
-        if not delete_old_issues(days_old=data_retention_days, db_session=db_session):
-            errors_for_slack.append("Failed to delete old issues")
+                    errors.append(err_msg)
+            if progress:
+                progress(len(searches), len(searches))
+        finally:
+            # Stop the searches left running if writing to the database was interrupted
+            for *_, issues in searches:
+                issues.close()
 
-        if errors_for_slack and slack_webhook_error_url:
-            send_slack_message(
-                webhook_url=slack_webhook_error_url,
-                message="\n".join(errors_for_slack),
-                raise_on_error=False,
-                logger=LOGGER,
-            )
-        elif slack_webhook_url:
-            send_slack_message(
-                webhook_url=slack_webhook_url,
-                message="Successfully executeed qe-metrics",
-                raise_on_error=False,
-                logger=LOGGER,
-            )
+    return SyncResult(errors=errors, **stats)
@@ -1,5 +1,15 @@
+import abc
+import fcntl
 import os
-from typing import Any, Dict, List
+from fnmatch import fnmatchcase
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Executor
+from itertools import islice
+from queue import Empty, Full, Queue
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 
 from simple_logger.logger import get_logger
@@ -7,6 +17,10 @@ from simple_logger.logger import get_logger
 
 LOGGER = get_logger(name="general")
 
+T = TypeVar("T")
+# Marks the end of the items produced by an `ExecutorIterator`
+_END_OF_ITEMS = object()
+
 
 def verify_config(config: Dict[str, Any], required_keys: List[str]) -> None:
     """
@@ -56,5 +70,207 @@ def verify_queries(queries_dict: Dict[str, str]) -> None:
         raise ValueError(f"Extra queries in the products file: {' '.join(extra_queries)}")
 
 
+def matches_any(value: str, patterns: List[str]) -> bool:
+    """
+    Args:
+        value (str): Value to match, e.g. a product name.
+        patterns (List[str]): Case-sensitive shell-style patterns, e.g. "openshift-*".
+
+    Returns:
+        bool: True if `value` matches one of the patterns, or if there are no patterns.
+    """
+    return not patterns or any(fnmatchcase(value, pattern) for pattern in patterns)
+
+
 def run_in_verbose() -> bool:
     return True if os.environ.get("QE_METRICS_VERBOSE") else False
+
+
+def get_cache_dir() -> str:
+    """
+    Get the directory holding the files qe-metrics keeps between runs, creating it if needed.
+
+    Returns:
+        str: Path of the directory set in QE_METRICS_CACHE_DIR, "/tmp/qe-metrics-cache" by default.
+    """
+    cache_dir = os.environ.get("QE_METRICS_CACHE_DIR", "/tmp/qe-metrics-cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a file, waiting for the processes holding it to release it.
+
+    Args:
+        path (str): Path of the lock file, created if needed.
+    """
+    with open(path, "a") as lock_fd:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split an iterable into lists of at most `size` items.
+
+    Args:
+        iterable (Iterable[T]): Items to split.
+        size (int): Maximum number of items in each chunk.
+
+    Yields:
+        List[T]: The next chunk of items.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ClosableIterator(Iterator[T], abc.ABC):
+    """
+    An iterator over items produced in the background, which must be closed to stop producing them.
+    """
+
+    def __enter__(self) -> "ClosableIterator[T]":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """
+        Stop producing items.
+        """
+
+
+class ExecutorIterator(ClosableIterator[T]):
+    """
+    Iterate over `func(**kwargs)` in an executor worker and return its items in the consuming thread.
+
+    The worker buffers at most `max_buffered` items ahead of the consumer and stops once the iterator is closed.
+    Exceptions raised by `func` are re-raised in the consuming thread.
+    """
+
+    def __init__(self, executor: Executor, func: Callable[..., Iterable[T]], max_buffered: int, **kwargs: Any) -> None:
+        """
+        Start the iteration in an executor worker.
+
+        Args:
+            executor (Executor): Executor running the iteration.
+            func (Callable[..., Iterable[T]]): Function returning the items to iterate over.
+            max_buffered (int): Maximum number of items buffered by the worker.
+            **kwargs (Any): Keyword arguments passed to `func`.
+        """
+        self._buffer: Queue[Any] = Queue(maxsize=max_buffered)
+        self._stopped = Event()
+        self._func = func
+        self._kwargs = kwargs
+        executor.submit(self._produce)
+
+    def __next__(self) -> T:
+        if self._stopped.is_set():
+            raise StopIteration
+
+        item = self._buffer.get()
+        if item is _END_OF_ITEMS:
+            self.close()
+            raise StopIteration
+
+        if isinstance(item, Exception):
+            self.close()
+            raise item
+
+        return item
+
+    def close(self) -> None:
+        """
+        Stop the worker and drop the buffered items.
+        """
+        self._stopped.set()
+        try:
+            while True:
+                self._buffer.get_nowait()
+        except Empty:
+            pass
+
+    def _put(self, item: Any) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._buffer.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self) -> None:
+        try:
+            for item in self._func(**self._kwargs):
+                if not self._put(item=item):
+                    return
+        except Exception as ex:
+            self._put(item=ex)
+            return
+        self._put(item=_END_OF_ITEMS)
+
+
+class TTLCache(Generic[T]):
+    """
+    A thread-safe LRU cache whose entries expire `ttl` seconds after being stored.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        """
+        Args:
+            max_entries (int): Maximum number of entries, the least recently used entry is evicted beyond it.
+            ttl (float): Number of seconds an entry is kept.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, Tuple[float, T]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """
+        Args:
+            key (Hashable): Key of the entry.
+
+        Returns:
+            Optional[T]: The value of the entry, or None if it is missing or expired.
+        """
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: T) -> None:
+        """
+        Store an entry, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): Key of the entry.
+            value (T): Value of the entry.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all the entries.
+        """
+        with self._lock:
+            self._entries.clear()
@@ -1,134 +1,385 @@
-from datetime import datetime, date, timedelta
+from __future__ import annotations
+import hashlib
+from datetime import datetime, timedelta
 from pyhelper_utils.general import ignore_exceptions
-from typing import List
-from jira import Issue
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Set, Tuple, cast
 from qe_metrics.libs.database_mapping import ProductsEntity, JiraIssuesEntity
+from qe_metrics.libs.jira import JiraIssueRecord
+from qe_metrics.utils.general import chunked
+from qe_metrics.utils.metrics_utils import METRICS
+from qe_metrics.utils.rollup_utils import subtract_issues_from_rollup, update_issue_count_rollup
+from qe_metrics.utils.partition_utils import (
+    PARTITION_MONTHS_AHEAD,
+    create_issue_partitions,
+    drop_expired_issue_partitions,
+    is_issues_table_partitioned,
+    month_start,
+)
 from simple_logger.logger import get_logger
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from sqlalchemy import select, insert, delete
+from sqlalchemy import Column, CursorResult, MetaData, Row, String, Table, select, insert, update, delete
 
 LOGGER = get_logger(name=__name__)
 
 OBSOLETE_STR = "obsolete"
+# Number of rows per multi-row statement / keys per `IN` lookup, within the bind parameter limits of SQLite and
+# PostgreSQL
+CHUNK_SIZE = 1000
+# Fields of an existing issue that are refreshed from Jira, covered by its content hash
+ISSUE_UPDATE_FIELDS = ("title", "status", "issue_type", "customer_escaped", "last_updated")
+# Columns identifying an issue row, covered by a unique index
+ISSUE_UNIQUE_KEY = ("product_id", "severity", "issue_key")
+# Holds the current issue keys when there are too many of them for an `IN` list
+CURRENT_ISSUE_KEYS_TABLE = Table(
+    "tmp_current_issue_keys", MetaData(), Column("issue_key", String, primary_key=True), prefixes=["TEMPORARY"]
+)
+# Number of expired issues deleted per statement by the retention cleanup
+RETENTION_BATCH_SIZE = 10000
+DIALECT_INSERTS: Dict[str, Callable[..., Any]] = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 
-def format_issue_date(date_str: str) -> date:
+class IssueChangeSet(NamedTuple):
     """
-    Format the date in the format YYYY-MM-DD.
+    Changes written by `create_update_issues` for a product and severity, keyed by issue key.
 
-    Args:
-        date_str (str): Date string from Jira.Issue
-
-    Returns:
-        date: Date object for database insertion
+    "inserted" holds the rows of the new issues, "updated" the values of `ISSUE_UPDATE_FIELDS` before and after the
+    update of the changed issues, and "obsoleted" the values of `ISSUE_UPDATE_FIELDS` of the issues marked as obsolete,
+    before they were marked.
     """
-    return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%f%z").date()
+
+    product_id: int
+    severity: str
+    inserted: Dict[str, Dict[str, Any]]
+    updated: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]
+    obsoleted: Dict[str, Dict[str, Any]]
+
+    def issue_count_deltas(self) -> Counter[Tuple[Any, ...]]:
+        """
+        Returns:
+            Counter[Tuple[Any, ...]]: Changes of the issue counts keyed by the values of `ISSUE_COUNT_GROUP_COLUMNS`.
+        """
+
+        def _group(values: Dict[str, Any]) -> Tuple[Any, ...]:
+            return (self.product_id, self.severity, values["status"], values["issue_type"], values["customer_escaped"])
+
+        deltas: Counter[Tuple[Any, ...]] = Counter()
+        for issue_row in self.inserted.values():
+            deltas[_group(values=issue_row)] += 1
+        for old_values, new_values in self.updated.values():
+            deltas[_group(values=old_values)] -= 1
+            deltas[_group(values=new_values)] += 1
+        for old_values in self.obsoleted.values():
+            deltas[_group(values=old_values)] -= 1
+            deltas[_group(values={**old_values, "status": OBSOLETE_STR})] += 1
+        return deltas
 
 
 def mark_obsolete_issues(
-    current_issues: List[Issue],
-    db_issues: List["JiraIssuesEntity"],
-    product: "ProductsEntity",  # type: ignore  # noqa: F821
+    current_issue_keys: Set[str],
+    product: "ProductsEntity",
+    severity: str,
     db_session: Session,
-) -> None:
+    change_set: IssueChangeSet | None = None,
+) -> int:
     """
-    Mark JiraIssuesEntity items as "obsolete" in the database that are not in the current list of issues.
+    Mark JiraIssuesEntity items of a product and severity as "obsolete" if they are not in the current set of issue
+    keys.
+
+    The issues are updated with a single set-based UPDATE. When there are more than `CHUNK_SIZE` current issue keys,
+    they are loaded into a temporary table instead of being sent as an `IN` list.
 
     Args:
-        current_issues (List[Issue]): A list of current Jira issues for a product.
-        db_issues ("JiraIssuesEntity"): A list of JiraIssuesEntity objects already in the database.
+        current_issue_keys (Set[str]): Keys of the current Jira issues of the product and severity.
         product ("ProductsEntity"): The product object to which the issues belong.
+        severity (str): Severity of the issues
         db_session (Session): SQLAlchemy Session instance.
+        change_set (IssueChangeSet | None): Change set the obsolete issues are added to, with their previous values.
+
+    Returns:
+        int: Number of issues marked as obsolete
     """
-    current_issue_keys = {issue.key for issue in current_issues}
-    db_issue_keys = {db_issue.issue_key for db_issue in db_issues if db_issue.product.name == product.name}
-    closed_issue_keys = db_issue_keys - current_issue_keys
+    conditions = [
+        JiraIssuesEntity.product_id == product.id,
+        JiraIssuesEntity.severity == severity,
+        JiraIssuesEntity.status != OBSOLETE_STR,
+    ]
+    connection = None
+    if len(current_issue_keys) <= CHUNK_SIZE:
+        conditions.append(JiraIssuesEntity.issue_key.not_in(current_issue_keys))
+    else:
+        connection = db_session.connection()
+        CURRENT_ISSUE_KEYS_TABLE.create(bind=connection, checkfirst=True)
+        db_session.execute(statement=delete(CURRENT_ISSUE_KEYS_TABLE))
+        for issue_keys in chunked(iterable=current_issue_keys, size=CHUNK_SIZE):
+            db_session.execute(
+                statement=insert(CURRENT_ISSUE_KEYS_TABLE).values([
+                    {"issue_key": issue_key} for issue_key in issue_keys
+                ])
+            )
+        conditions.append(JiraIssuesEntity.issue_key.not_in(select(CURRENT_ISSUE_KEYS_TABLE.c.issue_key)))
+
+    if change_set is not None:
+        columns = [getattr(JiraIssuesEntity, field) for field in ISSUE_UPDATE_FIELDS]
+        for db_issue in db_session.execute(select(JiraIssuesEntity.issue_key, *columns).where(*conditions)):
+            change_set.obsoleted[db_issue.issue_key] = {
+                field: getattr(db_issue, field) for field in ISSUE_UPDATE_FIELDS
+            }
+
+    result = cast(
+        CursorResult[Any],
+        # The content hash no longer matches the stored fields, so an issue coming back is compared and updated
+        db_session.execute(
+            statement=update(JiraIssuesEntity).where(*conditions).values(status=OBSOLETE_STR, content_hash=None)
+        ),
+    )
+    if connection is not None:
+        CURRENT_ISSUE_KEYS_TABLE.drop(bind=connection)
+
+    if result.rowcount:
+        LOGGER.info(
+            f'Marked {result.rowcount} issues for product {product.name} with severity "{severity}" as {OBSOLETE_STR}'
+        )
+    return result.rowcount
 
-    for db_issue in db_issues:
-        if db_issue.issue_key in closed_issue_keys and db_issue.status != OBSOLETE_STR:
-            LOGGER.info(f'Marking issue "{db_issue.issue_key}" for product {product.name} as {OBSOLETE_STR}')
-            db_issue.status = OBSOLETE_STR
-    db_session.commit()
 
+def issue_content_hash(issue_row: Dict[str, Any]) -> str:
+    """
+    Args:
+        issue_row (Dict[str, Any]): Issue values, holding at least `ISSUE_UPDATE_FIELDS`.
 
-def update_existing_issue(
-    existing_issue: JiraIssuesEntity, new_issue_data: Issue, severity: str, db_session: Session
-) -> None:
+    Returns:
+        str: Compact hash of the `ISSUE_UPDATE_FIELDS` values of the issue.
     """
-    Check if any of the fields of an existing issue have changed and update them if they have.
+    content = "\x1f".join(str(issue_row[field]) for field in ISSUE_UPDATE_FIELDS)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def issue_to_row(issue: JiraIssueRecord, product_id: int, severity: str, jira_server: str) -> Dict[str, Any]:
+    """
+    Convert a Jira issue to a dictionary of JiraIssuesEntity column values.
 
     Args:
-        existing_issue (JiraIssuesEntity): Existing issue from the database
-        new_issue_data (Issue): New issue from Jira
+        issue (JiraIssueRecord): Jira issue
+        product_id (int): ID of the product the issue belongs to
         severity (str): Severity assigned to the issue/query
-        db_session (Session): SQLAlchemy Session instance.
+        jira_server (str): Jira server URL
+
+    Returns:
+        Dict[str, Any]: JiraIssuesEntity column values, with the content hash of the issue
     """
-    fields = [
-        ("title", new_issue_data.fields.summary.strip()),
-        ("severity", severity),
-        ("status", new_issue_data.fields.status.name),
-        ("issue_type", new_issue_data.fields.issuetype.name.lower()),
-        ("customer_escaped", new_issue_data.is_customer_escaped),
-        ("last_updated", format_issue_date(new_issue_data.fields.updated)),
-    ]
-    for field, new_value in fields:
-        if (current_value := getattr(existing_issue, field)) != new_value:
+    issue_row = {
+        "product_id": product_id,
+        "issue_key": issue.key,
+        "title": issue.title,
+        "url": f"{jira_server}/browse/{issue.key}",
+        "project": issue.project,
+        "severity": severity,
+        "status": issue.status,
+        "issue_type": issue.issue_type,
+        "customer_escaped": issue.customer_escaped,
+        "date_created": issue.date_created,
+        "last_updated": issue.last_updated,
+    }
+    issue_row["content_hash"] = issue_content_hash(issue_row=issue_row)
+    return issue_row
+
+
+def get_issue_changes(existing_issue: JiraIssuesEntity | Row[Any], issue_row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare the updatable fields of an existing issue with the values of a new issue row.
+
+    Args:
+        existing_issue (JiraIssuesEntity | Row[Any]): Existing issue from the database
+        issue_row (Dict[str, Any]): New issue values, as returned by `issue_to_row`
+
+    Returns:
+        Dict[str, Any]: Fields that changed, mapped to their new values
+    """
+    changes: Dict[str, Any] = {}
+    for field in ISSUE_UPDATE_FIELDS:
+        if (current_value := getattr(existing_issue, field)) != (new_value := issue_row[field]):
             LOGGER.info(
-                f'Updating issue "{new_issue_data.key}" in database: "{field}" changed from "{current_value}" to "{new_value}"'
+                f'Updating issue "{issue_row["issue_key"]}" in database: "{field}" changed from "{current_value}" '
+                f'to "{new_value}"'
             )
-            setattr(existing_issue, field, new_value)
-    db_session.commit()
+            changes[field] = new_value
+    return changes
+
+
+def get_existing_issues(
+    issue_keys: List[str], product_id: int, severity: str, db_session: Session
+) -> Dict[str, Row[Any]]:
+    """
+    Fetch the updatable fields and content hash of the issues of a product and severity already stored in the database
+    with a single `IN` query.
+
+    Args:
+        issue_keys (List[str]): Jira issue keys to look up
+        product_id (int): ID of the product the issues belong to
+        severity (str): Severity of the issues
+        db_session (Session): SQLAlchemy Session instance.
+
+    Returns:
+        Dict[str, Row[Any]]: Existing issues keyed by issue key
+    """
+    columns = [getattr(JiraIssuesEntity, field) for field in ISSUE_UPDATE_FIELDS]
+    return {
+        db_issue.issue_key: db_issue
+        for db_issue in db_session.execute(
+            select(JiraIssuesEntity.id, JiraIssuesEntity.issue_key, JiraIssuesEntity.content_hash, *columns).where(
+                JiraIssuesEntity.product_id == product_id,
+                JiraIssuesEntity.severity == severity,
+                JiraIssuesEntity.issue_key.in_(issue_keys),
+            )
+        )
+    }
+
+
+def insert_issues(issue_rows: List[Dict[str, Any]], db_session: Session) -> None:
+    """
+    Insert new issues in chunks, each sent as a multi-row INSERT statement.
+
+    Args:
+        issue_rows (List[Dict[str, Any]]): Issue rows, as returned by `issue_to_row`
+        db_session (Session): SQLAlchemy Session instance.
+    """
+    for rows_chunk in chunked(iterable=issue_rows, size=CHUNK_SIZE):
+        db_session.execute(insert(JiraIssuesEntity), rows_chunk)
+
+
+def update_issues(issue_rows: List[Dict[str, Any]], db_session: Session) -> None:
+    """
+    Update existing issues in chunks with an executemany UPDATE, identified by the "id" key of each row.
+
+    Args:
+        issue_rows (List[Dict[str, Any]]): Issue rows, as returned by `issue_to_row` or holding only the columns to
+            update, with the "id" of the existing row
+        db_session (Session): SQLAlchemy Session instance.
+    """
+    for rows_chunk in chunked(iterable=issue_rows, size=CHUNK_SIZE):
+        db_session.execute(update(JiraIssuesEntity), rows_chunk)
+
+
+def upsert_issues(new_rows: List[Dict[str, Any]], changed_rows: List[Dict[str, Any]], db_session: Session) -> None:
+    """
+    Write new and changed issues.
+
+    On PostgreSQL and SQLite, all the rows are written in chunks, each sent as a multi-row
+    `INSERT ... ON CONFLICT (product_id, severity, issue_key) DO UPDATE` statement. Other dialects and partitioned
+    tables, which have no unique index on these columns, fall back to `insert_issues` and `update_issues`.
+
+    Args:
+        new_rows (List[Dict[str, Any]]): Rows of the new issues, as returned by `issue_to_row`
+        changed_rows (List[Dict[str, Any]]): Rows of the changed issues, with the "id" of the existing row
+        db_session (Session): SQLAlchemy Session instance.
+    """
+    dialect_insert = DIALECT_INSERTS.get(db_session.get_bind().dialect.name)
+    if dialect_insert is None or is_issues_table_partitioned(db_session=db_session):
+        insert_issues(issue_rows=new_rows, db_session=db_session)
+        update_issues(issue_rows=changed_rows, db_session=db_session)
+        return
+
+    statement = dialect_insert(JiraIssuesEntity)
+    statement = statement.on_conflict_do_update(
+        index_elements=[getattr(JiraIssuesEntity, column) for column in ISSUE_UNIQUE_KEY],
+        set_={field: statement.excluded[field] for field in (*ISSUE_UPDATE_FIELDS, "content_hash")},
+    )
+    issue_rows = new_rows + [{key: value for key, value in row.items() if key != "id"} for row in changed_rows]
+    for rows_chunk in chunked(iterable=issue_rows, size=CHUNK_SIZE):
+        db_session.execute(statement, rows_chunk)
 
 
 def create_update_issues(
-    issues: List[Issue], product: "ProductsEntity", severity: str, jira_server: str, db_session: Session
-) -> None:
+    issues: Iterable[JiraIssueRecord],
+    product: "ProductsEntity",
+    severity: str,
+    jira_server: str,
+    db_session: Session,
+    mark_obsolete: bool = True,
+) -> IssueChangeSet:
     """
-    Create or update JiraIssuesEntity items in the database from a list of Jira issues. Sets status of obsolete issues as "obsolete".
+    Create or update JiraIssuesEntity items in the database from Jira issues. Sets status of obsolete issues as
+    "obsolete".
+
+    Issues are consumed in chunks, so a stream of issues is written while it is fetched. The existing issues of each
+    chunk are fetched in bulk, and only the ones whose content hash differs are compared and written back in bulk.
+    The issue count rollup is updated from the changes, and the transaction is committed once.
 
     Args:
-        issues (List[Issue]): A list of Jira issues
+        issues (Iterable[JiraIssueRecord]): Jira issues
         product (ProductsEntity): A product object
         severity (str): Severity of the issues
         jira_server (str): Jira server URL
         db_session (Session): SQLAlchemy Session instance.
+        mark_obsolete (bool): Whether to mark the issues missing from `issues` as obsolete. Must be False when
+            `issues` holds only the issues updated since the last sync.
 
     Returns:
-        List["JiraIssuesEntity"]: A list of JiraIssuesEntity objects
-    """
-    for issue in issues:
-        if existing_issue := db_session.execute(
-            select(JiraIssuesEntity).where(JiraIssuesEntity.issue_key == issue.key)
-        ).scalar_one_or_none():
-            update_existing_issue(
-                existing_issue=existing_issue, new_issue_data=issue, severity=severity, db_session=db_session
-            )
-        else:
-            db_session.execute(
-                statement=insert(JiraIssuesEntity).values(
-                    product_id=product.id,
-                    issue_key=issue.key,
-                    title=issue.fields.summary,
-                    url=f"{jira_server}/browse/{issue.key}",
-                    project=issue.fields.project.key,
-                    severity=severity,
-                    status=issue.fields.status.name,
-                    issue_type=issue.fields.issuetype.name.lower(),
-                    customer_escaped=issue.is_customer_escaped,
-                    date_created=format_issue_date(issue.fields.created),
-                    last_updated=format_issue_date(issue.fields.updated),
+        IssueChangeSet: The written changes.
+    """
+    current_issue_keys: Set[str] = set()
+    change_set = IssueChangeSet(product_id=product.id, severity=severity, inserted={}, updated={}, obsoleted={})
+    fetched_issues = 0
+
+    for issues_chunk in chunked(iterable=issues, size=CHUNK_SIZE):
+        fetched_issues += len(issues_chunk)
+        issue_rows = {
+            issue.key: issue_to_row(issue=issue, product_id=product.id, severity=severity, jira_server=jira_server)
+            for issue in issues_chunk
+        }
+        existing_issues = get_existing_issues(
+            issue_keys=list(issue_rows), product_id=product.id, severity=severity, db_session=db_session
+        )
+        new_rows: List[Dict[str, Any]] = []
+        changed_rows: List[Dict[str, Any]] = []
+        hashed_rows: List[Dict[str, Any]] = []
+        for issue_key, issue_row in issue_rows.items():
+            if (existing_issue := existing_issues.get(issue_key)) is None:
+                new_rows.append(issue_row)
+                change_set.inserted[issue_key] = issue_row
+            elif existing_issue.content_hash == issue_row["content_hash"]:
+                continue
+            elif get_issue_changes(existing_issue=existing_issue, issue_row=issue_row):
+                changed_rows.append({**issue_row, "id": existing_issue.id})
+                change_set.updated[issue_key] = (
+                    {field: getattr(existing_issue, field) for field in ISSUE_UPDATE_FIELDS},
+                    {field: issue_row[field] for field in ISSUE_UPDATE_FIELDS},
                 )
-            )
+            else:
+                # Unchanged issue without a content hash yet, stored before the content_hash column was added
+                hashed_rows.append({"id": existing_issue.id, "content_hash": issue_row["content_hash"]})
 
-    mark_obsolete_issues(
-        current_issues=issues,
-        db_issues=db_session.execute(
-            select(JiraIssuesEntity).where(JiraIssuesEntity.product == product, JiraIssuesEntity.severity == severity)
-        ).scalars(),
-        product=product,
-        db_session=db_session,
-    )
+        upsert_issues(new_rows=new_rows, changed_rows=changed_rows, db_session=db_session)
+        update_issues(issue_rows=hashed_rows, db_session=db_session)
+        current_issue_keys.update(issue_rows)
+
+    if mark_obsolete:
+        with METRICS.timer(
+            "qe_metrics_query_duration_seconds", stage="mark_obsolete_issues", product=product.name, severity=severity
+        ):
+            mark_obsolete_issues(
+                current_issue_keys=current_issue_keys,
+                product=product,
+                severity=severity,
+                db_session=db_session,
+                change_set=change_set,
+            )
+    update_issue_count_rollup(deltas=change_set.issue_count_deltas(), db_session=db_session)
     db_session.commit()
+    for change, issue_count in (
+        ("fetched", fetched_issues),
+        ("inserted", len(change_set.inserted)),
+        ("updated", len(change_set.updated)),
+        ("obsoleted", len(change_set.obsoleted)),
+    ):
+        METRICS.inc("qe_metrics_issues_total", issue_count, product=product.name, severity=severity, change=change)
+    LOGGER.info(
+        f'Product "{product.name}" with severity "{severity}": {len(change_set.inserted)} new issues, '
+        f"{len(change_set.updated)} updated issues, {len(change_set.obsoleted)} obsolete issues"
+    )
+    return change_set
 
 
 @ignore_exceptions(logger=LOGGER, return_on_error=False)
@@ -136,16 +387,48 @@ def delete_old_issues(days_old: int, db_session: Session) -> bool:
     """
     Delete issues from the database that were last updated more than the number of days defined in days_old.
 
+    On a partitioned jiraissues table, the monthly partitions holding only expired issues are dropped and the
+    partitions of the next months are created. The remaining expired issues are deleted in batches of
+    `RETENTION_BATCH_SIZE` rows, each committed separately, so the time locks are held for stays bounded. The deleted
+    issues are subtracted from the issue count rollup in the same transactions.
+
     Args:
         days_old (int): Number of days from the last_updated date to keep issues in the database
         db_session (Session): SQLAlchemy Session instance.
     """
 
     LOGGER.info(f"Deleting issues that haven't been updated in {days_old} days from the database")
-    db_session.execute(
-        statement=delete(JiraIssuesEntity).where(
-            JiraIssuesEntity.last_updated < (datetime.now().date() - timedelta(days=days_old))
+    today = datetime.now().date()
+    cutoff = today - timedelta(days=days_old)
+    if is_issues_table_partitioned(db_session=db_session):
+        connection = db_session.connection()
+        create_issue_partitions(
+            connection=connection,
+            first_month=today,
+            last_month=month_start(day=today, months_offset=PARTITION_MONTHS_AHEAD),
         )
-    )
-    db_session.commit()
+        drop_expired_issue_partitions(
+            connection=connection,
+            cutoff=cutoff,
+            before_drop=lambda first_day, end_day: subtract_issues_from_rollup(
+                db_session, JiraIssuesEntity.last_updated >= first_day, JiraIssuesEntity.last_updated < end_day
+            ),
+        )
+        db_session.commit()
+
+    deleted_count = 0
+    while True:
+        issue_ids = db_session.scalars(
+            select(JiraIssuesEntity.id).where(JiraIssuesEntity.last_updated < cutoff).limit(RETENTION_BATCH_SIZE)
+        ).all()
+        if issue_ids:
+            subtract_issues_from_rollup(db_session, JiraIssuesEntity.id.in_(issue_ids))
+            db_session.execute(statement=delete(JiraIssuesEntity).where(JiraIssuesEntity.id.in_(issue_ids)))
+            db_session.commit()
+        deleted_count += len(issue_ids)
+        if len(issue_ids) < RETENTION_BATCH_SIZE:
+            break
+
+    METRICS.inc("qe_metrics_issues_deleted_total", deleted_count)
+    LOGGER.info(f"Deleted {deleted_count} issues that haven't been updated in {days_old} days")
     return True
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, List, Optional
+
+from simple_logger.logger import get_logger
+
+from qe_metrics.utils.sync_utils import utc_now
+
+LOGGER = get_logger(name=__name__)
+
+# Number of finished jobs kept for status requests
+MAX_FINISHED_JOBS = 100
+
+
+class SyncJob:
+    """
+    A qe-metrics run requested through the queue, and its progress.
+    """
+
+    def __init__(self, kwargs: Dict[str, Any]) -> None:
+        self.id = uuid.uuid4().hex
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.created_at = utc_now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.completed_queries = 0
+        self.total_queries: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "completed_queries": self.completed_queries,
+            "total_queries": self.total_queries,
+            "error": self.error,
+        }
+
+
+class SyncJobQueue:
+    """
+    Run qe-metrics in a background thread, one run at a time.
+
+    A request made while a run with the same arguments is queued joins it instead of queuing another run, so any
+    number of concurrent requests results in at most one running and one queued run per set of arguments.
+    """
+
+    def __init__(self, run: Callable[..., List[str]]) -> None:
+        """
+        Args:
+            run (Callable[..., List[str]]): Function running qe-metrics with the keyword arguments of a job, a
+                "started" callback, called once the sync lock is taken, and a "progress" callback, called with the
+                number of completed and total queries. Returns the errors of the products that failed to sync, empty
+                if all of them were synced.
+        """
+        self._run = run
+        self._jobs: OrderedDict[str, SyncJob] = OrderedDict()
+        self._condition = Condition()
+        self._worker: Optional[Thread] = None
+
+    def submit(self, **kwargs: Any) -> SyncJob:
+        """
+        Queue a run, or join the queued run with the same arguments.
+
+        Args:
+            **kwargs (Any): Keyword arguments of the run.
+
+        Returns:
+            SyncJob: The queued job.
+        """
+        with self._condition:
+            for job in self._jobs.values():
+                if job.status == "queued" and job.kwargs == kwargs:
+                    return job
+
+            job = SyncJob(kwargs=kwargs)
+            self._jobs[job.id] = job
+            self._prune_finished_jobs()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = Thread(target=self._work, name="qe-metrics-jobs", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+            return job
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        """
+        Args:
+            job_id (str): ID of the job.
+
+        Returns:
+            Optional[SyncJob]: The job, or None if it is unknown.
+        """
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def _prune_finished_jobs(self) -> None:
+        finished_jobs = [job.id for job in self._jobs.values() if job.finished_at is not None]
+        for job_id in finished_jobs[: max(len(finished_jobs) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def _next_job(self) -> SyncJob:
+        with self._condition:
+            while True:
+                if job := next((job for job in self._jobs.values() if job.status == "queued"), None):
+                    # Until the sync lock held by another thread or process of the host is released
+                    job.status = "waiting"
+                    return job
+                self._condition.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+
+            def _started(job: SyncJob = job) -> None:
+                job.status = "running"
+                job.started_at = utc_now()
+
+            def _progress(completed_queries: int, total_queries: int, job: SyncJob = job) -> None:
+                job.completed_queries, job.total_queries = completed_queries, total_queries
+
+            try:
+                if errors := self._run(started=_started, progress=_progress, **job.kwargs):
+                    LOGGER.error(f"qe-metrics job {job.id} partially failed")
+                    job.status = "partial_failure"
+                    job.error = "\n".join(errors)
+                else:
+                    job.status = "succeeded"
+            except Exception as ex:
+                LOGGER.error(f"qe-metrics job {job.id} failed: {ex}")
+                job.status = "failed"
+                job.error = str(ex)
+            job.finished_at = utc_now()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+import json
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+from simple_logger.logger import get_logger
+
+from qe_metrics.utils.general import get_cache_dir
+
+LOGGER = get_logger(name=__name__)
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+# Directory of the cache dir holding the metrics of each process, so the metrics of the syncs run by another process
+# are exposed by the process serving /metrics
+METRICS_DIR = "metrics"
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricDefinition(NamedTuple):
+    """
+    Prometheus type and help text of a metric.
+    """
+
+    type: str
+    help: str
+
+
+METRIC_DEFINITIONS: Dict[str, MetricDefinition] = {
+    "qe_metrics_runs_total": MetricDefinition(type="counter", help="Number of qe-metrics runs, by outcome."),
+    "qe_metrics_last_success_timestamp_seconds": MetricDefinition(
+        type="gauge", help="Unix time of the end of the last successful qe-metrics run."
+    ),
+    "qe_metrics_stage_duration_seconds": MetricDefinition(
+        type="histogram", help="Duration of the stages of a qe-metrics run."
+    ),
+    "qe_metrics_query_duration_seconds": MetricDefinition(
+        type="histogram", help="Duration of the stages of the sync of a product and severity."
+    ),
+    "qe_metrics_issues_total": MetricDefinition(
+        type="counter", help="Number of issues fetched from Jira and written to the database, by change."
+    ),
+    "qe_metrics_issues_deleted_total": MetricDefinition(
+        type="counter", help="Number of issues deleted by the retention policy."
+    ),
+    "qe_metrics_jira_requests_total": MetricDefinition(
+        type="counter", help="Number of requests sent to Jira, by operation and outcome."
+    ),
+    "qe_metrics_jira_request_duration_seconds": MetricDefinition(
+        type="histogram", help="Duration of the requests sent to Jira."
+    ),
+    "qe_metrics_jira_concurrency_limit": MetricDefinition(
+        type="gauge", help="Number of concurrent requests currently allowed by the Jira throttle."
+    ),
+    "qe_metrics_jira_circuit_opened_total": MetricDefinition(
+        type="counter", help="Number of times failing Jira requests paused all the requests to Jira."
+    ),
+    "qe_metrics_cached_searches_total": MetricDefinition(
+        type="counter", help="Number of Jira queries answered from the issues of another query of the run, by reason."
+    ),
+}
+
+
+def _labels_key(labels: Dict[str, Any]) -> LabelsKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _merge_value(name: str, current: Any, value: Any) -> Any:
+    # Counters and histograms are summed, the highest gauge value is kept
+    if current is None:
+        return list(value) if isinstance(value, list) else value
+    if METRIC_DEFINITIONS[name].type == "histogram":
+        return [current_value + other for current_value, other in zip(current, value)]
+    if METRIC_DEFINITIONS[name].type == "gauge":
+        return max(current, value)
+    return current + value
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and duration histograms of the metrics of `METRIC_DEFINITIONS`.
+
+    Histograms are stored as the count of each bucket of `DURATION_BUCKETS` (non-cumulative, with a last overflow
+    bucket), followed by the sum and the count of the observed values.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._values: Dict[str, Dict[LabelsKey, Any]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """
+        Args:
+            name (str): Name of a counter.
+            value (float): Amount added to the counter.
+            **labels (Any): Labels of the counter.
+        """
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            key = _labels_key(labels=labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Args:
+            name (str): Name of a gauge.
+            value (float): Value of the gauge.
+            **labels (Any): Labels of the gauge.
+        """
+        with self._lock:
+            self._values.setdefault(name, {})[_labels_key(labels=labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Args:
+            name (str): Name of a histogram.
+            value (float): Observed value.
+            **labels (Any): Labels of the histogram.
+        """
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            histogram = series.setdefault(_labels_key(labels=labels), [0] * (len(DURATION_BUCKETS) + 1) + [0.0, 0])
+            histogram[bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """
+        Observe the duration of the block in the `name` histogram, whether it raised or not.
+
+        Args:
+            name (str): Name of a histogram.
+            **labels (Any): Labels of the histogram.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def snapshot(self) -> Dict[str, List[Tuple[Dict[str, str], Any]]]:
+        """
+        Returns:
+            Dict[str, List[Tuple[Dict[str, str], Any]]]: JSON-serializable labels and values of each metric.
+        """
+        with self._lock:
+            return {
+                name: [(dict(key), list(value) if isinstance(value, list) else value) for key, value in series.items()]
+                for name, series in self._values.items()
+            }
+
+    def merge(self, snapshot: Dict[str, List[Tuple[Dict[str, str], Any]]]) -> None:
+        """
+        Add the metrics of another registry, e.g. of a worker process, as `merge_snapshots` does.
+
+        Args:
+            snapshot (Dict[str, List[Tuple[Dict[str, str], Any]]]): Snapshot of a `MetricsRegistry` instance.
+        """
+        with self._lock:
+            for name, series in snapshot.items():
+                if name not in METRIC_DEFINITIONS:
+                    continue
+
+                values = self._values.setdefault(name, {})
+                for labels, value in series:
+                    key = _labels_key(labels=labels)
+                    values[key] = _merge_value(name=name, current=values.get(key), value=value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+METRICS = MetricsRegistry()
+
+
+def merge_snapshots(
+    snapshots: List[Dict[str, List[Tuple[Dict[str, str], Any]]]],
+) -> Dict[str, Dict[LabelsKey, Any]]:
+    """
+    Merge the metrics of several processes: counters and histograms are summed, the highest gauge value is kept.
+
+    Args:
+        snapshots (List[Dict[str, List[Tuple[Dict[str, str], Any]]]]): Snapshots of `MetricsRegistry` instances.
+
+    Returns:
+        Dict[str, Dict[LabelsKey, Any]]: Merged values of each metric, keyed by their labels.
+    """
+    merged: Dict[str, Dict[LabelsKey, Any]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in METRIC_DEFINITIONS:
+                continue
+
+            merged_series = merged.setdefault(name, {})
+            for labels, value in series:
+                key = _labels_key(labels=labels)
+                merged_series[key] = _merge_value(name=name, current=merged_series.get(key), value=value)
+    return merged
+
+
+def _format_labels(key: LabelsKey) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def render_metrics(metrics: Dict[str, Dict[LabelsKey, Any]]) -> str:
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics (Dict[str, Dict[LabelsKey, Any]]): Values of each metric, keyed by their labels.
+
+    Returns:
+        str: The metrics, in the order of `METRIC_DEFINITIONS`.
+    """
+    lines: List[str] = []
+    for name, definition in METRIC_DEFINITIONS.items():
+        lines.extend([f"# HELP {name} {definition.help}", f"# TYPE {name} {definition.type}"])
+        for key, value in sorted(metrics.get(name, {}).items()):
+            if definition.type != "histogram":
+                lines.append(f"{name}{_format_labels(key=key)} {value}")
+                continue
+
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip((*DURATION_BUCKETS, "+Inf"), value[:-2]):
+                cumulative_count += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(key=(*key, ('le', str(upper_bound))))} {cumulative_count}")
+            lines.append(f"{name}_sum{_format_labels(key=key)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(key=key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def get_metrics_dir() -> str:
+    """
+    Returns:
+        str: Directory holding the saved metrics of each process, created if missing.
+    """
+    metrics_dir = os.path.join(get_cache_dir(), METRICS_DIR)
+    os.makedirs(metrics_dir, exist_ok=True)
+    return metrics_dir
+
+
+def save_metrics() -> None:
+    """
+    Save the metrics of the current process, so `collect_metrics` exposes them from any process of the host.
+    """
+    metrics_dir = get_metrics_dir()
+    with tempfile.NamedTemporaryFile(mode="w", dir=metrics_dir, delete=False) as tmp_fd:
+        json.dump(METRICS.snapshot(), tmp_fd)
+    os.replace(tmp_fd.name, os.path.join(metrics_dir, f"{os.getpid()}.json"))
+
+
+def is_process_running(pid: int) -> bool:
+    """
+    Args:
+        pid (int): ID of a process.
+
+    Returns:
+        bool: True if a process with this ID is running on the host.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+def collect_metrics() -> str:
+    """
+    The saved metrics of the processes that are no longer running are deleted, so they are not exposed forever and the
+    metrics directory does not grow with every process that ran a sync.
+
+    Returns:
+        str: The live metrics of the current process merged with the saved metrics of the other running processes, in
+            the Prometheus text exposition format.
+    """
+    snapshots = [METRICS.snapshot()]
+    metrics_dir = get_metrics_dir()
+    for file_name in os.listdir(metrics_dir):
+        pid = file_name.removesuffix(".json")
+        if not file_name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+
+        if not is_process_running(pid=int(pid)):
+            LOGGER.info(f"Deleting the saved metrics of process {pid}, which is no longer running")
+            try:
+                os.remove(os.path.join(metrics_dir, file_name))
+            except FileNotFoundError:
+                pass
+            continue
+
+        try:
+            with open(os.path.join(metrics_dir, file_name)) as fd:
+                snapshots.append(json.load(fd))
+        except (OSError, ValueError) as ex:
+            LOGGER.warning(f"Ignoring invalid metrics file {file_name}: {ex}")
+    return render_metrics(metrics=merge_snapshots(snapshots=snapshots))
+
+
+def record_jira_request(operation: str, outcome: str, duration: float) -> None:
+    """
+    Args:
+        operation (str): Kind of request, e.g. "search".
+        outcome (str): "success", "error" or "retry".
+        duration (float): Duration of the request in seconds.
+    """
+    METRICS.inc("qe_metrics_jira_requests_total", operation=operation, outcome=outcome)
+    METRICS.observe("qe_metrics_jira_request_duration_seconds", duration, operation=operation)
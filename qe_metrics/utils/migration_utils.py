@@ -0,0 +1,229 @@
+from __future__ import annotations
+from typing import Any, List
+
+from simple_logger.logger import get_logger
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Engine,
+    Index,
+    Integer,
+    MetaData,
+    Row,
+    String,
+    Table,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.schema import CreateColumn
+
+from qe_metrics.utils.general import chunked
+from qe_metrics.utils.sync_utils import utc_now
+
+LOGGER = get_logger(name=__name__)
+
+# Arbitrary key of the PostgreSQL advisory lock serializing concurrent schema upgrades
+SCHEMA_UPGRADE_LOCK_ID = 7_108_524_201
+# Execution option of the migration connections allowing `create_missing_indexes` to delete duplicate rows
+DELETE_DUPLICATES_OPTION = "qe_metrics_delete_duplicates"
+# Maximum number of duplicate keys listed in a `DuplicateRowsError`
+MAX_LISTED_DUPLICATES = 20
+# Number of duplicate rows deleted per statement
+DELETE_CHUNK_SIZE = 1000
+# One row per applied migration
+SCHEMA_VERSION_TABLE = Table(
+    "schemaversion",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False, nullable=False),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaVersionError(Exception):
+    """
+    Raised when the database schema version does not match the version expected by qe-metrics.
+    """
+
+
+class DuplicateRowsError(Exception):
+    """
+    Raised when a unique index cannot be created because of duplicate rows, and their deletion was not requested.
+    """
+
+
+def get_schema_version(connection: Connection) -> int:
+    """
+    Args:
+        connection (Connection): SQLAlchemy connection.
+
+    Returns:
+        int: Version of the last migration applied to the database, 0 if none was applied.
+    """
+    if not inspect(subject=connection).has_table(table_name=SCHEMA_VERSION_TABLE.name):
+        return 0
+    return connection.execute(select(func.max(SCHEMA_VERSION_TABLE.c.version))).scalar_one() or 0
+
+
+def upgrade_schema(engine: Engine, delete_duplicates: bool = False) -> int:
+    """
+    Apply the migrations newer than the schema version of the database, each in its own transaction.
+
+    On PostgreSQL, concurrent upgrades are serialized with an advisory lock, so a migration is applied once.
+
+    Args:
+        engine (Engine): SQLAlchemy engine.
+        delete_duplicates (bool): Whether to delete the duplicate rows preventing the creation of unique indexes.
+
+    Returns:
+        int: Schema version of the database after the upgrade.
+
+    Raises:
+        SchemaVersionError: If the database was upgraded by a newer version of qe-metrics.
+        DuplicateRowsError: If duplicate rows prevent the creation of a unique index and `delete_duplicates` is False.
+    """
+    # Imported here since the migrations use the helpers of this module
+    from qe_metrics.migrations import LATEST_SCHEMA_VERSION, MIGRATIONS
+
+    with engine.begin() as connection:
+        SCHEMA_VERSION_TABLE.create(bind=connection, checkfirst=True)
+
+    schema_version = 0
+    for migration in MIGRATIONS:
+        with engine.begin() as connection:
+            connection.execution_options(**{DELETE_DUPLICATES_OPTION: delete_duplicates})
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": SCHEMA_UPGRADE_LOCK_ID})
+
+            if (schema_version := get_schema_version(connection=connection)) > LATEST_SCHEMA_VERSION:
+                raise SchemaVersionError(
+                    f"Database schema version {schema_version} is newer than the latest known version "
+                    f"{LATEST_SCHEMA_VERSION}, upgrade qe-metrics"
+                )
+
+            if migration.version <= schema_version:
+                continue
+
+            LOGGER.info(f"Applying schema migration {migration.version}: {migration.module.DESCRIPTION}")
+            migration.module.upgrade(connection=connection)
+            connection.execute(
+                insert(SCHEMA_VERSION_TABLE).values(
+                    version=migration.version, description=migration.module.DESCRIPTION, applied_at=utc_now()
+                )
+            )
+            schema_version = migration.version
+
+    return schema_version
+
+
+def add_missing_columns(connection: Connection, table: Table) -> None:
+    """
+    Add the columns of `table` that are missing from the database table. The missing columns must be nullable.
+
+    Args:
+        connection (Connection): SQLAlchemy connection.
+        table (Table): Table definition holding the columns.
+    """
+    existing_columns = {column["name"] for column in inspect(subject=connection).get_columns(table_name=table.name)}
+    preparer = connection.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+
+        LOGGER.info(f'Adding column "{column.name}" to table "{table.name}"')
+        connection.execute(
+            text(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"
+            )
+        )
+
+
+def create_missing_indexes(connection: Connection, indexes: List[Index]) -> None:
+    """
+    Create the indexes that are missing from the database.
+
+    Duplicate rows preventing the creation of a unique index are only deleted, keeping the most recently inserted one,
+    when the upgrade was run with `delete_duplicates`.
+
+    Args:
+        connection (Connection): SQLAlchemy connection.
+        indexes (List[Index]): Indexes to create, bound to their table.
+
+    Raises:
+        DuplicateRowsError: If a unique index cannot be created because of duplicate rows.
+    """
+    inspector = inspect(subject=connection)
+    for index in indexes:
+        table = index.table
+        assert table is not None
+        if index.name in {existing["name"] for existing in inspector.get_indexes(table_name=table.name)}:
+            continue
+
+        if index.unique:
+            columns = list(index.columns)
+            if connection.get_execution_options().get(DELETE_DUPLICATES_OPTION):
+                if deleted := delete_duplicate_rows(connection=connection, table=table, columns=columns):
+                    LOGGER.warning(f'Deleted {deleted} duplicate rows from table "{table.name}"')
+            elif duplicates := find_duplicate_keys(connection=connection, table=table, columns=columns):
+                column_names = ", ".join(column.name for column in columns)
+                listed_duplicates = "; ".join(
+                    f"{tuple(key)} ({count} rows)" for *key, count in duplicates[:MAX_LISTED_DUPLICATES]
+                )
+                raise DuplicateRowsError(
+                    f'Cannot create unique index "{index.name}": {len(duplicates)} values of ({column_names}) are '
+                    f'held by several rows of table "{table.name}": {listed_duplicates}. Run '
+                    "`qe-metrics db upgrade --delete-duplicates` to keep the most recently inserted row of each"
+                )
+        LOGGER.info(f'Creating index "{index.name}" on table "{table.name}"')
+        index.create(bind=connection)
+
+
+def find_duplicate_keys(connection: Connection, table: Table, columns: List[Column[Any]]) -> List[Row[Any]]:
+    """
+    Args:
+        connection (Connection): SQLAlchemy connection.
+        table (Table): Table to check.
+        columns (List[Column[Any]]): Columns that must identify a single row.
+
+    Returns:
+        List[Row[Any]]: The values of `columns` held by several rows, each followed by its number of rows.
+    """
+    return list(
+        connection.execute(
+            statement=select(*columns, func.count())
+            .select_from(table)
+            .group_by(*columns)
+            .having(func.count() > 1)
+            .order_by(*columns)
+        ).all()
+    )
+
+
+def delete_duplicate_rows(connection: Connection, table: Table, columns: List[Column[Any]]) -> int:
+    """
+    Delete the rows of a table sharing the same values of `columns`, except the one with the highest id. Each deleted
+    row is logged.
+
+    Args:
+        connection (Connection): SQLAlchemy connection.
+        table (Table): Table to deduplicate, with an "id" primary key column.
+        columns (List[Column[Any]]): Columns that must identify a single row.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    duplicate_rows = connection.execute(
+        statement=select(table).where(table.c.id.not_in(select(func.max(table.c.id)).group_by(*columns)))
+    ).all()
+    for row in duplicate_rows:
+        LOGGER.warning(f'Deleting duplicate row of table "{table.name}": {dict(row._mapping)}')
+
+    for ids_chunk in chunked(iterable=[row.id for row in duplicate_rows], size=DELETE_CHUNK_SIZE):
+        connection.execute(statement=delete(table).where(table.c.id.in_(ids_chunk)))
+    return len(duplicate_rows)
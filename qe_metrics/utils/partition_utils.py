@@ -0,0 +1,204 @@
+from __future__ import annotations
+import re
+from datetime import date
+from typing import Callable, List, Tuple, cast
+
+from simple_logger.logger import get_logger
+from sqlalchemy import Connection, DefaultClause, MetaData, PrimaryKeyConstraint, Table, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from qe_metrics.libs.database_mapping import JiraIssuesEntity, ProductsEntity
+
+LOGGER = get_logger(name=__name__)
+
+ISSUES_TABLE = JiraIssuesEntity.__tablename__
+ISSUES_DEFAULT_PARTITION = f"{ISSUES_TABLE}_default"
+# Monthly partitions are named after the first month they hold, e.g. "jiraissues_p202401"
+ISSUES_PARTITION_NAME_RE = re.compile(rf"^{ISSUES_TABLE}_p(?P<year>\d{{4}})(?P<month>\d{{2}})$")
+# Number of months after the current one that always have a partition
+PARTITION_MONTHS_AHEAD = 2
+# Key of the `Session.info` cache of `is_issues_table_partitioned`
+PARTITIONED_INFO_KEY = "jiraissues_partitioned"
+
+
+def month_start(day: date, months_offset: int = 0) -> date:
+    """
+    Args:
+        day (date): Any day of a month.
+        months_offset (int): Number of months to add to the month of `day`.
+
+    Returns:
+        date: First day of the month of `day`, shifted by `months_offset` months.
+    """
+    month_index = day.year * 12 + day.month - 1 + months_offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def issue_partition_name(month: date) -> str:
+    """
+    Args:
+        month (date): First day of the month held by the partition.
+
+    Returns:
+        str: Name of the jiraissues partition of the month.
+    """
+    return f"{ISSUES_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def is_issues_table_partitioned(db_session: Session) -> bool:
+    """
+    Check whether the jiraissues table uses the partitioned PostgreSQL layout. The result is cached in the session.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+
+    Returns:
+        bool: True if jiraissues is a partitioned table.
+    """
+    if PARTITIONED_INFO_KEY not in db_session.info:
+        db_session.info[PARTITIONED_INFO_KEY] = (
+            db_session.get_bind().dialect.name == "postgresql"
+            and db_session.execute(
+                text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table_name))"),
+                {"table_name": ISSUES_TABLE},
+            ).scalar_one()
+        )
+    return db_session.info[PARTITIONED_INFO_KEY]
+
+
+def get_issue_partitions(connection: Connection) -> List[Tuple[str, date]]:
+    """
+    Args:
+        connection (Connection): SQLAlchemy connection to a PostgreSQL database.
+
+    Returns:
+        List[Tuple[str, date]]: Name and first month of the monthly jiraissues partitions, oldest first. The default
+            partition is not included.
+    """
+    partitions: List[Tuple[str, date]] = []
+    for partition_name in connection.execute(
+        text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table_name)"),
+        {"table_name": ISSUES_TABLE},
+    ).scalars():
+        if match := ISSUES_PARTITION_NAME_RE.match(partition_name):
+            partitions.append((partition_name, date(int(match["year"]), int(match["month"]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_issue_partitions(connection: Connection, first_month: date, last_month: date) -> int:
+    """
+    Create the missing monthly jiraissues partitions from `first_month` to `last_month`, both included.
+
+    Args:
+        connection (Connection): SQLAlchemy connection to a PostgreSQL database.
+        first_month (date): Any day of the first month to partition.
+        last_month (date): Any day of the last month to partition.
+
+    Returns:
+        int: Number of created partitions.
+    """
+    existing_partitions = {partition_name for partition_name, _ in get_issue_partitions(connection=connection)}
+    created = 0
+    month = month_start(day=first_month)
+    while month <= last_month:
+        next_month = month_start(day=month, months_offset=1)
+        if (partition_name := issue_partition_name(month=month)) not in existing_partitions:
+            LOGGER.info(f'Creating partition "{partition_name}" of table "{ISSUES_TABLE}"')
+            connection.execute(
+                text(
+                    f"CREATE TABLE {partition_name} PARTITION OF {ISSUES_TABLE} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+                )
+            )
+            created += 1
+        month = next_month
+    return created
+
+
+def drop_expired_issue_partitions(
+    connection: Connection, cutoff: date, before_drop: Callable[[date, date], None] | None = None
+) -> int:
+    """
+    Drop the monthly jiraissues partitions that only hold issues last updated before `cutoff`.
+
+    Args:
+        connection (Connection): SQLAlchemy connection to a PostgreSQL database.
+        cutoff (date): Issues last updated before this day are expired.
+        before_drop (Callable[[date, date], None] | None): Called with the first day and the day after the last day
+            of each partition before it is dropped.
+
+    Returns:
+        int: Number of dropped partitions.
+    """
+    dropped = 0
+    for partition_name, month in get_issue_partitions(connection=connection):
+        if (next_month := month_start(day=month, months_offset=1)) > cutoff:
+            break
+
+        if before_drop:
+            before_drop(month, next_month)
+        LOGGER.info(f'Dropping expired partition "{partition_name}" of table "{ISSUES_TABLE}"')
+        connection.execute(text(f"DROP TABLE {partition_name}"))
+        dropped += 1
+    return dropped
+
+
+def partitioned_issues_table() -> Table:
+    """
+    Returns:
+        Table: The jiraissues table of `JiraIssuesEntity`, range-partitioned by "last_updated", with an (id,
+            last_updated) primary key and ids taken from the sequence of the unpartitioned table.
+    """
+    metadata = MetaData()
+    # The foreign key to the products table is resolved in the same metadata
+    cast(Table, ProductsEntity.__table__).to_metadata(metadata)
+    issues_table = cast(Table, JiraIssuesEntity.__table__).to_metadata(metadata)
+    issues_table.c.id.autoincrement = False
+    issues_table.c.id.server_default = DefaultClause(text(f"nextval('{ISSUES_TABLE}_id_seq')"))
+    issues_table.c.last_updated.primary_key = True
+    issues_table.append_constraint(PrimaryKeyConstraint(issues_table.c.id, issues_table.c.last_updated))
+    issues_table.dialect_kwargs["postgresql_partition_by"] = "RANGE (last_updated)"
+    return issues_table
+
+
+def partition_issues_table(connection: Connection, today: date) -> None:
+    """
+    Convert the jiraissues table to a PostgreSQL table range-partitioned by month of "last_updated", keeping its rows
+    and ids.
+
+    The partition key must be part of the primary key and of unique indexes, so the primary key becomes
+    (id, last_updated) and the unique (product_id, severity, issue_key) index becomes a plain index. Issue upserts fall
+    back to the issue key lookups of `create_update_issues` on the partitioned table.
+
+    Args:
+        connection (Connection): SQLAlchemy connection to a PostgreSQL database, the conversion runs in its transaction.
+        today (date): Current day, partitions are created up to `PARTITION_MONTHS_AHEAD` months after it.
+    """
+    old_table = f"{ISSUES_TABLE}_unpartitioned"
+    issues_table = cast(Table, JiraIssuesEntity.__table__)
+    columns = ", ".join(column.name for column in issues_table.columns)
+    connection.execute(text(f"LOCK TABLE {ISSUES_TABLE} IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(text(f"ALTER TABLE {ISSUES_TABLE} RENAME TO {old_table}"))
+    for index in issues_table.indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    connection.execute(CreateTable(partitioned_issues_table()))
+    connection.execute(text(f"ALTER SEQUENCE {ISSUES_TABLE}_id_seq OWNED BY {ISSUES_TABLE}.id"))
+    connection.execute(text(f"CREATE TABLE {ISSUES_DEFAULT_PARTITION} PARTITION OF {ISSUES_TABLE} DEFAULT"))
+    oldest_update = connection.execute(text(f"SELECT min(last_updated) FROM {old_table}")).scalar_one()
+    create_issue_partitions(
+        connection=connection,
+        first_month=oldest_update or today,
+        last_month=month_start(day=today, months_offset=PARTITION_MONTHS_AHEAD),
+    )
+    connection.execute(
+        text(
+            f"CREATE INDEX ix_{ISSUES_TABLE}_product_severity_issue_key "
+            f"ON {ISSUES_TABLE} (product_id, severity, issue_key)"
+        )
+    )
+    connection.execute(text(f"CREATE INDEX ix_{ISSUES_TABLE}_issue_key ON {ISSUES_TABLE} (issue_key)"))
+    connection.execute(text(f"CREATE INDEX ix_{ISSUES_TABLE}_last_updated ON {ISSUES_TABLE} (last_updated)"))
+    connection.execute(text(f"INSERT INTO {ISSUES_TABLE} ({columns}) SELECT {columns} FROM {old_table}"))
+    connection.execute(text(f"DROP TABLE {old_table}"))
@@ -1,50 +1,172 @@
 from __future__ import annotations
-from typing import Any, Dict, List
-
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import json
+import os
+import tempfile
+from functools import partial
+from typing import Any, Dict, List, NamedTuple
+
+from concurrent.futures import ThreadPoolExecutor
 import yaml
 from qe_metrics.libs.database_mapping import ProductsEntity
 from pyaml_env import parse_config
-from qe_metrics.utils.general import verify_queries
+from qe_metrics.utils.general import get_cache_dir, matches_any, verify_queries
 from simple_logger.logger import get_logger
 from sqlalchemy.orm import Session
 from sqlalchemy import select, insert
 import requests
+from requests.adapters import HTTPAdapter
 
 LOGGER = get_logger(name=__name__)
 
+PRODUCTS_REPOSITORY_URL = "https://raw.githubusercontent.com/RedHatQE/qe-metrics-products-config/main"
+# Maximum number of concurrent requests to the products repository
+HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT = 30
+_HTTP_SESSION: requests.Session | None = None
+
+
+class Shard(NamedTuple):
+    """
+    Shard `number` of the `total` shards the products are split into, numbered from 1.
+    """
+
+    number: int
+    total: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """
+        Args:
+            value (str): Shard as "number/total", e.g. "1/4".
+
+        Returns:
+            Shard: The parsed shard.
+
+        Raises:
+            ValueError: If the value is not a valid shard.
+        """
+        try:
+            number, total = (int(part) for part in value.split("/"))
+        except ValueError:
+            raise ValueError(f'Invalid shard "{value}", expected "number/total", e.g. "1/4"') from None
+
+        if not 1 <= number <= total:
+            raise ValueError(f'Invalid shard "{value}", the number must be between 1 and {total}')
+        return cls(number=number, total=total)
+
+    def __str__(self) -> str:
+        return f"{self.number}/{self.total}"
+
+    def contains(self, product_name: str) -> bool:
+        """
+        Products are assigned to shards by a hash of their name, so every process and host assigns a product to the
+        same shard, whatever the other products are.
+
+        Args:
+            product_name (str): Name of a product.
+
+        Returns:
+            bool: True if the product belongs to this shard.
+        """
+        name_hash = int.from_bytes(hashlib.sha256(product_name.encode("utf-8")).digest()[:8], byteorder="big")
+        return name_hash % self.total + 1 == self.number
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns:
+        requests.Session: HTTP session shared by all the requests to the products repository.
+    """
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None:
+        _HTTP_SESSION = requests.Session()
+        _HTTP_SESSION.mount(prefix="https://", adapter=HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE))
+    return _HTTP_SESSION
+
 
-def fetch_config_file_content_from_url(base_url: str, file_name: str) -> requests.Response:
-    return requests.get(f"{base_url}/configs/{file_name}")
+def fetch_yaml_with_cache(url: str) -> Any:
+    """
+    Fetch and parse a YAML file, caching it on disk with its ETag and Last-Modified headers.
+
+    A cached file is requested conditionally and reused when the server answers 304 Not Modified. When the request
+    fails, the last good copy of the file is returned.
+
+    Args:
+        url (str): URL of the YAML file.
+
+    Returns:
+        Any: The parsed YAML file, or None if it could not be fetched and is not cached.
+    """
+    cache_file = os.path.join(get_cache_dir(), f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+    cached: Dict[str, Any] = {}
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file) as fd:
+                cached = json.load(fd)
+        except ValueError as ex:
+            LOGGER.warning(f"Ignoring invalid cache file {cache_file} of {url}: {ex}")
+
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        res = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as ex:
+        error = str(ex)
+    else:
+        if res.status_code == 304 and cached:
+            return cached["content"]
+
+        if res.ok:
+            content = yaml.safe_load(res.content.decode("utf-8"))
+            with tempfile.NamedTemporaryFile(mode="w", dir=os.path.dirname(cache_file), delete=False) as tmp_fd:
+                json.dump(
+                    {
+                        "etag": res.headers.get("ETag"),
+                        "last_modified": res.headers.get("Last-Modified"),
+                        "content": content,
+                    },
+                    tmp_fd,
+                )
+            os.replace(tmp_fd.name, cache_file)
+            return content
+
+        error = f"HTTP {res.status_code}"
 
+    if cached:
+        LOGGER.warning(f"Failed to fetch {url} ({error}), using the last fetched copy")
+        return cached["content"]
 
-def products_from_repository() -> Dict[str, Dict[str, str]]:
+    LOGGER.error(f"Failed to fetch {url}: {error}")
+    return None
+
+
+def fetch_config_file_content_from_url(base_url: str, file_name: str) -> Dict[str, Dict[str, str]] | None:
+    return fetch_yaml_with_cache(url=f"{base_url}/configs/{file_name}")
+
+
+def products_from_repository(base_url: str = PRODUCTS_REPOSITORY_URL) -> Dict[str, Dict[str, str]]:
     config_dict: Dict[str, Dict[str, str]] = {}
-    base_url = "https://raw.githubusercontent.com/RedHatQE/qe-metrics-products-config/main"
     product_config_file_url = f"{base_url}/product-config.yaml"
-    res = requests.get(product_config_file_url)
-    if not res.ok:
-        LOGGER.error(f"Failed to fetch products file {product_config_file_url} from repository: {res.status_code}")
+    if not (config_files_dict := fetch_yaml_with_cache(url=product_config_file_url)):
+        LOGGER.error(f"Failed to fetch products file {product_config_file_url} from repository")
         return config_dict
 
-    config_files_content = res.content.decode("utf-8")
-    config_files_dict = yaml.safe_load(config_files_content)
     config_files_list: List[str] = config_files_dict.get("configs")
     if not config_files_list:
         LOGGER.error(f"{product_config_file_url} does not contain any config files")
         return config_dict
 
-    futures = []
-    with ThreadPoolExecutor() as executor:
-        for config_file_name in config_files_list:
-            futures.append(executor.submit(fetch_config_file_content_from_url, base_url, config_file_name))
-
-    for result in as_completed(futures):
-        if not result.result().ok:
-            LOGGER.error(f"Failed to fetch config file {result.result().url}: {result.result().status_code}")
-            continue
-
-        config_dict.update(yaml.safe_load(result.result().content.decode("utf-8")))
+    with ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE) as executor:
+        for config_file_content in executor.map(
+            partial(fetch_config_file_content_from_url, base_url), config_files_list
+        ):
+            if config_file_content:
+                config_dict.update(config_file_content)
 
     return config_dict
 
@@ -60,13 +182,23 @@ def get_products_dict(products_file: str | None = None, products_file_url: bool
     return {}
 
 
-def process_products(products_dict: Dict[str, Dict[str, str]], db_session: Session) -> List[Dict[Any, Any]]:
+def process_products(
+    products_dict: Dict[str, Dict[str, str]],
+    db_session: Session,
+    products_filter: List[str] | None = None,
+    severities_filter: List[str] | None = None,
+    shard: Shard | None = None,
+) -> List[Dict[Any, Any]]:
     """
     Initialize the ProductsEntity class from a file. Create new entries if they do not exist.
 
     Args:
         products_dict (Dict[str, Dict[str, str]]): A dictionary that holds the products and their queries
         db_session (Session): SQLAlchemy Session instance.
+        products_filter (List[str] | None): Shell-style patterns of the product names to process, all if empty.
+        severities_filter (List[str] | None): Shell-style patterns of the severities to process, all if empty. The
+            queries of the other severities are left out of the returned queries.
+        shard (Shard | None): Shard of the products to process, all if None.
 
     Returns:
         List[Dict[Any, Any]]: A list of dictionaries that hold the product and its queries
@@ -74,12 +206,24 @@ def process_products(products_dict: Dict[str, Dict[str, str]], db_session: Sessi
     products: List[Dict[Any, Any]] = []
 
     for name, queries in products_dict.items():
+        if not matches_any(value=name, patterns=products_filter or []) or (shard and not shard.contains(name)):
+            continue
+
         try:
             verify_queries(queries_dict=queries)
+            queries = {
+                severity: query
+                for severity, query in queries.items()
+                if matches_any(value=severity, patterns=severities_filter or [])
+            }
+            if not queries:
+                continue
+
             product = db_session.execute(select(ProductsEntity).where(ProductsEntity.name == name)).scalar_one_or_none()
             if product is None:
-                product = ProductsEntity(name=name)
-                db_session.execute(statement=insert(ProductsEntity).values(name=name))
+                product = db_session.execute(
+                    statement=insert(ProductsEntity).values(name=name).returning(ProductsEntity)
+                ).scalar_one()
             products.append({"product": product, "queries": queries})
         except ValueError as err:
             LOGGER.error(f"Error occurred parsing queries for product {name}: {err}")
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from collections import Counter
+from typing import Any, Dict, Tuple, cast
+
+from simple_logger.logger import get_logger
+from sqlalchemy import ColumnElement, CursorResult, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from qe_metrics.libs.database_mapping import IssueCountRollupsEntity, JiraIssuesEntity
+
+LOGGER = get_logger(name=__name__)
+
+# Columns the issue counts are grouped by
+ISSUE_COUNT_GROUP_COLUMNS = ("product_id", "severity", "status", "issue_type", "customer_escaped")
+# Number of count mismatches logged by a rollup rebuild
+MAX_LOGGED_MISMATCHES = 20
+
+
+def count_issues(db_session: Session, *conditions: ColumnElement[bool]) -> Counter[Tuple[Any, ...]]:
+    """
+    Count the issues matching `conditions`, grouped by `ISSUE_COUNT_GROUP_COLUMNS`.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        *conditions (ColumnElement[bool]): Conditions on the JiraIssuesEntity columns.
+
+    Returns:
+        Counter[Tuple[Any, ...]]: Number of issues keyed by the values of `ISSUE_COUNT_GROUP_COLUMNS`.
+    """
+    group_columns = [getattr(JiraIssuesEntity, column) for column in ISSUE_COUNT_GROUP_COLUMNS]
+    return Counter({
+        tuple(group): issue_count
+        for *group, issue_count in db_session.execute(
+            select(*group_columns, func.count()).where(*conditions).group_by(*group_columns)
+        )
+    })
+
+
+def update_issue_count_rollup(deltas: Counter[Tuple[Any, ...]], db_session: Session) -> None:
+    """
+    Add issue count deltas to the rollup. The change is committed by the caller, with the issue changes it reflects.
+
+    Args:
+        deltas (Counter[Tuple[Any, ...]]): Changes of the issue counts keyed by the values of
+            `ISSUE_COUNT_GROUP_COLUMNS`.
+        db_session (Session): SQLAlchemy Session instance.
+    """
+    if not any(deltas.values()):
+        return
+
+    group_columns = [getattr(IssueCountRollupsEntity, column) for column in ISSUE_COUNT_GROUP_COLUMNS]
+    for group, delta in deltas.items():
+        if not delta:
+            continue
+
+        result = cast(
+            CursorResult[Any],
+            db_session.execute(
+                statement=update(IssueCountRollupsEntity)
+                .where(*[column == value for column, value in zip(group_columns, group)])
+                .values(issue_count=IssueCountRollupsEntity.issue_count + delta)
+            ),
+        )
+        if result.rowcount:
+            continue
+
+        if delta < 0:
+            LOGGER.warning(f"Issue count rollup has no row for {group}, it will be fixed by the next rebuild")
+            continue
+
+        db_session.execute(
+            statement=insert(IssueCountRollupsEntity).values(
+                issue_count=delta, **dict(zip(ISSUE_COUNT_GROUP_COLUMNS, group))
+            )
+        )
+
+    db_session.execute(statement=delete(IssueCountRollupsEntity).where(IssueCountRollupsEntity.issue_count <= 0))
+
+
+def subtract_issues_from_rollup(db_session: Session, *conditions: ColumnElement[bool]) -> None:
+    """
+    Subtract the issues matching `conditions` from the rollup, before they are deleted by the caller.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+        *conditions (ColumnElement[bool]): Conditions on the JiraIssuesEntity columns.
+    """
+    update_issue_count_rollup(
+        deltas=Counter({group: -issue_count for group, issue_count in count_issues(db_session, *conditions).items()}),
+        db_session=db_session,
+    )
+
+
+def rebuild_issue_count_rollup(db_session: Session) -> int:
+    """
+    Recount the issues of the jiraissues table and replace the rollup if it differs, logging the mismatching counts.
+
+    Args:
+        db_session (Session): SQLAlchemy Session instance.
+
+    Returns:
+        int: Number of mismatching rollup counts.
+    """
+    expected_counts = count_issues(db_session)
+    group_columns = [getattr(IssueCountRollupsEntity, column) for column in ISSUE_COUNT_GROUP_COLUMNS]
+    rollup_counts: Dict[Tuple[Any, ...], int] = {
+        tuple(group): issue_count
+        for *group, issue_count in db_session.execute(select(*group_columns, IssueCountRollupsEntity.issue_count))
+    }
+    mismatches = [
+        (group, rollup_counts.get(group, 0), expected_counts.get(group, 0))
+        for group in expected_counts.keys() | rollup_counts.keys()
+        if rollup_counts.get(group, 0) != expected_counts.get(group, 0)
+    ]
+    if not mismatches:
+        return 0
+
+    for group, rollup_count, expected_count in mismatches[:MAX_LOGGED_MISMATCHES]:
+        LOGGER.warning(f"Issue count rollup of {group} is {rollup_count}, expected {expected_count}")
+    LOGGER.warning(f"Rebuilding the issue count rollup, {len(mismatches)} counts mismatched")
+
+    db_session.execute(statement=delete(IssueCountRollupsEntity))
+    if expected_counts:
+        db_session.execute(
+            insert(IssueCountRollupsEntity),
+            [
+                {**dict(zip(ISSUE_COUNT_GROUP_COLUMNS, group)), "issue_count": issue_count}
+                for group, issue_count in expected_counts.items()
+            ],
+        )
+    db_session.commit()
+    return len(mismatches)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+from simple_logger.logger import get_logger
+
+from qe_metrics.libs.jira import JiraIssueRecord, SearchProbe
+from qe_metrics.utils.general import ClosableIterator
+from qe_metrics.utils.metrics_utils import METRICS
+
+LOGGER = get_logger(name=__name__)
+
+# Quoted strings, and the other runs of characters of a JQL query
+JQL_TOKEN_REGEX = re.compile(r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[^\s"']+""")
+# JQL keywords, which are case-insensitive
+JQL_KEYWORDS = {"and", "or", "not", "in", "is", "was", "empty", "null", "order", "by", "asc", "desc"}
+# Clauses evaluated locally on the issues of a broader query: "labels" or "priority", "=" or "in", and the values
+LOCAL_CLAUSE_REGEX = re.compile(r"^(labels|priority)\s*(=|in)\s*(.+)$", re.IGNORECASE)
+JQL_VALUE_REGEX = re.compile(r""""((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'|([^\s,()"']+)""")
+
+IssuePredicate = Callable[[JiraIssueRecord], bool]
+
+
+def normalize_jql(query: str) -> str:
+    """
+    Normalize the whitespace and the case of the keywords of a JQL query, leaving quoted strings untouched.
+
+    Args:
+        query (str): JQL query.
+
+    Returns:
+        str: The normalized query, equal for queries only differing by whitespace and keyword case.
+    """
+    tokens = [
+        part
+        for token in JQL_TOKEN_REGEX.findall(query)
+        for part in ([token] if token[0] in "\"'" else re.split(r"([()])", token))
+        if part
+    ]
+    return " ".join(token.lower() if token.lower() in JQL_KEYWORDS else token for token in tokens)
+
+
+def is_conjunctive_query(query: str) -> bool:
+    """
+    Args:
+        query (str): Normalized JQL query.
+
+    Returns:
+        bool: True if an "AND" clause appended to the query restricts its issues, i.e. the query has no top-level "OR"
+            and no "ORDER BY".
+    """
+    depth = 0
+    for token in JQL_TOKEN_REGEX.findall(query):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token == "order" or (token == "or" and depth == 0):
+            return False
+    return True
+
+
+def parse_local_clause(clause: str) -> Optional[IssuePredicate]:
+    """
+    Parse a "labels" or "priority" clause of a JQL query, e.g. `labels = 'critical'` or `priority in (Blocker, Major)`,
+    to evaluate it on the issues of a broader query. Values are compared case-insensitively, like Jira does.
+
+    Args:
+        clause (str): Normalized JQL clause.
+
+    Returns:
+        Optional[IssuePredicate]: Whether an issue matches the clause, None if the clause is not supported.
+    """
+    if not (match := LOCAL_CLAUSE_REGEX.match(clause)):
+        return None
+
+    field, operator, raw_values = match.groups()
+    if operator.lower() == "in":
+        if not (raw_values.startswith("(") and raw_values.endswith(")")):
+            return None
+        raw_values = raw_values[1:-1]
+
+    values_match = [value_match.groups() for value_match in JQL_VALUE_REGEX.finditer(raw_values)]
+    values = {next(group for group in groups if group is not None).lower() for groups in values_match}
+    if not values or (operator == "=" and len(values_match) != 1) or JQL_VALUE_REGEX.sub("", raw_values).strip(" ,"):
+        return None
+
+    # EMPTY and NULL are not values, and priorities may be given by ID instead of name
+    unquoted_values = {unquoted.lower() for *_, unquoted in values_match if unquoted is not None}
+    if unquoted_values & JQL_KEYWORDS or (field.lower() == "priority" and any(value.isdigit() for value in values)):
+        return None
+
+    if field.lower() == "labels":
+        return lambda issue: any(label.lower() in values for label in issue.labels)
+    return lambda issue: issue.priority is not None and issue.priority.lower() in values
+
+
+class SharedSearch:
+    """
+    Issues of a Jira search read by several consumers one after the other, fetched once and kept until the last
+    consumer is closed.
+    """
+
+    def __init__(self, source: ClosableIterator[JiraIssueRecord], consumers: int) -> None:
+        self._source = source
+        self._consumers = consumers
+        self._issues: List[JiraIssueRecord] = []
+        self._exhausted = False
+        self._error: Optional[Exception] = None
+
+    def get(self, index: int) -> JiraIssueRecord:
+        """
+        Args:
+            index (int): Index of an issue of the search.
+
+        Returns:
+            JiraIssueRecord: The issue, fetched from the source if no consumer read it yet.
+
+        Raises:
+            StopIteration: If the search has fewer issues.
+        """
+        while index >= len(self._issues):
+            if self._error:
+                raise self._error
+            if self._exhausted:
+                raise StopIteration
+
+            try:
+                self._issues.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+            except Exception as ex:
+                # Later consumers fail the same way instead of reading a truncated search
+                self._error = ex
+                raise
+        return self._issues[index]
+
+    def release(self) -> None:
+        """
+        Close a consumer, stopping the search and dropping its issues once all the consumers are closed.
+        """
+        self._consumers -= 1
+        if self._consumers == 0:
+            self._source.close()
+            self._issues = []
+
+
+class SharedSearchIterator(ClosableIterator[JiraIssueRecord]):
+    """
+    A consumer of a `SharedSearch`, returning the issues matching its predicates.
+    """
+
+    def __init__(self, search: SharedSearch, predicates: List[IssuePredicate]) -> None:
+        self._search = search
+        self._predicates = predicates
+        self._index = 0
+        self._closed = False
+
+    def __next__(self) -> JiraIssueRecord:
+        if self._closed:
+            raise StopIteration
+
+        while True:
+            issue = self._search.get(index=self._index)
+            self._index += 1
+            if all(predicate(issue) for predicate in self._predicates):
+                return issue
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._search.release()
+
+
+def find_broader_search(
+    index: int, candidates: List[int], normalized_queries: List[Tuple[str, str]]
+) -> Optional[Tuple[int, IssuePredicate]]:
+    """
+    Find a search whose issues, filtered locally, are the issues of the search `index`: its query is the query of the
+    other search, followed by "AND" and a clause supported by `parse_local_clause`, with the same "updated" conditions.
+
+    Args:
+        index (int): Index of a search.
+        candidates (List[int]): Indexes of the searches that may be broader.
+        normalized_queries (List[Tuple[str, str]]): The normalized queries of the searches, without and with the
+            conditions on the "updated" field.
+
+    Returns:
+        Optional[Tuple[int, IssuePredicate]]: The index of the broader search and the predicate of the clause.
+    """
+    query, full_query = normalized_queries[index]
+    if not full_query.startswith(query):
+        return None
+
+    for candidate in candidates:
+        broader_query, broader_full_query = normalized_queries[candidate]
+        if (
+            query.startswith(f"{broader_query} and ")
+            and broader_full_query == broader_query + full_query[len(query) :]
+            and is_conjunctive_query(query=broader_query)
+            and (predicate := parse_local_clause(clause=query[len(broader_query) + len(" and ") :]))
+        ):
+            return candidate, predicate
+    return None
+
+
+def stream_searches(
+    jira: Any, queries: List[Tuple[str, str]], local_subsets: bool = False
+) -> List[ClosableIterator[JiraIssueRecord]]:
+    """
+    Start the Jira searches of a sync, executing identical queries once.
+
+    With `local_subsets`, a query made of another query of the sync followed by "AND" and a "labels" or "priority"
+    clause supported by `parse_local_clause` is answered from the issues of the other query, without searching Jira.
+    The issues must then be fetched with the `LOCAL_FILTER_FIELDS`.
+
+    The issues of a search read by several queries are kept in memory until the last of them is closed, so the
+    searches must be read one after the other.
+
+    Args:
+        jira (Any): A Jira or AsyncJira instance.
+        queries (List[Tuple[str, str]]): The query of each search, without and with the conditions on the "updated"
+            field added by the sync.
+        local_subsets (bool): Whether to evaluate the label and priority clauses of queries locally.
+
+    Returns:
+        List[ClosableIterator[JiraIssueRecord]]: The issues of each search, in the order of `queries`.
+    """
+    normalized_queries = [
+        (normalize_jql(query=query), normalize_jql(query=full_query)) for query, full_query in queries
+    ]
+    # Index of the first search of each normalized query
+    first_searches: Dict[str, int] = {}
+    # Index of the search fetched from Jira for each search, and the predicates of its local clauses
+    origins: Dict[int, Tuple[int, List[IssuePredicate]]] = {}
+    # Shorter queries first, so the broader queries are known when their subsets are reached
+    for index in sorted(range(len(queries)), key=lambda index: len(normalized_queries[index][1])):
+        full_query = normalized_queries[index][1]
+        if (first_search := first_searches.get(full_query)) is not None:
+            LOGGER.info(f'Reusing the issues of the identical Jira query "{queries[index][1]}"')
+            METRICS.inc("qe_metrics_cached_searches_total", reason="duplicate")
+            origins[index] = origins[first_search]
+            continue
+
+        candidates = list(first_searches.values())
+        first_searches[full_query] = index
+        if local_subsets and (
+            broader_search := find_broader_search(
+                index=index, candidates=candidates, normalized_queries=normalized_queries
+            )
+        ):
+            broader_index, predicate = broader_search
+            LOGGER.info(f'Filtering the issues of Jira query "{queries[broader_index][1]}" for "{queries[index][1]}"')
+            METRICS.inc("qe_metrics_cached_searches_total", reason="subset")
+            source_index, predicates = origins[broader_index]
+            origins[index] = (source_index, [*predicates, predicate])
+        else:
+            origins[index] = (index, [])
+
+    consumers: Dict[int, List[int]] = {}
+    for index in range(len(queries)):
+        consumers.setdefault(origins[index][0], []).append(index)
+
+    streams: List[Optional[ClosableIterator[JiraIssueRecord]]] = [None] * len(queries)
+    for source_index, consumer_indexes in consumers.items():
+        source = jira.stream_search(query=queries[source_index][1])
+        if len(consumer_indexes) == 1:
+            streams[source_index] = source
+            continue
+
+        shared_search = SharedSearch(source=source, consumers=len(consumer_indexes))
+        for consumer_index in consumer_indexes:
+            streams[consumer_index] = SharedSearchIterator(search=shared_search, predicates=origins[consumer_index][1])
+    return cast(List[ClosableIterator[JiraIssueRecord]], streams)
+
+
+def probe_searches(jira: Any, queries: List[str]) -> List[Optional[SearchProbe]]:
+    """
+    Probe the Jira searches of a sync, probing identical queries once.
+
+    Args:
+        jira (Any): A Jira or AsyncJira instance.
+        queries (List[str]): JQL queries to probe.
+
+    Returns:
+        List[Optional[SearchProbe]]: The probe of each query, None if it failed.
+    """
+    unique_queries: Dict[str, str] = {}
+    for query in queries:
+        unique_queries.setdefault(normalize_jql(query=query), query)
+
+    probes = dict(zip(unique_queries, jira.probe_searches(queries=list(unique_queries.values()))))
+    return [probes[normalize_jql(query=query)] for query in queries]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+from datetime import date, timedelta
+from typing import Any, cast
+
+from pyhelper_utils.general import ignore_exceptions
+from simple_logger.logger import get_logger
+from sqlalchemy import CursorResult, delete, exists, insert, literal, select
+from sqlalchemy.orm import Session
+
+from qe_metrics.libs.database_mapping import IssueCountRollupsEntity, IssueCountSnapshotsEntity
+from qe_metrics.utils.rollup_utils import ISSUE_COUNT_GROUP_COLUMNS, rebuild_issue_count_rollup
+
+LOGGER = get_logger(name=__name__)
+
+
+@ignore_exceptions(logger=LOGGER, return_on_error=False)
+def take_issue_count_snapshot(snapshot_date: date, retention_days: int, db_session: Session) -> bool:
+    """
+    Store the issue count rollup as the snapshot of `snapshot_date`, replacing a snapshot already taken that day, and
+    delete the expired snapshots.
+
+    The first snapshot of a day rebuilds the rollup from the jiraissues table first, so counts drifting from the
+    incremental updates are fixed daily.
+
+    Args:
+        snapshot_date (date): Day of the snapshot.
+        retention_days (int): Number of days snapshots are kept.
+        db_session (Session): SQLAlchemy Session instance.
+
+    Returns:
+        bool: True if the snapshot was stored.
+    """
+    if not db_session.execute(
+        select(exists().where(IssueCountSnapshotsEntity.snapshot_date == snapshot_date))
+    ).scalar_one():
+        rebuild_issue_count_rollup(db_session=db_session)
+
+    db_session.execute(
+        statement=delete(IssueCountSnapshotsEntity).where(
+            (IssueCountSnapshotsEntity.snapshot_date == snapshot_date)
+            | (IssueCountSnapshotsEntity.snapshot_date < snapshot_date - timedelta(days=retention_days))
+        )
+    )
+    result = cast(
+        CursorResult[Any],
+        db_session.execute(
+            statement=insert(IssueCountSnapshotsEntity).from_select(
+                ["snapshot_date", *ISSUE_COUNT_GROUP_COLUMNS, "issue_count"],
+                select(
+                    literal(snapshot_date, type_=IssueCountSnapshotsEntity.snapshot_date.type),
+                    *[getattr(IssueCountRollupsEntity, column) for column in ISSUE_COUNT_GROUP_COLUMNS],
+                    IssueCountRollupsEntity.issue_count,
+                ),
+            )
+        ),
+    )
+    db_session.commit()
+    LOGGER.info(f"Stored issue count snapshot of {snapshot_date}: {result.rowcount} rows")
+    return True
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import hashlib
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+
+from simple_logger.logger import get_logger
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from qe_metrics.libs.database_mapping import ProductsEntity, SyncStateEntity
+from qe_metrics.libs.jira import SearchProbe
+
+LOGGER = get_logger(name=__name__)
+
+# Extra minutes queried by incremental syncs, to cover issues updated while the previous sync was running
+SYNC_OVERLAP_MINUTES = 5
+
+
+def utc_now() -> datetime:
+    """
+    Returns:
+        datetime: Current UTC time as a naive datetime, the way sync timestamps are stored in the database.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def get_query_hash(query: str) -> str:
+    """
+    Args:
+        query (str): JQL query, as defined in the products file.
+
+    Returns:
+        str: SHA-256 hex digest of the query, used to reset the sync state when a query changes.
+    """
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def get_sync_state(product: ProductsEntity, severity: str, query: str, db_session: Session) -> SyncStateEntity | None:
+    """
+    Get the sync state of a product query.
+
+    Args:
+        product (ProductsEntity): The product object the query belongs to.
+        severity (str): Severity of the query.
+        query (str): JQL query, as defined in the products file.
+        db_session (Session): SQLAlchemy Session instance.
+
+    Returns:
+        SyncStateEntity | None: The sync state, or None if the query was never synced.
+    """
+    return db_session.execute(
+        select(SyncStateEntity).where(
+            SyncStateEntity.product_id == product.id,
+            SyncStateEntity.severity == severity,
+            SyncStateEntity.query_hash == get_query_hash(query=query),
+        )
+    ).scalar_one_or_none()
+
+
+def build_sync_query(
+    query: str, sync_state: SyncStateEntity | None, full_sync_interval: timedelta, now: datetime
+) -> Tuple[str, bool]:
+    """
+    Restrict a query to the issues updated since the last sync, unless a full sync is due.
+
+    A full sync is due when the query was never synced or the last full sync is older than `full_sync_interval`.
+
+    Args:
+        query (str): JQL query, already restricted to the data retention window.
+        sync_state (SyncStateEntity | None): The sync state of the query.
+        full_sync_interval (timedelta): Maximum time between two full syncs.
+        now (datetime): Start time of the sync, as returned by `utc_now`.
+
+    Returns:
+        Tuple[str, bool]: The query to execute, and whether it is a full sync.
+    """
+    if sync_state is None or now - sync_state.last_full_sync >= full_sync_interval:
+        return query, True
+
+    # A relative date is evaluated by the Jira server, so clock differences between hosts do not matter
+    minutes_since_sync = math.ceil((now - sync_state.last_synced).total_seconds() / 60)
+    return f'{query} AND updated >= "-{minutes_since_sync + SYNC_OVERLAP_MINUTES}m"', False
+
+
+def is_query_unchanged(
+    sync_state: SyncStateEntity | None, probe: SearchProbe | None, full_sync_interval: timedelta, now: datetime
+) -> bool:
+    """
+    Check whether the issues matching a query are unchanged since its last sync, so the sync can be skipped.
+
+    The issues are unchanged when Jira reports the same number of issues and the same most recent "updated" value as
+    at the last sync. A query is never skipped when its full sync is due.
+
+    Args:
+        sync_state (SyncStateEntity | None): The sync state of the query.
+        probe (SearchProbe | None): The current probe of the query, None if it could not be probed.
+        full_sync_interval (timedelta): Maximum time between two full syncs.
+        now (datetime): Start time of the sync, as returned by `utc_now`.
+
+    Returns:
+        bool: True if the sync of the query can be skipped.
+    """
+    return (
+        sync_state is not None
+        and probe is not None
+        and sync_state.issue_count == probe.total
+        and sync_state.max_updated == probe.max_updated
+        and now - sync_state.last_full_sync < full_sync_interval
+    )
+
+
+def save_sync_state(
+    product: ProductsEntity,
+    severity: str,
+    query: str,
+    synced_at: datetime,
+    full_sync: bool,
+    db_session: Session,
+    probe: SearchProbe | None = None,
+) -> None:
+    """
+    Record a successful sync of a product query. The change is committed with the synced issues.
+
+    Args:
+        product (ProductsEntity): The product object the query belongs to.
+        severity (str): Severity of the query.
+        query (str): JQL query, as defined in the products file.
+        synced_at (datetime): Start time of the sync, as returned by `utc_now`.
+        full_sync (bool): Whether all issues of the query were synced.
+        db_session (Session): SQLAlchemy Session instance.
+        probe (SearchProbe | None): The probe of the query taken before the sync.
+    """
+    if sync_state := get_sync_state(product=product, severity=severity, query=query, db_session=db_session):
+        sync_state.last_synced = synced_at
+        if full_sync:
+            sync_state.last_full_sync = synced_at
+    elif full_sync:
+        sync_state = SyncStateEntity(
+            product_id=product.id,
+            severity=severity,
+            query_hash=get_query_hash(query=query),
+            last_synced=synced_at,
+            last_full_sync=synced_at,
+        )
+        db_session.add(sync_state)
+    else:
+        return
+
+    sync_state.issue_count = probe.total if probe else None
+    sync_state.max_updated = probe.max_updated if probe else None
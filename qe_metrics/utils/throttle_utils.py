@@ -0,0 +1,300 @@
+from __future__ import annotations
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from simple_logger.logger import get_logger
+
+from qe_metrics.utils.metrics_utils import METRICS
+
+LOGGER = get_logger(name=__name__)
+
+# Responses that are retried, honouring their Retry-After header
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 60
+MAX_RETRY_AFTER_SECONDS = 300
+# Seconds between two checks for a free request slot, when the concurrency limit is reached
+SLOT_POLL_SECONDS = 0.05
+# Minimum number of seconds between two decreases of the concurrency limit, so a burst of throttled responses to the
+# requests sent at the same limit only halves it once
+DECREASE_INTERVAL_SECONDS = 1.0
+# Seconds a request waits for Jira to recover before giving up
+MAX_WAIT_SECONDS = 600
+
+# Outcomes of the requests released to the throttle
+SUCCESS = "success"
+THROTTLED = "throttled"
+FAILURE = "failure"
+
+
+class JiraUnavailableError(Exception):
+    """
+    Raised when a request waited longer than `MAX_WAIT_SECONDS` for the Jira throttle.
+    """
+
+
+class ThrottleSlot(NamedTuple):
+    """
+    A request slot taken from a `JiraThrottle`, to give back with `JiraThrottle.release`.
+    """
+
+    # Whether the request is the single trial request sent once the circuit open period is over
+    trial: bool
+
+
+def get_retry_delay(retry_after: str | None, attempt: int) -> float:
+    """
+    Get the number of seconds to wait before retrying a Jira request.
+
+    Args:
+        retry_after (str | None): Value of the Retry-After response header, in seconds or as an HTTP date.
+        attempt (int): Number of the failed attempt, starting at 0.
+
+    Returns:
+        float: The Retry-After delay if set, otherwise an exponential backoff delay with jitter, between half and all of
+            `2 ** attempt` seconds, so the requests failing together are not retried together.
+    """
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0), MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0), MAX_RETRY_AFTER_SECONDS)
+            except (TypeError, ValueError):
+                LOGGER.warning(f'Ignoring invalid Retry-After header "{retry_after}"')
+
+    backoff = min(2**attempt, MAX_BACKOFF_SECONDS)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def get_request_outcome(status: Optional[int]) -> str:
+    """
+    Args:
+        status (Optional[int]): HTTP status of a Jira response, None if the request failed without a response.
+
+    Returns:
+        str: `THROTTLED` for HTTP 429, `FAILURE` for server errors and failed connections, `SUCCESS` otherwise, as
+            client errors do not tell anything about the health of Jira.
+    """
+    if status == 429:
+        return THROTTLED
+    if status is None or status >= 500:
+        return FAILURE
+    return SUCCESS
+
+
+class JiraThrottle:
+    """
+    Limits of the requests sent to Jira, shared by all the searches of a sync.
+
+    - A token bucket caps the request rate to `rate` requests per second, with bursts of up to `burst` requests.
+    - An adaptive concurrency limit (AIMD) grows by one request per round of fast successful requests, and is halved
+      when Jira throttles a request, fails or answers slower than `slow_request_seconds`. A Retry-After header of a
+      throttled response pauses all the requests.
+    - A circuit breaker pauses all the requests for `open_seconds` after `failure_threshold` consecutive failures. A
+      single trial request is then sent: the circuit closes if it succeeds, otherwise it opens again for twice as long,
+      up to `max_open_seconds`.
+
+    `try_acquire` does not block, so the throttle is shared by threads (`acquire`) and coroutines (`acquire_async`).
+    The slot it returns must be given back to `release`, so only the trial request clears the trial in flight.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        rate: float = 10.0,
+        burst: int = 10,
+        slow_request_seconds: float = 10.0,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            max_concurrency (int): Maximum number of requests in flight.
+            rate (float): Maximum number of requests per second.
+            burst (int): Maximum number of requests sent at once after an idle period.
+            slow_request_seconds (float): Duration above which a successful request decreases the concurrency limit.
+            failure_threshold (int): Number of consecutive failed requests opening the circuit.
+            open_seconds (float): Seconds the circuit first stays open.
+            max_open_seconds (float): Maximum number of seconds the circuit stays open.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+        """
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.slow_request_seconds = slow_request_seconds
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self._clock = clock
+        self._lock = Lock()
+        self.limit = float(max_concurrency)
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._paused_until = 0.0
+        self._decreased_at: Optional[float] = None
+        self._failures = 0
+        self._next_open_seconds = open_seconds
+        self._trial_in_flight = False
+        METRICS.set("qe_metrics_jira_concurrency_limit", max_concurrency)
+
+    @classmethod
+    def from_config(cls, jira_config: Dict[str, Any], max_concurrency: int) -> "JiraThrottle":
+        """
+        Args:
+            jira_config (Dict[str, Any]): The "jira" section of the configuration.
+            max_concurrency (int): Maximum number of requests in flight.
+
+        Returns:
+            JiraThrottle: A throttle configured by the "rate_limit" and "circuit_breaker" settings.
+        """
+        rate_limit = jira_config.get("rate_limit", {})
+        circuit_breaker = jira_config.get("circuit_breaker", {})
+        rate = float(rate_limit.get("requests_per_second", 10))
+        return cls(
+            max_concurrency=max_concurrency,
+            rate=rate,
+            burst=int(rate_limit.get("burst", max(int(rate), 1))),
+            slow_request_seconds=float(rate_limit.get("slow_request_seconds", 10)),
+            failure_threshold=int(circuit_breaker.get("failure_threshold", 5)),
+            open_seconds=float(circuit_breaker.get("open_seconds", 30)),
+            max_open_seconds=float(circuit_breaker.get("max_open_seconds", 300)),
+        )
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._failures >= self.failure_threshold
+
+    def try_acquire(self) -> Tuple[float, Optional[ThrottleSlot]]:
+        """
+        Take a request slot, if the circuit, the concurrency limit and the rate limit allow it.
+
+        Returns:
+            Tuple[float, Optional[ThrottleSlot]]: 0 and the slot taken, to give back with `release`, otherwise the
+                number of seconds to wait before trying again and None.
+        """
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now, None
+
+            # Once the circuit open period is over, a single trial request is sent
+            if self.circuit_open and self._trial_in_flight:
+                return SLOT_POLL_SECONDS, None
+            if self._in_flight >= int(self.limit):
+                return SLOT_POLL_SECONDS, None
+
+            self._tokens = min(self._tokens + (now - self._refilled_at) * self.rate, self.burst)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate, None
+
+            self._tokens -= 1
+            self._in_flight += 1
+            slot = ThrottleSlot(trial=self.circuit_open)
+            if slot.trial:
+                self._trial_in_flight = True
+            return 0.0, slot
+
+    def release(self, slot: ThrottleSlot, outcome: str, duration: float, retry_after: Optional[float] = None) -> None:
+        """
+        Give back a request slot, adapting the limits to the outcome of the request.
+
+        Args:
+            slot (ThrottleSlot): The slot returned by `try_acquire`.
+            outcome (str): `SUCCESS`, `THROTTLED` or `FAILURE`, see `get_request_outcome`.
+            duration (float): Duration of the request in seconds.
+            retry_after (Optional[float]): Seconds all the requests must wait for, for a throttled request.
+        """
+        with self._lock:
+            now = self._clock()
+            self._in_flight -= 1
+            # Requests sent before the circuit opened must not allow a second trial request
+            if slot.trial:
+                self._trial_in_flight = False
+
+            if outcome == SUCCESS:
+                if self.circuit_open:
+                    LOGGER.info("Jira recovered, resuming requests")
+                self._failures = 0
+                self._next_open_seconds = self.open_seconds
+                if duration > self.slow_request_seconds:
+                    self._decrease(now=now)
+                else:
+                    self._set_limit(limit=min(self.limit + 1 / self.limit, self.max_concurrency))
+                return
+
+            self._decrease(now=now)
+            if outcome == THROTTLED:
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                return
+
+            self._failures += 1
+            if self.circuit_open:
+                LOGGER.warning(
+                    f"{self._failures} consecutive Jira requests failed, pausing requests for "
+                    f"{self._next_open_seconds:.0f} seconds"
+                )
+                METRICS.inc("qe_metrics_jira_circuit_opened_total")
+                self._paused_until = max(self._paused_until, now + self._next_open_seconds)
+                self._next_open_seconds = min(self._next_open_seconds * 2, self.max_open_seconds)
+
+    def acquire(self) -> ThrottleSlot:
+        """
+        Wait for a request slot in the current thread.
+
+        Returns:
+            ThrottleSlot: The slot taken, to give back with `release`.
+
+        Raises:
+            JiraUnavailableError: If no slot was available for `MAX_WAIT_SECONDS`.
+        """
+        deadline = self._clock() + MAX_WAIT_SECONDS
+        while True:
+            delay, slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            self._check_deadline(deadline=deadline, delay=delay)
+            time.sleep(delay)
+
+    async def acquire_async(self) -> ThrottleSlot:
+        """
+        Wait for a request slot in the current coroutine.
+
+        Returns:
+            ThrottleSlot: The slot taken, to give back with `release`.
+
+        Raises:
+            JiraUnavailableError: If no slot was available for `MAX_WAIT_SECONDS`.
+        """
+        deadline = self._clock() + MAX_WAIT_SECONDS
+        while True:
+            delay, slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            self._check_deadline(deadline=deadline, delay=delay)
+            await asyncio.sleep(delay)
+
+    def _check_deadline(self, deadline: float, delay: float) -> None:
+        if self._clock() + delay > deadline:
+            raise JiraUnavailableError(f"Jira requests are paused for {delay:.0f} more seconds, giving up")
+
+    def _decrease(self, now: float) -> None:
+        if self._decreased_at is None or now - self._decreased_at >= DECREASE_INTERVAL_SECONDS:
+            self._decreased_at = now
+            self._set_limit(limit=max(self.limit / 2, 1.0))
+
+    def _set_limit(self, limit: float) -> None:
+        if int(limit) != int(self.limit):
+            LOGGER.debug(f"Jira concurrency limit set to {int(limit)}")
+            METRICS.set("qe_metrics_jira_concurrency_limit", int(limit))
+        self.limit = limit
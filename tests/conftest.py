@@ -1,10 +1,16 @@
+import json
+import threading
+import time
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 import pytest
 import yaml
 from sqlalchemy.orm import Session
-from sqlalchemy import insert
+from sqlalchemy import event, insert
 from qe_metrics.libs.database import Database
 from qe_metrics.libs.database_mapping import ProductsEntity, JiraIssuesEntity
+from qe_metrics.libs.jira import issue_record_from_json
 
 
 @pytest.fixture
@@ -14,6 +20,19 @@ def db_session(tmp_db_config) -> Session:
         yield db_session
 
 
+@pytest.fixture
+def executed_statements(db_session):
+    statements = []
+
+    def _record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _record_statement)
+    yield statements
+    event.remove(engine, "before_cursor_execute", _record_statement)
+
+
 @pytest.fixture
 def tmp_db_config(tmp_path_factory) -> str:
     tmp_dir = tmp_path_factory.mktemp(basename="qe-metrics-test")
@@ -53,20 +72,149 @@ def jira_issues(request, db_session, product):
 
 
 @pytest.fixture
-def raw_jira_issues(request, mocker):
-    issues = []
-    for issue in request.param:
-        mock_issue = mocker.MagicMock()
-        mock_issue.key = issue["key"]
-        mock_issue.fields.project.key = issue["key"].split("-")[0]
-        mock_issue.fields.summary = issue["title"]
-        mock_issue.fields.status.name = issue.get("status", "In Progress")
-        mock_issue.fields.issuetype.name = issue.get("issue_type", "bug")
-        mock_issue.fields.customfield_12313440 = issue.get("customer_escaped", "0.0")
-        mock_issue.is_customer_escaped = float(getattr(mock_issue.fields, "customfield_12313440")) > 0
-        mock_issue.fields.updated = issue.get(
-            "last_updated", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+def raw_jira_issues(request):
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+    yield [
+        issue_record_from_json(
+            raw_issue={
+                "key": issue["key"],
+                "fields": {
+                    "summary": issue["title"],
+                    "project": {"key": issue["key"].split("-")[0]},
+                    "status": {"name": issue.get("status", "In Progress")},
+                    "issuetype": {"name": issue.get("issue_type", "bug")},
+                    "customfield_12313440": issue.get("customer_escaped", "0.0"),
+                    "created": issue.get("created", now),
+                    "updated": issue.get("last_updated", now),
+                },
+            },
+            customer_escaped_field="customfield_12313440",
         )
-        mock_issue.fields.created = issue.get("created", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f%z"))
-        issues.append(mock_issue)
-    yield issues
+        for issue in request.param
+    ]
+
+
+class FakeJiraRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Jira REST endpoints used by qe-metrics from the issues held by the FakeJiraServer.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append(url)
+        if self.server.throttled_responses:
+            self.server.throttled_responses -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        if url.path == "/rest/api/2/myself":
+            body = {"name": "qe-metrics"}
+        elif url.path == "/rest/api/2/field":
+            body = []
+        elif url.path == "/rest/api/2/mypermissions":
+            body = {"permissions": {}}
+        elif url.path == "/rest/api/2/serverInfo":
+            body = {
+                "baseUrl": self.server.url,
+                "version": "9.12.0",
+                "versionNumbers": [9, 12, 0],
+                "deploymentType": "Server",
+            }
+        elif url.path == "/rest/api/2/search":
+            params = parse_qs(url.query)
+            if any(failing_query in params["jql"][0] for failing_query in self.server.failing_queries):
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            start_at, max_results = int(params.get("startAt", ["0"])[0]), int(params["maxResults"][0])
+            # Probes request a single issue, only the pages of the searches are counted
+            if max_results > 1:
+                with self.server.lock:
+                    self.server.searches_in_flight += 1
+                    self.server.max_searches_in_flight = max(
+                        self.server.max_searches_in_flight, self.server.searches_in_flight
+                    )
+                try:
+                    time.sleep(self.server.search_seconds)
+                finally:
+                    with self.server.lock:
+                        self.server.searches_in_flight -= 1
+
+            body = {
+                "startAt": start_at,
+                "maxResults": max_results,
+                "total": len(self.server.issues),
+                "issues": self.server.issues[start_at : start_at + max_results],
+            }
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeJiraServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeJiraRequestHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.issues = []
+        self.requests = []
+        self.throttled_responses = 0
+        # Search requests whose JQL holds one of these strings fail with HTTP 400
+        self.failing_queries = set()
+        # Seconds each search page request takes, and the maximum number of search page requests served at once
+        self.search_seconds = 0.0
+        self.searches_in_flight = 0
+        self.max_searches_in_flight = 0
+        self.lock = threading.Lock()
+
+
+@pytest.fixture
+def fake_jira_server():
+    server = FakeJiraServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_jira_config(tmp_path, fake_jira_server):
+    config_file = tmp_path / "config.yaml"
+    with open(config_file, "w") as tmp_config:
+        yaml.dump({"jira": {"server": fake_jira_server.url, "token": "token", "backend": "async"}}, tmp_config)
+    yield str(config_file)
+
+
+@pytest.fixture
+def raw_jira_search_issues(request):
+    yield [
+        {
+            "id": str(index),
+            "key": f"TEST-{index}",
+            "self": f"https://jira.com/rest/api/2/issue/{index}",
+            "fields": {
+                "summary": f"Test Summary {index}",
+                "status": {"name": "In Progress"},
+                "issuetype": {"name": "Bug"},
+                "project": {"key": "TEST"},
+                "created": "2024-01-01T10:00:00.000+0000",
+                "updated": "2024-01-02T10:00:00.000+0000",
+                "customfield_12313440": "1.0" if index % 2 else None,
+            },
+        }
+        for index in range(request.param)
+    ]
@@ -0,0 +1,57 @@
+from urllib.parse import parse_qs
+
+import pytest
+from qe_metrics.libs.async_jira import AsyncJira
+from qe_metrics.libs.jira import SearchProbe
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [5], indirect=True)
+def test_async_jira_search_fetches_all_pages(fake_jira_server, fake_jira_config, raw_jira_search_issues, mocker):
+    mocker.patch("qe_metrics.libs.async_jira.SEARCH_PAGE_SIZE", 2)
+    fake_jira_server.issues = raw_jira_search_issues
+    with AsyncJira(config_file=fake_jira_config) as jira:
+        with jira.stream_search(query="project = TEST") as issues:
+            issues = list(issues)
+
+    assert [issue.key for issue in issues] == [raw_issue["key"] for raw_issue in raw_jira_search_issues]
+    assert [issue.customer_escaped for issue in issues] == [False, True, False, True, False]
+    assert (issues[0].status, issues[0].issue_type) == ("In Progress", "bug")
+    assert len([request for request in fake_jira_server.requests if request.path.endswith("/search")]) == 3
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [1], indirect=True)
+def test_async_jira_retries_throttled_requests(fake_jira_server, fake_jira_config, raw_jira_search_issues):
+    fake_jira_server.issues = raw_jira_search_issues
+    with AsyncJira(config_file=fake_jira_config) as jira:
+        fake_jira_server.throttled_responses = 2
+        assert [issue.key for issue in jira.stream_search(query="project = TEST")] == ["TEST-0"]
+
+    assert len(fake_jira_server.requests) == 4, "Expected the authentication request, 2 throttled and 1 search"
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [3], indirect=True)
+def test_async_jira_probe_searches(fake_jira_server, fake_jira_config, raw_jira_search_issues):
+    fake_jira_server.issues = raw_jira_search_issues
+    with AsyncJira(config_file=fake_jira_config) as jira:
+        probes = jira.probe_searches(queries=["project = TEST", "project = OTHER ORDER BY created"])
+
+    assert probes == [SearchProbe(total=3, max_updated="2024-01-02T10:00:00.000+0000")] * 2
+    assert sorted(
+        parse_qs(request.query)["jql"][0] for request in fake_jira_server.requests if request.path.endswith("/search")
+    ) == ["project = OTHER ORDER BY updated DESC", "project = TEST ORDER BY updated DESC"]
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [5], indirect=True)
+def test_async_search_iterator_fails_when_search_task_is_cancelled(
+    fake_jira_server, fake_jira_config, raw_jira_search_issues, mocker
+):
+    mocker.patch("qe_metrics.libs.async_jira.SEARCH_PAGE_SIZE", 1)
+    mocker.patch("qe_metrics.libs.async_jira.PAGE_POLL_SECONDS", 0.1)
+    fake_jira_server.issues = raw_jira_search_issues
+    with AsyncJira(config_file=fake_jira_config) as jira:
+        with jira.stream_search(query="project = TEST") as issues:
+            assert next(issues).key == "TEST-0"
+            # The search task stops without putting the end of its pages, e.g. when cancelled from the event loop
+            jira._loop.call_soon_threadsafe(issues._task.cancel)
+            with pytest.raises(RuntimeError, match="stopped before returning all its issues"):
+                list(issues)
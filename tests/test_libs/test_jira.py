@@ -1,36 +1,163 @@
-from qe_metrics.libs.jira import Jira
+from datetime import date, datetime
+
+from jira import JIRAError
+from qe_metrics.libs.jira import (
+    Jira,
+    JiraIssueRecord,
+    SearchProbe,
+    get_search_fields,
+    issue_record_from_json,
+    parse_jira_date,
+)
 
 import pytest
+import yaml
+
+
+@pytest.fixture
+def jira(tmp_path, mocker):
+    config_file = tmp_path / "config.yaml"
+    with open(config_file, "w") as tmp_config:
+        yaml.dump(
+            {"jira": {"server": "https://jira.com", "token": "token", "custom_fields": {"team": "customfield_1"}}},
+            tmp_config,
+        )
+    jira = Jira(config_file=str(config_file))
+    jira.connection = mocker.MagicMock()
+    yield jira
 
 
 @pytest.mark.parametrize(
     "raw_jira_issues",
-    [
-        [
-            {
-                "key": "TEST-2234",
-                "title": "New Test Summary",
-                "customer_escaped": "1.0",
-            }
-        ]
-    ],
+    [[{"key": "TEST-2234", "title": "New Test Summary", "customer_escaped": "1.0"}]],
     indirect=True,
 )
-def test_is_customer_escaped_returns_true(raw_jira_issues):
-    assert Jira.is_customer_escaped(raw_jira_issues[0]) is True
+def test_issue_record_is_customer_escaped(raw_jira_issues):
+    assert raw_jira_issues[0].customer_escaped is True
 
 
 @pytest.mark.parametrize(
     "raw_jira_issues",
+    [[{"key": "TEST-2235", "title": "New Test Summary", "customer_escaped": None}]],
+    indirect=True,
+)
+def test_issue_record_is_not_customer_escaped(raw_jira_issues):
+    assert raw_jira_issues[0].customer_escaped is False
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [1], indirect=True)
+def test_issue_record_from_json(raw_jira_search_issues):
+    assert issue_record_from_json(
+        raw_issue=raw_jira_search_issues[0], customer_escaped_field="customfield_12313440"
+    ) == JiraIssueRecord(
+        key="TEST-0",
+        title="Test Summary 0",
+        project="TEST",
+        status="In Progress",
+        issue_type="bug",
+        customer_escaped=False,
+        date_created=date(2024, 1, 1),
+        last_updated=date(2024, 1, 2),
+    )
+
+
+@pytest.mark.parametrize(
+    "date_str, expected",
     [
-        [
-            {
-                "key": "TEST-2235",
-                "title": "New Test Summary",
-            }
-        ]
+        ("2023-01-31T23:59:59.999999+0000", date(2023, 1, 31)),
+        ("2023-01-31T23:59:59.999+0000", date(2023, 1, 31)),
+        # The date is the one of the timezone of the timestamp, not UTC
+        ("2023-01-31T23:59:59.000-0500", date(2023, 1, 31)),
+    ],
+)
+def test_parse_jira_date(date_str, expected):
+    assert parse_jira_date(date_str=date_str) == expected
+    assert parse_jira_date(date_str=date_str) == datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%f%z").date()
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [5], indirect=True)
+def test_search_fetches_all_pages(raw_jira_search_issues, jira, mocker):
+    def _search_issues(jql_str, startAt, maxResults, fields, json_result):
+        return {"issues": raw_jira_search_issues[startAt : startAt + 2], "total": len(raw_jira_search_issues)}
+
+    jira.connection.search_issues.side_effect = _search_issues
+    mocker.patch("qe_metrics.libs.jira.SEARCH_PAGE_SIZE", 2)
+
+    assert [issue.key for issue in jira.search(query="project = TEST")] == [
+        raw_issue["key"] for raw_issue in raw_jira_search_issues
+    ]
+    assert [call.kwargs["startAt"] for call in jira.connection.search_issues.call_args_list] == [0, 2, 4]
+    assert jira.connection.search_issues.call_args.kwargs["fields"] == jira.search_fields
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [1], indirect=True)
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param("project = TEST", id="unordered-query"),
+        pytest.param("project = TEST order  by created ASC", id="ordered-query"),
     ],
-    indirect=True,
 )
-def test_is_customer_escaped_returns_false(raw_jira_issues):
-    assert Jira.is_customer_escaped(raw_jira_issues[0]) is False
+def test_probe_search(raw_jira_search_issues, jira, query):
+    jira.connection.search_issues.return_value = {"issues": raw_jira_search_issues, "total": 42}
+
+    assert jira.probe_search(query=query) == SearchProbe(total=42, max_updated="2024-01-02T10:00:00.000+0000")
+    assert jira.connection.search_issues.call_args.kwargs == {
+        "jql_str": "project = TEST ORDER BY updated DESC",
+        "maxResults": 1,
+        "fields": ["updated"],
+        "json_result": True,
+    }
+
+
+def test_search_fields_follow_database_mapping(jira):
+    assert sorted(jira.search_fields) == sorted([
+        "summary",
+        "project",
+        "status",
+        "issuetype",
+        "customfield_12313440",
+        "created",
+        "updated",
+        "customfield_1",
+    ])
+
+
+def test_search_fields_resolve_custom_field_names():
+    assert "customfield_2" in get_search_fields(custom_fields={"customer_escaped": "customfield_2"})
+
+
+def test_search_fields_local_filter_fields():
+    search_fields = get_search_fields(custom_fields={}, local_filter_fields=True)
+    assert search_fields[-2:] == ["labels", "priority"]
+    assert "labels" not in get_search_fields(custom_fields={})
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [1], indirect=True)
+def test_issue_record_from_json_local_filter_fields(raw_jira_search_issues):
+    raw_issue = raw_jira_search_issues[0]
+    raw_issue["fields"].update({"labels": ["critical"], "priority": {"name": "Blocker"}})
+    issue = issue_record_from_json(raw_issue=raw_issue, customer_escaped_field="customfield_12313440")
+    assert (issue.labels, issue.priority) == (("critical",), "Blocker")
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [1], indirect=True)
+def test_search_page_retries_throttled_and_unavailable_requests(raw_jira_search_issues, jira, mocker):
+    sleep = mocker.patch("qe_metrics.libs.jira.time.sleep")
+    throttled_response = mocker.MagicMock(headers={"Retry-After": "0"})
+    jira.connection.search_issues.side_effect = [
+        JIRAError(status_code=429, response=throttled_response),
+        JIRAError(status_code=503),
+        {"issues": raw_jira_search_issues, "total": 1},
+    ]
+
+    assert jira.search_page(query="project = TEST", start_at=0)["total"] == 1
+    assert jira.connection.search_issues.call_count == 3
+    assert sleep.call_count == 1, "Only the unavailable request must back off, throttled requests pause the throttle"
+
+
+def test_search_page_does_not_retry_client_errors(jira):
+    jira.connection.search_issues.side_effect = JIRAError(status_code=400, text="Invalid JQL")
+    with pytest.raises(JIRAError):
+        jira.search_page(query="project = ", start_at=0)
+    assert jira.connection.search_issues.call_count == 1
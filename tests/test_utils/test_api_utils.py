@@ -0,0 +1,105 @@
+from datetime import date
+import pytest
+import yaml
+from qe_metrics.cli import APP
+from qe_metrics.utils.api_utils import RESPONSE_CACHE, cached_json, get_issues, mark_sync_finished
+
+
+def api_issue(issue_key, status, last_updated):
+    return {
+        "issue_key": issue_key,
+        "title": "Test Summary",
+        "url": f"https://jira.com/browse/{issue_key}",
+        "project": "TEST",
+        "severity": "blocker",
+        "status": status,
+        "issue_type": "bug",
+        "customer_escaped": False,
+        "date_created": date(2024, 5, 1),
+        "last_updated": last_updated,
+    }
+
+
+@pytest.fixture
+def api_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("QE_METRICS_CACHE_DIR", str(tmp_path / "cache"))
+    RESPONSE_CACHE.clear()
+    yield
+    RESPONSE_CACHE.clear()
+
+
+@pytest.mark.parametrize(
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("api-issues-product"),
+            [
+                api_issue(issue_key="TEST-1", status="To Do", last_updated=date(2024, 5, 1)),
+                api_issue(issue_key="TEST-2", status="obsolete", last_updated=date(2024, 5, 2)),
+                api_issue(issue_key="TEST-3", status="To Do", last_updated=date(2024, 5, 3)),
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_get_issues(product, jira_issues, db_session):
+    issues = get_issues(
+        db_session=db_session,
+        products=["api-issues-product"],
+        severities=[],
+        statuses=["To Do"],
+        limit=10,
+        offset=0,
+    )
+    assert [(issue["product"], issue["issue_key"]) for issue in issues] == [
+        ("api-issues-product", "TEST-3"),
+        ("api-issues-product", "TEST-1"),
+    ]
+    assert not get_issues(
+        db_session=db_session, products=["other-product"], severities=[], statuses=[], limit=10, offset=0
+    )
+
+
+def test_cached_json_is_invalidated_by_sync(api_cache_dir, mocker):
+    query = mocker.Mock(side_effect=[{"count": 1}, {"count": 2}])
+    body, etag = cached_json(key=("counts",), query=query)
+    assert cached_json(key=("counts",), query=query) == (body, etag)
+    assert query.call_count == 1
+
+    mark_sync_finished()
+    new_body, new_etag = cached_json(key=("counts",), query=query)
+    assert (new_body, query.call_count) == ('{"count": 2}', 2)
+    assert new_etag != etag
+
+
+def test_counts_endpoint_etag(api_cache_dir, tmp_path, monkeypatch):
+    config_file = tmp_path / "api-config.yaml"
+    with open(config_file, "w") as tmp_config:
+        yaml.dump({"database": {"local": True, "local_filepath": str(tmp_path / "api.sqlite")}}, tmp_config)
+    monkeypatch.setenv("QE_METRICS_CONFIG", str(config_file))
+    issue_counts = [{"product": "api-counts-product", "issue_count": 1}]
+    monkeypatch.setattr("qe_metrics.cli.get_issue_counts", lambda **kwargs: issue_counts)
+
+    client = APP.test_client()
+    response = client.get("/api/v1/counts?product=api-counts-product")
+    assert (response.status_code, response.get_json()) == (200, issue_counts)
+    assert (
+        client.get(
+            "/api/v1/counts?product=api-counts-product", headers={"If-None-Match": response.headers["ETag"]}
+        ).status_code
+        == 304
+    ), "A matching ETag must not resend the response body."
+
+
+@pytest.mark.parametrize("query", ["limit=-1", "limit=1001", "offset=-1"])
+def test_issues_endpoint_rejects_out_of_range_pages(api_cache_dir, query, mocker):
+    get_issues = mocker.patch("qe_metrics.cli.get_issues")
+    response = APP.test_client().get(f"/api/v1/issues?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    get_issues.assert_not_called()
+
+
+def test_get_issues_rejects_negative_offset(db_session):
+    with pytest.raises(ValueError, match="offset"):
+        get_issues(db_session=db_session, products=[], severities=[], statuses=[], limit=10, offset=-1)
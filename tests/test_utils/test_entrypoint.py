@@ -0,0 +1,107 @@
+import pytest
+import yaml
+from sqlalchemy import select
+from qe_metrics.libs.database import Database, dispose_engines
+from qe_metrics.libs.database_mapping import JiraIssuesEntity, ProductsEntity
+from qe_metrics.utils.entrypoint import qe_metrics
+from qe_metrics.utils.product_utils import Shard
+
+PRODUCT_NAMES = [f"sharded-product-{index}" for index in range(4)]
+
+
+@pytest.fixture
+def sync_config_file(request, tmp_path, monkeypatch, fake_jira_server):
+    # Overrides of the "jira" backend and of the "sync" section
+    params = {"backend": "async", "sync": {"processes": 2}, **getattr(request, "param", {})}
+    monkeypatch.setenv("QE_METRICS_CACHE_DIR", str(tmp_path / "cache"))
+    config_file = tmp_path / "config.yaml"
+    with open(config_file, "w") as tmp_config:
+        yaml.dump(
+            {
+                "database": {
+                    "local": True,
+                    "local_filepath": str(tmp_path / "qe_metrics.sqlite"),
+                    "data_retention_days": 100000,
+                },
+                "jira": {"server": fake_jira_server.url, "token": "token", "backend": params["backend"]},
+                "max_workers": 2,
+                "sync": params["sync"],
+            },
+            tmp_config,
+        )
+    yield str(config_file)
+    dispose_engines()
+
+
+@pytest.fixture
+def sync_products_file(tmp_path):
+    products_file = tmp_path / "products.yaml"
+    with open(products_file, "w") as tmp_products:
+        yaml.dump({name: {"blocker": f"project = {name}"} for name in PRODUCT_NAMES}, tmp_products)
+    yield str(products_file)
+
+
+def synced_product_names(config_file):
+    with Database(config_file=config_file, verbose=False).session() as db_session:
+        return set(
+            db_session.scalars(
+                select(ProductsEntity.name).join(JiraIssuesEntity, JiraIssuesEntity.product_id == ProductsEntity.id)
+            )
+        )
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [3], indirect=True)
+def test_qe_metrics_syncs_shards_in_processes(
+    fake_jira_server, raw_jira_search_issues, sync_config_file, sync_products_file
+):
+    fake_jira_server.issues = raw_jira_search_issues
+    progress = []
+    assert not qe_metrics(
+        config_file=sync_config_file,
+        verbose_db=False,
+        products_file=sync_products_file,
+        progress=lambda completed, total: progress.append((completed, total)),
+    )
+    assert synced_product_names(config_file=sync_config_file) == set(PRODUCT_NAMES)
+    assert progress[-1] == (2, 2), "Progress must be reported per shard."
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [3], indirect=True)
+def test_qe_metrics_syncs_single_shard(fake_jira_server, raw_jira_search_issues, sync_config_file, sync_products_file):
+    fake_jira_server.issues = raw_jira_search_issues
+    shard = Shard(number=2, total=2)
+    assert not qe_metrics(config_file=sync_config_file, verbose_db=False, products_file=sync_products_file, shard=shard)
+    assert synced_product_names(config_file=sync_config_file) == {
+        name for name in PRODUCT_NAMES if shard.contains(product_name=name)
+    }
+
+
+@pytest.mark.parametrize("raw_jira_search_issues", [3], indirect=True)
+@pytest.mark.parametrize(
+    "sync_config_file",
+    [
+        pytest.param({"backend": "sync", "sync": {"processes": 1}}, id="sync-backend"),
+        pytest.param({"backend": "async", "sync": {"processes": 1}}, id="async-backend"),
+    ],
+    indirect=True,
+)
+def test_qe_metrics_runs_queries_concurrently(
+    fake_jira_server, raw_jira_search_issues, sync_config_file, sync_products_file
+):
+    fake_jira_server.issues = raw_jira_search_issues
+    fake_jira_server.search_seconds = 0.2
+    failing_product = PRODUCT_NAMES[0]
+    fake_jira_server.failing_queries = {f"project = {failing_product} "}
+    errors = qe_metrics(config_file=sync_config_file, verbose_db=False, products_file=sync_products_file)
+    assert len(errors) == 1 and failing_product in errors[0], "The failed query must be reported."
+
+    search_queries = {
+        request.query
+        for request in fake_jira_server.requests
+        if request.path.endswith("/search") and "startAt" in request.query
+    }
+    assert len(search_queries) == len(PRODUCT_NAMES), "Every product query must be searched."
+    assert fake_jira_server.max_searches_in_flight > 1, "The Jira searches must run concurrently."
+    assert synced_product_names(config_file=sync_config_file) == set(PRODUCT_NAMES) - {failing_product}, (
+        "A failed query must not prevent the issues of the other queries from being written."
+    )
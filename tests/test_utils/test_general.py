@@ -1,5 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
 import pytest
-from qe_metrics.utils.general import verify_queries, verify_config
+from qe_metrics.utils.general import (
+    ClosableIterator,
+    ExecutorIterator,
+    TTLCache,
+    chunked,
+    file_lock,
+    matches_any,
+    verify_queries,
+    verify_config,
+)
 
 
 @pytest.fixture
@@ -75,3 +86,96 @@ def test_verify_queries_with_none_values_raises_value_error(queries_none_value):
 def test_verify_queries_with_extra_queries_raises_value_error(queries_extra):
     with pytest.raises(ValueError):
         verify_queries(queries_dict=queries_extra)
+
+
+def test_chunked():
+    assert list(chunked(iterable=iter(range(5)), size=2)) == [[0, 1], [2, 3], [4]]
+
+
+def _numbers(count):
+    yield from range(count)
+
+
+def test_executor_iterator_yields_items():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert list(ExecutorIterator(executor=executor, func=_numbers, max_buffered=2, count=10)) == list(range(10))
+
+
+def test_executor_iterator_raises_worker_exception():
+    def _failing_items():
+        yield 1
+        raise ValueError("search failed")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        items = ExecutorIterator(executor=executor, func=_failing_items, max_buffered=2)
+        assert next(items) == 1
+        with pytest.raises(ValueError):
+            next(items)
+
+
+def test_executor_iterator_close_stops_worker():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with ExecutorIterator(executor=executor, func=_numbers, max_buffered=1, count=1000) as items:
+            assert next(items) == 0
+    # Leaving the executor context waits for the worker, which must have stopped
+    assert list(items) == []
+
+
+def test_closable_iterator_requires_close():
+    class UnclosableIterator(ClosableIterator[int]):
+        def __next__(self):
+            raise StopIteration
+
+    with pytest.raises(TypeError):
+        UnclosableIterator()
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set(key="a", value=1)
+    cache.set(key="b", value=2)
+    assert cache.get(key="a") == 1
+    cache.set(key="c", value=3)
+    assert (cache.get(key="a"), cache.get(key="b"), cache.get(key="c")) == (1, None, 3)
+    cache.clear()
+    assert cache.get(key="a") is None
+
+
+def test_ttl_cache_expires_entries(mocker):
+    monotonic = mocker.patch("qe_metrics.utils.general.time.monotonic", return_value=100.0)
+    cache = TTLCache(max_entries=2, ttl=10)
+    cache.set(key="a", value=1)
+    monotonic.return_value = 109.0
+    assert cache.get(key="a") == 1
+    monotonic.return_value = 110.0
+    assert cache.get(key="a") is None
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    lock_path = str(tmp_path / "test.lock")
+    acquired = Event()
+
+    def _lock():
+        with file_lock(path=lock_path):
+            acquired.set()
+
+    with file_lock(path=lock_path):
+        thread = Thread(target=_lock)
+        thread.start()
+        assert not acquired.wait(timeout=0.2), "The lock must not be acquired while it is held."
+    thread.join(timeout=5)
+    assert acquired.is_set()
+
+
+@pytest.mark.parametrize(
+    "value, patterns, expected",
+    [
+        ("openshift-virt", [], True),
+        ("openshift-virt", ["openshift-*"], True),
+        ("openshift-virt", ["rhel", "*-virt"], True),
+        ("openshift-virt", ["rhel"], False),
+        ("openshift-virt", ["OpenShift-*"], False),
+    ],
+)
+def test_matches_any(value, patterns, expected):
+    assert matches_any(value=value, patterns=patterns) is expected
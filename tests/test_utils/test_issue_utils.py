@@ -1,12 +1,14 @@
 from datetime import date, datetime
 import pytest
 from qe_metrics.libs.database_mapping import JiraIssuesEntity
+from qe_metrics.utils.metrics_utils import METRICS
 from sqlalchemy import select
 from qe_metrics.utils.issue_utils import (
-    update_existing_issue,
+    get_issue_changes,
+    issue_content_hash,
+    issue_to_row,
     mark_obsolete_issues,
     create_update_issues,
-    format_issue_date,
     delete_old_issues,
 )
 
@@ -35,23 +37,23 @@ from qe_metrics.utils.issue_utils import (
     ],
     indirect=True,
 )
-def test_update_existing_issue(raw_jira_issues, jira_issues, db_session):
-    update_existing_issue(
-        existing_issue=jira_issues[0],
-        new_issue_data=raw_jira_issues[0],
-        severity="critical",
+def test_create_update_issues_updates_issues(product, raw_jira_issues, jira_issues, db_session):
+    create_update_issues(
+        issues=raw_jira_issues,
+        product=product,
+        severity="blocker",
+        jira_server="https://jira.com",
         db_session=db_session,
     )
+    db_session.refresh(jira_issues[0])
     expected_values = {
         "title": "New Test Summary",
-        "severity": "critical",
         "status": "In Progress",
         "customer_escaped": False,
         "last_updated": date(2024, 1, 1),
     }
     actual_values = {
         "title": jira_issues[0].title,
-        "severity": jira_issues[0].severity,
         "status": jira_issues[0].status,
         "customer_escaped": jira_issues[0].customer_escaped,
         "last_updated": jira_issues[0].last_updated,
@@ -59,6 +61,77 @@ def test_update_existing_issue(raw_jira_issues, jira_issues, db_session):
     assert actual_values == expected_values, f"actual: {actual_values} != expected: {expected_values}"
 
 
+@pytest.mark.parametrize(
+    "product, raw_jira_issues, jira_issues",
+    [
+        pytest.param(
+            ("issue-per-severity-product"),
+            [{"key": "TEST-1235", "title": "Test Summary", "last_updated": "2024-01-01T23:59:59.999999+0000"}],
+            [
+                {
+                    "issue_key": "TEST-1235",
+                    "title": "Test Summary",
+                    "url": "https://jira.com",
+                    "project": "TEST",
+                    "severity": "blocker",
+                    "status": "To Do",
+                    "issue_type": "bug",
+                    "customer_escaped": True,
+                    "date_created": datetime.strptime("2023-12-29", "%Y-%m-%d").date(),
+                    "last_updated": datetime.strptime("2023-12-30", "%Y-%m-%d").date(),
+                }
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_stores_issue_per_severity(product, raw_jira_issues, jira_issues, db_session):
+    for _ in range(2):
+        create_update_issues(
+            issues=raw_jira_issues,
+            product=product,
+            severity="critical",
+            jira_server="https://jira.com",
+            db_session=db_session,
+        )
+    severities = db_session.scalars(
+        select(JiraIssuesEntity.severity).where(JiraIssuesEntity.issue_key == "TEST-1235")
+    ).all()
+    assert sorted(severities) == ["blocker", "critical"]
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues, jira_issues",
+    [
+        pytest.param(
+            ("get-issue-changes-product"),
+            [{"key": "TEST-1334", "title": "Test Summary", "last_updated": "2023-12-30T12:00:00.000000+0000"}],
+            [
+                {
+                    "issue_key": "TEST-1334",
+                    "title": "Test Summary",
+                    "url": "https://jira.com",
+                    "project": "TEST",
+                    "severity": "blocker",
+                    "status": "To Do",
+                    "issue_type": "bug",
+                    "customer_escaped": False,
+                    "date_created": datetime.strptime("2023-12-29", "%Y-%m-%d").date(),
+                    "last_updated": datetime.strptime("2023-12-30", "%Y-%m-%d").date(),
+                }
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_get_issue_changes(product, raw_jira_issues, jira_issues):
+    issue_row = issue_to_row(
+        issue=raw_jira_issues[0], product_id=product.id, severity="blocker", jira_server="https://jira.com"
+    )
+    changes = get_issue_changes(existing_issue=jira_issues[0], issue_row=issue_row)
+    assert changes == {"status": "In Progress"}, f"Unexpected changes: {changes}"
+
+
 @pytest.mark.parametrize(
     "product, raw_jira_issues, jira_issues",
     [
@@ -105,7 +178,13 @@ def test_update_existing_issue(raw_jira_issues, jira_issues, db_session):
     indirect=True,
 )
 def test_mark_obsolete_issues(product, raw_jira_issues, jira_issues, db_session):
-    mark_obsolete_issues(current_issues=raw_jira_issues, db_issues=jira_issues, product=product, db_session=db_session)
+    obsolete_count = mark_obsolete_issues(
+        current_issue_keys={issue.key for issue in raw_jira_issues},
+        product=product,
+        severity="blocker",
+        db_session=db_session,
+    )
+    assert obsolete_count == 1, f"Expected 1 obsolete issue, got {obsolete_count}"
     assert (
         db_session.execute(select(JiraIssuesEntity).filter(JiraIssuesEntity.issue_key == "TEST-1135"))
         .scalar_one()
@@ -114,6 +193,87 @@ def test_mark_obsolete_issues(product, raw_jira_issues, jira_issues, db_session)
     ), f"Issue {jira_issues[1].issue_key} was not marked as obsolete."
 
 
+@pytest.mark.parametrize(
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("mark-obsolete-issues-many-keys-product"),
+            [
+                {
+                    "issue_key": issue_key,
+                    "title": "Test Summary",
+                    "url": "https://jira.com",
+                    "project": "TEST",
+                    "severity": "blocker",
+                    "status": "In Progress",
+                    "issue_type": "bug",
+                    "customer_escaped": False,
+                    "date_created": datetime.strptime("2024-12-30", "%Y-%m-%d").date(),
+                    "last_updated": datetime.strptime("2024-12-31", "%Y-%m-%d").date(),
+                }
+                for issue_key in ("TEST-1", "TEST-2", "TEST-3")
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_mark_obsolete_issues_many_current_keys(product, jira_issues, db_session):
+    obsolete_count = mark_obsolete_issues(
+        current_issue_keys={"TEST-1", "TEST-2", *[f"OTHER-{index}" for index in range(1500)]},
+        product=product,
+        severity="blocker",
+        db_session=db_session,
+    )
+    assert obsolete_count == 1, f"Expected 1 obsolete issue, got {obsolete_count}"
+    assert {
+        db_issue.issue_key
+        for db_issue in db_session.execute(
+            select(JiraIssuesEntity).filter(JiraIssuesEntity.status == "obsolete")
+        ).scalars()
+    } == {"TEST-3"}, "Only TEST-3 should be marked as obsolete."
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues, jira_issues",
+    [
+        pytest.param(
+            ("incremental-create-update-issues-product"),
+            [{"key": "TEST-1434", "title": "Test Summary"}],
+            [
+                {
+                    "issue_key": "TEST-1435",
+                    "title": "Test Summary",
+                    "url": "https://jira.com",
+                    "project": "TEST",
+                    "severity": "blocker",
+                    "status": "In Progress",
+                    "issue_type": "bug",
+                    "customer_escaped": False,
+                    "date_created": datetime.strptime("2024-12-30", "%Y-%m-%d").date(),
+                    "last_updated": datetime.strptime("2024-12-31", "%Y-%m-%d").date(),
+                },
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_incremental_does_not_mark_obsolete(product, raw_jira_issues, jira_issues, db_session):
+    create_update_issues(
+        issues=raw_jira_issues,
+        product=product,
+        severity="blocker",
+        jira_server="https://jira.com",
+        db_session=db_session,
+        mark_obsolete=False,
+    )
+    assert (
+        db_session.execute(select(JiraIssuesEntity).filter(JiraIssuesEntity.issue_key == "TEST-1435"))
+        .scalar_one()
+        .status
+        == "In Progress"
+    ), "Issues missing from an incremental sync must not be marked as obsolete."
+
+
 @pytest.mark.parametrize(
     "product, raw_jira_issues",
     [
@@ -141,6 +301,12 @@ def test_create_update_issues_creates_issues(product, raw_jira_issues, db_sessio
     assert db_session.execute(
         select(JiraIssuesEntity).filter(JiraIssuesEntity.issue_key == raw_jira_issues[0].key)
     ).scalar_one_or_none(), f"New issue {raw_jira_issues[0].key} was not created."
+    issue_counters = {
+        labels["change"]: value
+        for labels, value in METRICS.snapshot()["qe_metrics_issues_total"]
+        if labels["product"] == "create-update-issues-product"
+    }
+    assert issue_counters == {"fetched": 1, "inserted": 1, "updated": 0, "obsoleted": 0}
 
 
 @pytest.mark.parametrize(
@@ -174,19 +340,169 @@ def test_delete_old_issues(product, jira_issues, db_session):
 
 
 @pytest.mark.parametrize(
-    "raw_jira_issues",
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("delete_old_issues_batches_product"),
+            [
+                {
+                    "issue_key": f"OLD-{index}",
+                    "title": "Test Issue",
+                    "url": "https://jira.com",
+                    "project": "OLD",
+                    "severity": "blocker",
+                    "status": "Open",
+                    "issue_type": "bug",
+                    "customer_escaped": False,
+                    "date_created": date(2023, 1, 1),
+                    "last_updated": date(2023, 1, 1) if index < 5 else date.today(),
+                }
+                for index in range(7)
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_delete_old_issues_in_batches(mocker, product, jira_issues, executed_statements, db_session):
+    mocker.patch("qe_metrics.utils.issue_utils.RETENTION_BATCH_SIZE", 2)
+    db_session.commit()
+    executed_statements.clear()
+    assert delete_old_issues(days_old=180, db_session=db_session)
+    issue_deletes = [statement for statement in executed_statements if statement.startswith("DELETE FROM jiraissues")]
+    assert len(issue_deletes) == 3, "5 expired issues must be deleted by 3 statements of at most 2 rows."
+    assert db_session.scalars(
+        select(JiraIssuesEntity.issue_key).where(JiraIssuesEntity.product_id == product.id)
+    ).all() == ["OLD-5", "OLD-6"]
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues",
+    [
+        pytest.param(
+            ("create-update-issues-statements-product"),
+            [{"key": f"BULK-{index}", "title": "Test Summary"} for index in range(1500)],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_statement_count(product, raw_jira_issues, executed_statements, db_session):
+    create_update_issues(
+        issues=raw_jira_issues,
+        product=product,
+        severity="blocker",
+        jira_server="https://jira.com",
+        db_session=db_session,
+    )
+    # Statements are issued per chunk of 1000 issues, not per issue:
+    # - 4 for the upserts: a key lookup and a multi-row insert per chunk
+    # - 9 for the obsolete issues: creating, clearing, filling (a multi-row insert per chunk) and dropping a temporary
+    #   table holding the 1500 current keys, with its 2 existence checks, and the lookup and update of the obsolete issues
+    # - 3 for the issue count rollups: an update, an insert and the deletion of empty rollups
+    # - 1 reload of the product
+    issue_writes = [statement for statement in executed_statements if statement.startswith("INSERT INTO jiraissues")]
+    assert len(issue_writes) == 2, "Issues must be written by one multi-row statement per chunk."
+    assert len(executed_statements) <= 17, f"Too many statements executed: {len(executed_statements)}"
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues",
+    [
+        pytest.param(
+            ("content-hash-unchanged-product"),
+            [
+                {"key": "HASH-1", "title": "Test Summary", "last_updated": "2024-01-01T10:00:00.000000+0000"},
+                {"key": "HASH-2", "title": "Test Summary", "last_updated": "2024-01-01T10:00:00.000000+0000"},
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_skips_unchanged_issues(product, raw_jira_issues, executed_statements, db_session):
+    sync_kwargs = dict(product=product, severity="blocker", jira_server="https://jira.com", db_session=db_session)
+    create_update_issues(issues=raw_jira_issues, **sync_kwargs)
+    executed_statements.clear()
+
+    change_set = create_update_issues(issues=raw_jira_issues, **sync_kwargs)
+    assert not change_set.inserted and not change_set.updated, "Unchanged issues must not be reported as changed."
+    assert not [statement for statement in executed_statements if statement.startswith("INSERT INTO jiraissues")], (
+        "Issues with an unchanged content hash must not be written."
+    )
+
+    mark_obsolete_issues(current_issue_keys={"HASH-1"}, product=product, severity="blocker", db_session=db_session)
+    obsolete_issue = db_session.execute(
+        select(JiraIssuesEntity).filter(JiraIssuesEntity.issue_key == "HASH-2")
+    ).scalar_one()
+    assert obsolete_issue.content_hash is None, "The content hash of an obsolete issue must be cleared."
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues, jira_issues",
+    [
+        pytest.param(
+            ("content-hash-missing-product"),
+            [{"key": "HASH-3", "title": "Test Summary", "last_updated": "2024-01-01T10:00:00.000000+0000"}],
+            [
+                {
+                    "issue_key": "HASH-3",
+                    "title": "Test Summary",
+                    "url": "https://jira.com/browse/HASH-3",
+                    "project": "HASH",
+                    "severity": "blocker",
+                    "status": "In Progress",
+                    "issue_type": "bug",
+                    "customer_escaped": False,
+                    "date_created": datetime.strptime("2023-12-29", "%Y-%m-%d").date(),
+                    "last_updated": datetime.strptime("2024-01-01", "%Y-%m-%d").date(),
+                }
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_fills_missing_content_hash(
+    product, raw_jira_issues, jira_issues, executed_statements, db_session
+):
+    executed_statements.clear()
+    change_set = create_update_issues(
+        issues=raw_jira_issues,
+        product=product,
+        severity="blocker",
+        jira_server="https://jira.com",
+        db_session=db_session,
+    )
+    assert not change_set.updated, "An issue whose fields did not change must not be reported as updated."
+    db_session.refresh(jira_issues[0])
+    assert jira_issues[0].content_hash == issue_content_hash(
+        issue_row=issue_to_row(issue=raw_jira_issues[0], product_id=product.id, severity="blocker", jira_server="x")
+    ), "The content hash of a row written before it existed must be filled."
+    assert not [statement for statement in executed_statements if statement.startswith("INSERT INTO jiraissues")]
+    assert "UPDATE jiraissues SET content_hash=? WHERE jiraissues.id = ?" in executed_statements, (
+        "Only the content hash of an unchanged row must be written."
+    )
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues",
     [
-        [
-            {
-                "key": "TEST-3234",
-                "title": "New Test Summary",
-                "last_updated": "2023-01-31T23:59:59.999999+0000",
-            }
-        ]
+        pytest.param(
+            ("upsert-fallback-product"),
+            [{"key": "FALLBACK-1", "title": "Test Summary"}, {"key": "FALLBACK-2", "title": "Test Summary"}],
+        ),
     ],
     indirect=True,
 )
-def test_format_issue_date(raw_jira_issues):
-    assert format_issue_date(raw_jira_issues[0].fields.updated) == date(2023, 1, 31), (
-        "Issue date not formatted properly."
+def test_create_update_issues_without_dialect_upsert(product, raw_jira_issues, db_session, mocker):
+    # Dialects without INSERT ... ON CONFLICT fall back to separate inserts and updates
+    mocker.patch("qe_metrics.utils.issue_utils.DIALECT_INSERTS", {})
+    sync_kwargs = dict(product=product, severity="blocker", jira_server="https://jira.com", db_session=db_session)
+    assert set(create_update_issues(issues=raw_jira_issues, **sync_kwargs).inserted) == {"FALLBACK-1", "FALLBACK-2"}
+
+    change_set = create_update_issues(
+        issues=[raw_jira_issues[0]._replace(title="Changed Summary"), raw_jira_issues[1]], **sync_kwargs
     )
+    assert not change_set.inserted and set(change_set.updated) == {"FALLBACK-1"}
+    assert db_session.scalars(
+        select(JiraIssuesEntity.title)
+        .filter(JiraIssuesEntity.product_id == product.id)
+        .order_by(JiraIssuesEntity.issue_key)
+    ).all() == ["Changed Summary", "Test Summary"]
@@ -0,0 +1,77 @@
+import time
+from threading import Event
+from qe_metrics.utils.job_utils import SyncJobQueue
+
+
+def wait_for_status(job, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.status != status and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == status, f"Job status is {job.status}, expected {status}"
+
+
+def test_sync_job_queue_merges_queued_requests():
+    started, release = Event(), Event()
+    runs = []
+
+    def _run(progress, **kwargs):
+        kwargs.pop("started")()
+        runs.append(kwargs)
+        started.set()
+        progress(1, 2)
+        release.wait(timeout=5)
+
+    queue = SyncJobQueue(run=_run)
+    running_job = queue.submit(config_file="config.yaml")
+    started.wait(timeout=5)
+    wait_for_status(job=running_job, status="running")
+    assert running_job.to_dict()["completed_queries"] == 1
+
+    queued_job = queue.submit(config_file="config.yaml")
+    assert queue.submit(config_file="config.yaml") is queued_job, "Requests must join the queued run."
+    assert queued_job is not running_job, "A request made during a run must queue a new run."
+
+    release.set()
+    wait_for_status(job=queued_job, status="succeeded")
+    assert running_job.status == "succeeded"
+    assert len(runs) == 2
+    assert queue.get(job_id=queued_job.id) is queued_job
+
+
+def test_sync_job_queue_records_failures():
+    def _run(progress, **kwargs):
+        raise ValueError("Jira is down")
+
+    queue = SyncJobQueue(run=_run)
+    job = queue.submit(config_file="config.yaml")
+    wait_for_status(job=job, status="failed")
+    assert job.to_dict()["error"] == "Jira is down"
+    assert queue.get(job_id="unknown") is None
+
+
+def test_sync_job_queue_records_partial_failures():
+    def _run(progress, **kwargs):
+        return ['Failed to update issues for "product" with severity "blocker": Invalid JQL']
+
+    job = SyncJobQueue(run=_run).submit(config_file="config.yaml")
+    wait_for_status(job=job, status="partial_failure")
+    assert job.to_dict()["error"] == 'Failed to update issues for "product" with severity "blocker": Invalid JQL'
+
+
+def test_sync_job_queue_waits_for_sync_lock():
+    lock_taken, release = Event(), Event()
+
+    def _run(progress, started, **kwargs):
+        lock_taken.wait(timeout=5)
+        started()
+        release.wait(timeout=5)
+
+    job = SyncJobQueue(run=_run).submit(config_file="config.yaml")
+    wait_for_status(job=job, status="waiting")
+    assert job.started_at is None, "A job waiting for the sync lock must not be reported as started."
+
+    lock_taken.set()
+    wait_for_status(job=job, status="running")
+    assert job.started_at is not None
+    release.set()
+    wait_for_status(job=job, status="succeeded")
@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+
+import pytest
+from qe_metrics.cli import APP
+from qe_metrics.utils.metrics_utils import (
+    METRICS,
+    MetricsRegistry,
+    collect_metrics,
+    get_metrics_dir,
+    merge_snapshots,
+    render_metrics,
+    save_metrics,
+)
+
+
+@pytest.fixture
+def metrics_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("QE_METRICS_CACHE_DIR", str(tmp_path / "cache"))
+    METRICS.clear()
+    yield
+    METRICS.clear()
+
+
+def test_render_metrics():
+    registry = MetricsRegistry()
+    registry.inc("qe_metrics_issues_total", 3, product='my "product"', severity="blocker", change="inserted")
+    registry.observe("qe_metrics_stage_duration_seconds", 0.07, stage="sync")
+    registry.observe("qe_metrics_stage_duration_seconds", 5000, stage="sync")
+    rendered = render_metrics(metrics=merge_snapshots(snapshots=[registry.snapshot()]))
+
+    assert "# TYPE qe_metrics_issues_total counter" in rendered
+    assert 'qe_metrics_issues_total{change="inserted",product="my \\"product\\"",severity="blocker"} 3' in rendered
+    assert 'qe_metrics_stage_duration_seconds_bucket{stage="sync",le="0.05"} 0' in rendered
+    assert 'qe_metrics_stage_duration_seconds_bucket{stage="sync",le="0.1"} 1' in rendered
+    assert 'qe_metrics_stage_duration_seconds_bucket{stage="sync",le="+Inf"} 2' in rendered
+    assert 'qe_metrics_stage_duration_seconds_sum{stage="sync"} 5000.07' in rendered
+    assert 'qe_metrics_stage_duration_seconds_count{stage="sync"} 2' in rendered
+
+
+def test_merge_snapshots():
+    first_registry, second_registry = MetricsRegistry(), MetricsRegistry()
+    for registry, timestamp in ((first_registry, 100.0), (second_registry, 200.0)):
+        registry.inc("qe_metrics_runs_total", outcome="success")
+        registry.set("qe_metrics_last_success_timestamp_seconds", timestamp)
+        registry.observe("qe_metrics_stage_duration_seconds", 1.0, stage="sync")
+
+    merged = merge_snapshots(snapshots=[first_registry.snapshot(), second_registry.snapshot()])
+    assert merged["qe_metrics_runs_total"][(("outcome", "success"),)] == 2
+    assert merged["qe_metrics_last_success_timestamp_seconds"][()] == 200.0, "The latest gauge value must be kept."
+    assert merged["qe_metrics_stage_duration_seconds"][(("stage", "sync"),)][-2:] == [2.0, 2]
+
+
+def test_registry_merge():
+    registry, worker_registry = MetricsRegistry(), MetricsRegistry()
+    registry.inc("qe_metrics_issues_deleted_total", 2)
+    worker_registry.inc("qe_metrics_issues_deleted_total", 3)
+    worker_registry.observe("qe_metrics_stage_duration_seconds", 1.0, stage="probe_searches")
+
+    registry.merge(snapshot=worker_registry.snapshot())
+    snapshot = registry.snapshot()
+    assert snapshot["qe_metrics_issues_deleted_total"] == [({}, 5.0)]
+    assert snapshot["qe_metrics_stage_duration_seconds"][0][1][-2:] == [1.0, 1]
+
+
+def test_metrics_endpoint_merges_processes(metrics_cache_dir):
+    METRICS.inc("qe_metrics_runs_total", outcome="success")
+    save_metrics()
+    with open(os.path.join(get_metrics_dir(), f"{os.getpid()}.json")) as fd:
+        saved_metrics = json.load(fd)
+    with open(os.path.join(get_metrics_dir(), f"{os.getppid()}.json"), "w") as fd:
+        json.dump(saved_metrics, fd)
+
+    response = APP.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert 'qe_metrics_runs_total{outcome="success"} 2.0' in response.get_data(as_text=True), (
+        "The saved metrics of another process must be added to the live metrics."
+    )
+
+
+def test_collect_metrics_deletes_metrics_of_stopped_processes(metrics_cache_dir):
+    stopped_process = subprocess.Popen(["true"])
+    stopped_process.wait()
+    stopped_process_file = os.path.join(get_metrics_dir(), f"{stopped_process.pid}.json")
+    with open(stopped_process_file, "w") as fd:
+        json.dump({"qe_metrics_runs_total": [({"outcome": "success"}, 1.0)]}, fd)
+
+    assert 'qe_metrics_runs_total{outcome="success"}' not in collect_metrics(), (
+        "The metrics of stopped processes must not be exposed."
+    )
+    assert not os.path.exists(stopped_process_file)
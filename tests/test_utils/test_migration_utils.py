@@ -0,0 +1,100 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, inspect, select
+from qe_metrics.libs.database_mapping import Base
+from qe_metrics.migrations import LATEST_SCHEMA_VERSION, v0001_initial_schema
+from qe_metrics.utils.migration_utils import (
+    DuplicateRowsError,
+    add_missing_columns,
+    get_schema_version,
+    upgrade_schema,
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(url="sqlite:///:memory:")
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_schema_matches_mapping(engine):
+    assert upgrade_schema(engine=engine) == LATEST_SCHEMA_VERSION
+    with engine.connect() as connection:
+        inspector = inspect(subject=connection)
+        for table in Base.metadata.sorted_tables:
+            assert {column["name"] for column in inspector.get_columns(table_name=table.name)} == set(
+                table.columns.keys()
+            ), f'Columns of table "{table.name}" differ from the mapping, a migration is missing.'
+            assert {index["name"] for index in inspector.get_indexes(table_name=table.name)} >= {
+                index.name for index in table.indexes
+            }, f'Indexes of table "{table.name}" differ from the mapping, a migration is missing.'
+
+
+def test_upgrade_schema_is_applied_once(engine):
+    upgrade_schema(engine=engine)
+    assert upgrade_schema(engine=engine) == LATEST_SCHEMA_VERSION
+    with engine.connect() as connection:
+        assert get_schema_version(connection=connection) == LATEST_SCHEMA_VERSION
+
+
+def test_add_missing_columns(engine):
+    with engine.begin() as connection:
+        Table("migrated", MetaData(), Column("id", Integer, primary_key=True)).create(bind=connection)
+        add_missing_columns(
+            connection=connection,
+            table=Table(
+                "migrated",
+                MetaData(),
+                Column("id", Integer, primary_key=True),
+                Column("name", String, nullable=True),
+            ),
+        )
+        assert [column["name"] for column in inspect(subject=connection).get_columns(table_name="migrated")] == [
+            "id",
+            "name",
+        ]
+
+
+@pytest.fixture
+def engine_with_duplicate_issues(engine):
+    # A database created before the unique index of jiraissues, holding the same issue twice
+    with engine.begin() as connection:
+        v0001_initial_schema.upgrade(connection=connection)
+        connection.execute(insert(v0001_initial_schema.metadata.tables["products"]).values(id=1, name="product"))
+        issue = dict(
+            product_id=1,
+            issue_key="TEST-1",
+            title="Test Summary",
+            url="https://jira.com/browse/TEST-1",
+            project="TEST",
+            severity="blocker",
+            status="In Progress",
+            issue_type="bug",
+            customer_escaped=False,
+            date_created=date(2024, 1, 1),
+            last_updated=date(2024, 1, 2),
+        )
+        connection.execute(insert(v0001_initial_schema.metadata.tables["jiraissues"]), [issue, issue])
+    yield engine
+
+
+def test_upgrade_schema_fails_on_duplicate_rows(engine_with_duplicate_issues):
+    with pytest.raises(DuplicateRowsError, match=r"\(1, 'blocker', 'TEST-1'\) \(2 rows\)"):
+        upgrade_schema(engine=engine_with_duplicate_issues)
+
+    with engine_with_duplicate_issues.connect() as connection:
+        assert get_schema_version(connection=connection) < LATEST_SCHEMA_VERSION
+        assert len(connection.execute(select(v0001_initial_schema.metadata.tables["jiraissues"])).all()) == 2, (
+            "Duplicate rows must not be deleted unless requested."
+        )
+
+
+def test_upgrade_schema_deletes_duplicate_rows(engine_with_duplicate_issues):
+    assert upgrade_schema(engine=engine_with_duplicate_issues, delete_duplicates=True) == LATEST_SCHEMA_VERSION
+    with engine_with_duplicate_issues.connect() as connection:
+        jiraissues = v0001_initial_schema.metadata.tables["jiraissues"]
+        assert connection.execute(select(jiraissues.c.id)).scalars().all() == [2], (
+            "The most recently inserted duplicate must be kept."
+        )
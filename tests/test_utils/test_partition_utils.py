@@ -0,0 +1,42 @@
+from datetime import date
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from qe_metrics.libs.database_mapping import JiraIssuesEntity
+from qe_metrics.utils.partition_utils import (
+    is_issues_table_partitioned,
+    issue_partition_name,
+    month_start,
+    partitioned_issues_table,
+)
+
+
+@pytest.mark.parametrize(
+    "day, months_offset, expected",
+    [
+        pytest.param(date(2024, 5, 17), 0, date(2024, 5, 1), id="same-month"),
+        pytest.param(date(2024, 11, 30), 2, date(2025, 1, 1), id="next-year"),
+        pytest.param(date(2024, 1, 31), -1, date(2023, 12, 1), id="previous-year"),
+    ],
+)
+def test_month_start(day, months_offset, expected):
+    assert month_start(day=day, months_offset=months_offset) == expected
+
+
+def test_issue_partition_name():
+    assert issue_partition_name(month=date(2024, 3, 1)) == "jiraissues_p202403"
+
+
+def test_is_issues_table_partitioned_sqlite(db_session):
+    assert not is_issues_table_partitioned(db_session=db_session), "SQLite tables are never partitioned."
+
+
+def test_partitioned_issues_table_follows_database_mapping():
+    ddl = str(CreateTable(partitioned_issues_table()).compile(dialect=postgresql.dialect()))
+    assert [column.name for column in partitioned_issues_table().columns] == [
+        column.name for column in JiraIssuesEntity.__table__.columns
+    ]
+    assert "id INTEGER DEFAULT nextval('jiraissues_id_seq') NOT NULL" in ddl
+    assert "PRIMARY KEY (id, last_updated)" in ddl
+    assert ddl.rstrip().endswith("PARTITION BY RANGE (last_updated)")
+    assert JiraIssuesEntity.__table__.primary_key.columns.keys() == ["id"], "The model table must not be modified."
@@ -1,7 +1,15 @@
 import pytest
+import requests
 from sqlalchemy import select
 from qe_metrics.libs.database_mapping import ProductsEntity
-from qe_metrics.utils.product_utils import get_products_dict, process_products, append_last_updated_arg
+from qe_metrics.utils.product_utils import (
+    Shard,
+    append_last_updated_arg,
+    fetch_yaml_with_cache,
+    get_products_dict,
+    process_products,
+    products_from_repository,
+)
 
 
 @pytest.mark.parametrize(
@@ -16,6 +24,58 @@ def test_products_from_file(tmp_products_file, db_session):
     ], "Test product test-from-file-product not found in database."
 
 
+def test_process_products_filters(db_session):
+    products = process_products(
+        products_dict={
+            "openshift-virt": {"blocker": "BLOCKER QUERY", "critical-blocker": "CRITICAL BLOCKER QUERY"},
+            "openshift-storage": {"blocker": "BLOCKER QUERY", "critical-blocker": "CRITICAL BLOCKER QUERY"},
+            "rhel": {"blocker": "BLOCKER QUERY", "critical-blocker": "CRITICAL BLOCKER QUERY"},
+        },
+        db_session=db_session,
+        products_filter=["openshift-*"],
+        severities_filter=["critical-*"],
+    )
+    assert {product["product"].name: product["queries"] for product in products} == {
+        "openshift-virt": {"critical-blocker": "CRITICAL BLOCKER QUERY"},
+        "openshift-storage": {"critical-blocker": "CRITICAL BLOCKER QUERY"},
+    }
+    assert "rhel" not in db_session.execute(select(ProductsEntity.name)).scalars().all(), (
+        "Filtered out products must not be created."
+    )
+
+
+def test_process_products_shards(db_session):
+    products_dict = {f"product-{index}": {"blocker": "BLOCKER QUERY"} for index in range(20)}
+    shard_products = [
+        {
+            product["product"].name
+            for product in process_products(
+                products_dict=products_dict, db_session=db_session, shard=Shard(number=number, total=3)
+            )
+        }
+        for number in range(1, 4)
+    ]
+    assert set().union(*shard_products) == set(products_dict), "Every product must belong to a shard."
+    assert sum(len(products) for products in shard_products) == len(products_dict), "Shards must not overlap."
+
+
+@pytest.mark.parametrize(
+    "value, shard",
+    [
+        pytest.param("2/4", Shard(number=2, total=4)),
+        pytest.param("0/4", None),
+        pytest.param("5/4", None),
+        pytest.param("1-4", None),
+    ],
+)
+def test_shard_parse(value, shard):
+    if shard:
+        assert Shard.parse(value=value) == shard
+    else:
+        with pytest.raises(ValueError):
+            Shard.parse(value=value)
+
+
 def test_append_last_updated_arg_appends_arg():
     expected_query = 'project = TEST AND status = Open AND updated > "-90d"'
     query = append_last_updated_arg(query="project = TEST AND status = Open", look_back_days=90)
@@ -25,3 +85,42 @@ def test_append_last_updated_arg_appends_arg():
 def test_append_last_updated_arg_not_append_arg():
     query = append_last_updated_arg(query='project = TEST AND status = Open AND updated > "-365d"', look_back_days=90)
     assert not query
+
+
+@pytest.fixture
+def products_repository(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("QE_METRICS_CACHE_DIR", str(tmp_path / "cache"))
+    yield mocker.patch("qe_metrics.utils.product_utils.get_http_session").return_value
+
+
+def _response(mocker, status_code, content=b"", headers=None):
+    return mocker.MagicMock(status_code=status_code, ok=status_code < 400, content=content, headers=headers or {})
+
+
+def test_fetch_yaml_with_cache_reuses_not_modified_content(products_repository, mocker):
+    products_repository.get.side_effect = [
+        _response(mocker=mocker, status_code=200, content=b"configs: [a.yaml]", headers={"ETag": '"v1"'}),
+        _response(mocker=mocker, status_code=304),
+    ]
+    assert fetch_yaml_with_cache(url="https://repo/product-config.yaml") == {"configs": ["a.yaml"]}
+    assert fetch_yaml_with_cache(url="https://repo/product-config.yaml") == {"configs": ["a.yaml"]}
+    assert products_repository.get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+
+def test_fetch_yaml_with_cache_falls_back_to_cached_content(products_repository, mocker):
+    products_repository.get.side_effect = [
+        _response(mocker=mocker, status_code=200, content=b"configs: [a.yaml]"),
+        requests.ConnectionError("repository unreachable"),
+    ]
+    fetch_yaml_with_cache(url="https://repo/product-config.yaml")
+    assert fetch_yaml_with_cache(url="https://repo/product-config.yaml") == {"configs": ["a.yaml"]}
+
+
+def test_products_from_repository(products_repository, mocker):
+    products_repository.get.side_effect = lambda url, headers, timeout: {
+        "https://repo/product-config.yaml": _response(mocker=mocker, status_code=200, content=b"configs: [a.yaml]"),
+        "https://repo/configs/a.yaml": _response(
+            mocker=mocker, status_code=200, content=b"product-a: {blocker: BLOCKER QUERY}"
+        ),
+    }[url]
+    assert products_from_repository(base_url="https://repo") == {"product-a": {"blocker": "BLOCKER QUERY"}}
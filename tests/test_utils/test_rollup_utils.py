@@ -0,0 +1,108 @@
+from datetime import date
+import pytest
+from sqlalchemy import select, update
+from qe_metrics.libs.database_mapping import IssueCountRollupsEntity, JiraIssuesEntity
+from qe_metrics.utils.issue_utils import create_update_issues, delete_old_issues
+from qe_metrics.utils.rollup_utils import ISSUE_COUNT_GROUP_COLUMNS, count_issues, rebuild_issue_count_rollup
+
+
+def rollup_counts(db_session):
+    group_columns = [getattr(IssueCountRollupsEntity, column) for column in ISSUE_COUNT_GROUP_COLUMNS]
+    return {
+        tuple(group): issue_count
+        for *group, issue_count in db_session.execute(select(*group_columns, IssueCountRollupsEntity.issue_count))
+    }
+
+
+def rollup_issue(issue_key, status, last_updated=date(2024, 5, 30)):
+    return {
+        "issue_key": issue_key,
+        "title": "Test Summary",
+        "url": "https://jira.com",
+        "project": "TEST",
+        "severity": "blocker",
+        "status": status,
+        "issue_type": "bug",
+        "customer_escaped": False,
+        "date_created": date(2024, 5, 1),
+        "last_updated": last_updated,
+    }
+
+
+@pytest.mark.parametrize(
+    "product, raw_jira_issues, jira_issues",
+    [
+        pytest.param(
+            ("rollup-change-set-product"),
+            [
+                {"key": "TEST-1", "title": "Test Summary", "status": "Verified"},
+                {"key": "TEST-3", "title": "Test Summary", "status": "To Do"},
+            ],
+            [rollup_issue(issue_key="TEST-1", status="To Do"), rollup_issue(issue_key="TEST-2", status="To Do")],
+        ),
+    ],
+    indirect=True,
+)
+def test_create_update_issues_updates_rollup(product, raw_jira_issues, jira_issues, db_session):
+    rebuild_issue_count_rollup(db_session=db_session)
+    change_set = create_update_issues(
+        issues=raw_jira_issues,
+        product=product,
+        severity="blocker",
+        jira_server="https://jira.com",
+        db_session=db_session,
+    )
+    assert list(change_set.inserted) == ["TEST-3"]
+    assert change_set.updated["TEST-1"][0]["status"] == "To Do"
+    assert change_set.updated["TEST-1"][1]["status"] == "Verified"
+    assert change_set.obsoleted == {
+        "TEST-2": {
+            "title": "Test Summary",
+            "status": "To Do",
+            "issue_type": "bug",
+            "customer_escaped": False,
+            "last_updated": date(2024, 5, 30),
+        }
+    }
+    assert rollup_counts(db_session=db_session) == {
+        (product.id, "blocker", "Verified", "bug", False): 1,
+        (product.id, "blocker", "To Do", "bug", False): 1,
+        (product.id, "blocker", "obsolete", "bug", False): 1,
+    }
+    assert rebuild_issue_count_rollup(db_session=db_session) == 0, "The incremental rollup must match a full recount."
+
+
+@pytest.mark.parametrize(
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("rollup-retention-product"),
+            [
+                rollup_issue(issue_key="TEST-1", status="To Do", last_updated=date(2023, 1, 1)),
+                rollup_issue(issue_key="TEST-2", status="To Do", last_updated=date.today()),
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_delete_old_issues_updates_rollup(product, jira_issues, db_session):
+    rebuild_issue_count_rollup(db_session=db_session)
+    assert delete_old_issues(days_old=180, db_session=db_session)
+    assert rollup_counts(db_session=db_session) == {(product.id, "blocker", "To Do", "bug", False): 1}
+
+
+@pytest.mark.parametrize(
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("rollup-rebuild-product"),
+            [rollup_issue(issue_key="TEST-1", status="To Do"), rollup_issue(issue_key="TEST-2", status="To Do")],
+        ),
+    ],
+    indirect=True,
+)
+def test_rebuild_issue_count_rollup(product, jira_issues, db_session):
+    assert rebuild_issue_count_rollup(db_session=db_session) == 1
+    db_session.execute(update(IssueCountRollupsEntity).values(issue_count=5))
+    assert rebuild_issue_count_rollup(db_session=db_session) == 1
+    assert rollup_counts(db_session=db_session) == count_issues(db_session, JiraIssuesEntity.product_id == product.id)
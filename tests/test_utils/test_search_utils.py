@@ -0,0 +1,185 @@
+from datetime import date
+
+import pytest
+from qe_metrics.libs.jira import JiraIssueRecord, SearchProbe
+from qe_metrics.utils.general import ClosableIterator
+from qe_metrics.utils.metrics_utils import METRICS
+from qe_metrics.utils.search_utils import (
+    is_conjunctive_query,
+    normalize_jql,
+    parse_local_clause,
+    probe_searches,
+    stream_searches,
+)
+
+UPDATED_CONDITION = ' AND updated > "-90d"'
+
+
+def issue_record(key, labels=(), priority="Major"):
+    return JiraIssueRecord(
+        key=key,
+        title="Test Summary",
+        project="TEST",
+        status="In Progress",
+        issue_type="bug",
+        customer_escaped=False,
+        date_created=date(2024, 1, 1),
+        last_updated=date(2024, 1, 2),
+        labels=labels,
+        priority=priority,
+    )
+
+
+ISSUES = [
+    issue_record(key="TEST-1", labels=("Critical",), priority="Blocker"),
+    issue_record(key="TEST-2", labels=("other",)),
+    issue_record(key="TEST-3", priority="Blocker"),
+]
+
+
+class FakeSearch(ClosableIterator[JiraIssueRecord]):
+    def __init__(self, issues):
+        self._issues = iter(issues)
+        self.closed = False
+
+    def __next__(self):
+        issue = next(self._issues)
+        if isinstance(issue, Exception):
+            raise issue
+        return issue
+
+    def close(self):
+        self.closed = True
+
+
+class FakeJira:
+    def __init__(self, issues=ISSUES):
+        self.issues = issues
+        self.searches = {}
+        self.probed_queries = []
+
+    def stream_search(self, query):
+        self.searches[query] = FakeSearch(issues=self.issues)
+        return self.searches[query]
+
+    def probe_searches(self, queries):
+        self.probed_queries.extend(queries)
+        return [SearchProbe(total=len(ISSUES), max_updated=None) for _ in queries]
+
+
+def test_normalize_jql():
+    assert normalize_jql(query="project = TEST  and\n(priority = Blocker OR labels = 'a  b')") == normalize_jql(
+        query="project = TEST AND ( priority = Blocker or labels = 'a  b' )"
+    )
+    assert normalize_jql(query="labels = 'a  b'") != normalize_jql(query="labels = 'a b'")
+    assert normalize_jql(query='summary ~ "a(b)"') != normalize_jql(query='summary ~ "a ( b )"'), (
+        "Parentheses in quoted strings must be left untouched."
+    )
+
+
+@pytest.mark.parametrize(
+    "query, conjunctive",
+    [
+        pytest.param("project = TEST and (priority = Blocker or priority = Major)", True),
+        pytest.param("project = TEST or project = OTHER", False),
+        pytest.param("project = TEST order by created", False),
+    ],
+)
+def test_is_conjunctive_query(query, conjunctive):
+    assert is_conjunctive_query(query=normalize_jql(query=query)) is conjunctive
+
+
+@pytest.mark.parametrize(
+    "clause, matching_keys",
+    [
+        pytest.param("labels = 'critical'", ["TEST-1"]),
+        pytest.param("labels in ( critical, other )", ["TEST-1", "TEST-2"]),
+        pytest.param('priority = "Blocker"', ["TEST-1", "TEST-3"]),
+        pytest.param("labels = empty", None),
+        pytest.param("priority = 1", None),
+        pytest.param("labels != critical", None),
+        pytest.param("labels in membersOf ( x )", None),
+        pytest.param("labels = critical or project = OTHER", None),
+    ],
+)
+def test_parse_local_clause(clause, matching_keys):
+    predicate = parse_local_clause(clause=normalize_jql(query=clause))
+    if matching_keys is None:
+        assert predicate is None
+    else:
+        assert [issue.key for issue in ISSUES if predicate(issue)] == matching_keys
+
+
+@pytest.mark.parametrize("local_subsets, jira_searches", [(False, 3), (True, 2)])
+def test_stream_searches(local_subsets, jira_searches):
+    queries = [
+        "project = TEST",
+        "project = TEST  AND labels = critical",
+        "project  =  TEST",
+        "project = OTHER",
+    ]
+    jira = FakeJira()
+    METRICS.clear()
+    streams = stream_searches(
+        jira=jira, queries=[(query, query + UPDATED_CONDITION) for query in queries], local_subsets=local_subsets
+    )
+    assert len(jira.searches) == jira_searches
+
+    issue_keys = []
+    for stream in streams:
+        with stream:
+            issue_keys.append([issue.key for issue in stream])
+    # The fake Jira returns all the issues, whatever the query
+    all_keys = [issue.key for issue in ISSUES]
+    assert issue_keys == [all_keys, ["TEST-1"] if local_subsets else all_keys, all_keys, all_keys]
+    assert all(search.closed for search in jira.searches.values()), "Every Jira search must be closed."
+    assert ({"reason": "duplicate"}, 1.0) in METRICS.snapshot()["qe_metrics_cached_searches_total"]
+    METRICS.clear()
+
+
+def test_stream_searches_consumer_write_fails():
+    jira = FakeJira()
+    first_stream, second_stream = stream_searches(
+        jira=jira, queries=[("project = TEST", "project = TEST"), ("project  =  TEST", "project  =  TEST")]
+    )
+    with pytest.raises(ValueError):
+        with first_stream:
+            next(first_stream)
+            raise ValueError("Database error")
+    assert not jira.searches["project = TEST"].closed, "A failed write must not stop the search of the other queries."
+
+    with second_stream:
+        assert [issue.key for issue in second_stream] == [issue.key for issue in ISSUES]
+    assert jira.searches["project = TEST"].closed
+
+
+def test_stream_searches_source_fails():
+    jira = FakeJira(issues=[ISSUES[0], RuntimeError("Jira error")])
+    first_stream, second_stream = stream_searches(
+        jira=jira, queries=[("project = TEST", "project = TEST"), ("project  =  TEST", "project  =  TEST")]
+    )
+    for stream in (first_stream, second_stream):
+        with stream:
+            assert next(stream).key == "TEST-1"
+            with pytest.raises(RuntimeError, match="Jira error"):
+                next(stream)
+
+
+def test_stream_searches_different_updated_conditions():
+    jira = FakeJira()
+    stream_searches(
+        jira=jira,
+        queries=[
+            ("project = TEST", 'project = TEST AND updated >= "-10m"'),
+            ("project = TEST AND labels = critical", 'project = TEST AND labels = critical AND updated >= "-20m"'),
+        ],
+        local_subsets=True,
+    )
+    assert len(jira.searches) == 2, "Queries with different updated conditions must not share issues."
+
+
+def test_probe_searches():
+    jira = FakeJira()
+    probes = probe_searches(jira=jira, queries=["project = TEST", "project  =  TEST", "project = OTHER"])
+    assert len(probes) == 3
+    assert jira.probed_queries == ["project = TEST", "project = OTHER"]
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import insert, select
+from qe_metrics.libs.database_mapping import IssueCountSnapshotsEntity
+from qe_metrics.utils.snapshot_utils import take_issue_count_snapshot
+
+SNAPSHOT_DATE = date(2024, 6, 1)
+
+
+def snapshot_issue(issue_key, status, customer_escaped=False):
+    return {
+        "issue_key": issue_key,
+        "title": "Test Issue",
+        "url": "https://jira.com",
+        "project": "TEST",
+        "severity": "blocker",
+        "status": status,
+        "issue_type": "bug",
+        "customer_escaped": customer_escaped,
+        "date_created": date(2024, 5, 1),
+        "last_updated": date(2024, 5, 30),
+    }
+
+
+@pytest.mark.parametrize(
+    "product, jira_issues",
+    [
+        pytest.param(
+            ("issue-count-snapshot-product"),
+            [
+                snapshot_issue(issue_key="TEST-1", status="To Do"),
+                snapshot_issue(issue_key="TEST-2", status="To Do"),
+                snapshot_issue(issue_key="TEST-3", status="To Do", customer_escaped=True),
+                snapshot_issue(issue_key="TEST-4", status="obsolete"),
+            ],
+        ),
+    ],
+    indirect=True,
+)
+def test_take_issue_count_snapshot(product, jira_issues, db_session):
+    db_session.execute(
+        insert(IssueCountSnapshotsEntity).values(
+            snapshot_date=SNAPSHOT_DATE - timedelta(days=10),
+            product_id=product.id,
+            severity="blocker",
+            status="To Do",
+            issue_type="bug",
+            customer_escaped=False,
+            issue_count=1,
+        )
+    )
+    assert take_issue_count_snapshot(snapshot_date=SNAPSHOT_DATE, retention_days=5, db_session=db_session)
+    # Taking the snapshot again the same day replaces it
+    assert take_issue_count_snapshot(snapshot_date=SNAPSHOT_DATE, retention_days=5, db_session=db_session)
+
+    snapshot = db_session.execute(
+        select(
+            IssueCountSnapshotsEntity.snapshot_date,
+            IssueCountSnapshotsEntity.status,
+            IssueCountSnapshotsEntity.customer_escaped,
+            IssueCountSnapshotsEntity.issue_count,
+        ).where(IssueCountSnapshotsEntity.product_id == product.id)
+    ).all()
+    assert sorted(snapshot) == [
+        (SNAPSHOT_DATE, "To Do", False, 2),
+        (SNAPSHOT_DATE, "To Do", True, 1),
+        (SNAPSHOT_DATE, "obsolete", False, 1),
+    ]
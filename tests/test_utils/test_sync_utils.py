@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import pytest
+from qe_metrics.libs.database_mapping import SyncStateEntity
+from qe_metrics.libs.jira import SearchProbe
+from qe_metrics.utils.sync_utils import build_sync_query, get_sync_state, is_query_unchanged, save_sync_state
+
+QUERY = 'project = TEST AND updated > "-90d"'
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def test_build_sync_query_without_sync_state_is_full():
+    query, full_sync = build_sync_query(query=QUERY, sync_state=None, full_sync_interval=timedelta(days=7), now=NOW)
+    assert (query, full_sync) == (QUERY, True)
+
+
+def test_build_sync_query_is_incremental():
+    sync_state = SyncStateEntity(last_synced=NOW - timedelta(hours=1), last_full_sync=NOW - timedelta(days=1))
+    query, full_sync = build_sync_query(
+        query=QUERY, sync_state=sync_state, full_sync_interval=timedelta(days=7), now=NOW
+    )
+    assert (query, full_sync) == (f'{QUERY} AND updated >= "-65m"', False)
+
+
+def test_build_sync_query_full_sync_due():
+    sync_state = SyncStateEntity(last_synced=NOW - timedelta(hours=1), last_full_sync=NOW - timedelta(days=7))
+    query, full_sync = build_sync_query(
+        query=QUERY, sync_state=sync_state, full_sync_interval=timedelta(days=7), now=NOW
+    )
+    assert (query, full_sync) == (QUERY, True)
+
+
+@pytest.mark.parametrize(
+    "probe, last_full_sync, unchanged",
+    [
+        pytest.param(SearchProbe(total=3, max_updated="2024-06-01T10:00:00.000+0000"), NOW, True, id="unchanged"),
+        pytest.param(SearchProbe(total=4, max_updated="2024-06-01T10:00:00.000+0000"), NOW, False, id="new-issue"),
+        pytest.param(SearchProbe(total=3, max_updated="2024-06-01T11:00:00.000+0000"), NOW, False, id="updated-issue"),
+        pytest.param(None, NOW, False, id="probe-failed"),
+        pytest.param(
+            SearchProbe(total=3, max_updated="2024-06-01T10:00:00.000+0000"),
+            NOW - timedelta(days=7),
+            False,
+            id="full-sync-due",
+        ),
+    ],
+)
+def test_is_query_unchanged(probe, last_full_sync, unchanged):
+    sync_state = SyncStateEntity(
+        last_synced=NOW, last_full_sync=last_full_sync, issue_count=3, max_updated="2024-06-01T10:00:00.000+0000"
+    )
+    assert (
+        is_query_unchanged(sync_state=sync_state, probe=probe, full_sync_interval=timedelta(days=7), now=NOW)
+        is unchanged
+    )
+
+
+@pytest.mark.parametrize("product", [("save-sync-state-product")], indirect=True)
+def test_save_sync_state(product, db_session):
+    save_sync_state(
+        product=product, severity="blocker", query=QUERY, synced_at=NOW, full_sync=True, db_session=db_session
+    )
+    synced_at = NOW + timedelta(hours=1)
+    save_sync_state(
+        product=product, severity="blocker", query=QUERY, synced_at=synced_at, full_sync=False, db_session=db_session
+    )
+    sync_state = get_sync_state(product=product, severity="blocker", query=QUERY, db_session=db_session)
+    assert (sync_state.last_synced, sync_state.last_full_sync) == (synced_at, NOW)
+    assert not get_sync_state(product=product, severity="blocker", query="project = OTHER", db_session=db_session), (
+        "A changed query must not reuse the sync state of the previous query."
+    )
+
+
+@pytest.mark.parametrize("product", [("save-sync-state-probe-product")], indirect=True)
+def test_save_sync_state_stores_probe(product, db_session):
+    probe = SearchProbe(total=3, max_updated="2024-06-01T10:00:00.000+0000")
+    save_sync_state(
+        product=product,
+        severity="blocker",
+        query=QUERY,
+        synced_at=NOW,
+        full_sync=True,
+        db_session=db_session,
+        probe=probe,
+    )
+    sync_state = get_sync_state(product=product, severity="blocker", query=QUERY, db_session=db_session)
+    assert (sync_state.issue_count, sync_state.max_updated) == probe
@@ -0,0 +1,130 @@
+import pytest
+from qe_metrics.utils.throttle_utils import (
+    FAILURE,
+    SLOT_POLL_SECONDS,
+    SUCCESS,
+    THROTTLED,
+    JiraThrottle,
+    JiraUnavailableError,
+    get_request_outcome,
+    get_retry_delay,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    yield FakeClock()
+
+
+@pytest.fixture
+def throttle(clock):
+    yield JiraThrottle(
+        max_concurrency=4, rate=100, burst=100, failure_threshold=2, open_seconds=10, max_open_seconds=15, clock=clock
+    )
+
+
+def test_get_retry_delay_honours_retry_after():
+    assert get_retry_delay(retry_after="7", attempt=0) == 7
+
+
+def test_get_retry_delay_backs_off_exponentially_with_jitter():
+    for attempt, backoff in enumerate([1, 2, 4, 8]):
+        assert backoff / 2 <= get_retry_delay(retry_after=None, attempt=attempt) <= backoff
+
+
+@pytest.mark.parametrize(
+    "status, expected", [(200, SUCCESS), (400, SUCCESS), (429, THROTTLED), (503, FAILURE), (None, FAILURE)]
+)
+def test_get_request_outcome(status, expected):
+    assert get_request_outcome(status=status) == expected
+
+
+def acquire_now(throttle):
+    delay, slot = throttle.try_acquire()
+    assert delay == 0 and slot, f"A slot must be available, got a delay of {delay} seconds"
+    return slot
+
+
+def test_throttle_rate_limit(clock):
+    throttle = JiraThrottle(max_concurrency=10, rate=2, burst=2, clock=clock)
+    assert [throttle.try_acquire()[0] for _ in range(3)] == [0, 0, 0.5]
+    clock.now = 0.5
+    acquire_now(throttle=throttle)
+
+
+def test_throttle_concurrency_limit_aimd(throttle, clock):
+    slots = [acquire_now(throttle=throttle) for _ in range(4)]
+    assert throttle.try_acquire() == (SLOT_POLL_SECONDS, None), "The concurrency limit must be reached"
+
+    throttle.release(slot=slots.pop(), outcome=THROTTLED, duration=0.1)
+    throttle.release(slot=slots.pop(), outcome=THROTTLED, duration=0.1)
+    assert throttle.limit == 2, "Throttled requests sent at the same limit must only halve it once"
+
+    clock.now = 2
+    throttle.release(slot=slots.pop(), outcome=SUCCESS, duration=20)
+    assert throttle.limit == 1, "Slow requests must decrease the limit"
+
+    throttle.release(slot=slots.pop(), outcome=SUCCESS, duration=0.1)
+    throttle.release(slot=acquire_now(throttle=throttle), outcome=SUCCESS, duration=0.1)
+    assert throttle.limit == 2.5, "Fast requests must increase the limit by one per round of requests"
+
+
+def test_throttle_pauses_for_retry_after(throttle, clock):
+    throttle.release(slot=acquire_now(throttle=throttle), outcome=THROTTLED, duration=0.1, retry_after=5)
+    assert throttle.try_acquire() == (5, None)
+    clock.now = 5
+    acquire_now(throttle=throttle)
+
+
+def test_throttle_circuit_breaker(throttle, clock):
+    for _ in range(2):
+        throttle.release(slot=acquire_now(throttle=throttle), outcome=FAILURE, duration=0.1)
+    assert throttle.circuit_open
+    assert throttle.try_acquire() == (10, None)
+
+    clock.now = 10
+    trial_slot = acquire_now(throttle=throttle)
+    assert trial_slot.trial, "A trial request must be sent once the circuit open period is over"
+    assert throttle.try_acquire()[1] is None, "Only one trial request must be sent"
+    throttle.release(slot=trial_slot, outcome=FAILURE, duration=0.1)
+    assert throttle.try_acquire() == (15, None), "The circuit must open again, for longer"
+
+    clock.now = 25
+    throttle.release(slot=acquire_now(throttle=throttle), outcome=SUCCESS, duration=0.1)
+    assert not throttle.circuit_open
+    assert not acquire_now(throttle=throttle).trial
+
+
+def test_throttle_circuit_breaker_ignores_stale_releases(throttle, clock):
+    stale_slot = acquire_now(throttle=throttle)
+    for _ in range(2):
+        throttle.release(slot=acquire_now(throttle=throttle), outcome=FAILURE, duration=0.1)
+    assert throttle.circuit_open
+
+    clock.now = 10
+    acquire_now(throttle=throttle)
+    throttle.release(slot=stale_slot, outcome=THROTTLED, duration=10)
+    assert throttle.try_acquire()[1] is None, "A request sent before the circuit opened must not allow a second trial"
+
+
+def test_throttle_acquire_gives_up(throttle, mocker):
+    mocker.patch("qe_metrics.utils.throttle_utils.MAX_WAIT_SECONDS", 1)
+    throttle.release(slot=acquire_now(throttle=throttle), outcome=THROTTLED, duration=0.1, retry_after=60)
+    with pytest.raises(JiraUnavailableError):
+        throttle.acquire()
+
+
+def test_throttle_from_config():
+    throttle = JiraThrottle.from_config(
+        jira_config={"rate_limit": {"requests_per_second": 5}, "circuit_breaker": {"failure_threshold": 3}},
+        max_concurrency=8,
+    )
+    assert (throttle.rate, throttle.burst, throttle.failure_threshold, throttle.limit) == (5, 5, 3, 8)